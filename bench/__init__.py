@@ -0,0 +1,2 @@
+# file: bench/__init__.py
+"""Benchmark del gioco contro i backend finti (vedi fakes/)."""
@@ -0,0 +1,110 @@
+# file: bench/facts.py
+"""
+Microbenchmark della Knowledge Base (MemoryManager.add_fact + core/fact_store.py)
+contro il vecchio controllo `fact not in knowledge_base`, con 10k+ fatti.
+
+    python -m bench.facts [--sizes 10000 50000] [--restated 0.2]
+"""
+import argparse
+import contextlib
+import io
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.fact_store import FactStore
+from core.memory_manager import MemoryManager
+
+NAMES = ["Luna", "Maria", "Stella", "Il professore", "La preside", "Giulia", "Il bibliotecario", "Sara"]
+VERBS = ["nasconde", "ha trovato", "ha perso", "custodisce", "ha rubato", "ha regalato", "cerca", "ha dimenticato"]
+THINGS = ["la chiave rossa", "un diario segreto", "la lettera sigillata", "un anello d'argento",
+          "la mappa del sotterraneo", "un vecchio medaglione", "il registro di classe", "una foto strappata"]
+PLACES = ["in biblioteca", "nella palestra", "sotto il palco", "nel giardino", "in aula magna",
+          "nella torre", "al molo", "nello spogliatoio"]
+
+
+class _State:
+    """StateManager minimo: solo current_state, record() e touch() (journal e versioni qui non servono)."""
+
+    def __init__(self):
+        self.current_state = {"meta": {"turn_count": 1}, "game": {}, "knowledge_base": [], "fact_meta": []}
+
+    def record(self, entry):
+        pass
+
+    def touch(self, section, keys=()):
+        pass
+
+
+def make_facts(count: int, seed: int = 7):
+    """Fatti distinti: frasi dello stesso stampo con un dettaglio proprio (parole inventate)."""
+    rng = random.Random(seed)
+    syllables = ["ra", "lo", "mi", "te", "sa", "vo", "be", "qu", "dr", "pe", "zo", "fu"]
+
+    def word():
+        return "".join(rng.choice(syllables) for _ in range(3))
+
+    return [f"{rng.choice(NAMES)} {rng.choice(VERBS)} {rng.choice(THINGS)} {rng.choice(PLACES)} "
+            f"con {word()}, {word()} e {word()}" for _ in range(count)]
+
+
+def restate(fact: str, rng: random.Random) -> str:
+    """Riformulazione tipica dell'LLM: maiuscole, punteggiatura, un articolo in più o in meno."""
+    variants = [fact.upper(), fact + ".", fact.replace(" la ", " quella ", 1), "Ora " + fact]
+    return rng.choice(variants)
+
+
+def legacy_add(knowledge_base, fact):
+    if fact not in knowledge_base:
+        knowledge_base.append(fact)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark della Knowledge Base")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[10000, 20000])
+    parser.add_argument("--restated", type=float, default=0.2, help="Quota di fatti ripetuti/riformulati")
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    print(f"{'fatti':>8}{'legacy us/fatto':>18}{'store us/fatto':>17}{'find us':>10}"
+          f"{'legacy KB':>11}{'store KB':>10}")
+    for size in args.sizes:
+        facts = make_facts(size)
+        stream = []
+        for fact in facts:
+            stream.append(fact)
+            if rng.random() < args.restated:
+                stream.append(restate(rng.choice(stream), rng))
+
+        knowledge_base = []
+        start = time.perf_counter()
+        for fact in stream:
+            legacy_add(knowledge_base, fact)
+        legacy = (time.perf_counter() - start) / len(stream) * 1e6
+
+        state = _State()
+        memory = MemoryManager(state, llm_client=None)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for fact in stream:
+                memory.add_fact(fact)
+        store = (time.perf_counter() - start) / len(stream) * 1e6
+
+        index = FactStore()
+        for fact in state.current_state["knowledge_base"]:
+            index.add(fact)
+        probes = [restate(rng.choice(facts), rng) for _ in range(1000)]
+        start = time.perf_counter()
+        for probe in probes:
+            index.find(probe)
+        find = (time.perf_counter() - start) / len(probes) * 1e6
+
+        print(f"{size:>8}{legacy:>18.1f}{store:>17.1f}{find:>10.1f}"
+              f"{len(knowledge_base):>11}{len(state.current_state['knowledge_base']):>10}")
+
+
+if __name__ == "__main__":
+    main()
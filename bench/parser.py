@@ -0,0 +1,97 @@
+# file: bench/parser.py
+"""
+Microbenchmark del parser delle risposte LLM (media/response_parser.py)
+contro il vecchio parser a regex greedy, su risposte grandi.
+
+    python -m bench.parser [--repeat 20]
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from media.response_parser import ResponseParser, parse_response
+
+CHUNK = 24  # Dimensione tipica di un chunk in streaming
+
+
+def legacy_parse(raw_text: str) -> dict:
+    """Il vecchio LLMClient._parse_output (regex greedy + retry con "}"), come riferimento."""
+    result = {"text": raw_text, "visual_en": "", "tags_en": [], "updates": {}}
+    raw_text = raw_text.strip()
+    json_match = re.search(r"\{.*\}", raw_text, re.DOTALL)
+    if json_match:
+        json_str = json_match.group(0)
+        result["text"] = raw_text.replace(json_str, "").replace("```json", "").replace("```", "").strip()
+        for candidate in (json_str, json_str + "}"):
+            try:
+                data = json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+            result["visual_en"] = data.get("visual_en", "")
+            result["tags_en"] = data.get("tags_en", [])
+            result["updates"] = data.get("updates", {})
+            break
+    return result
+
+
+def make_reply(narration_chars: int, facts: int, braces: bool = False) -> str:
+    sentence = "Luna ti guarda {sorride} e si avvicina lentamente. " if braces else \
+        "Luna ti guarda e si avvicina lentamente alla finestra. "
+    narration = (sentence * (narration_chars // len(sentence) + 1))[:narration_chars]
+    payload = {
+        "visual_en": "Cinematic shot of Luna near the window, medium shot",
+        "tags_en": ["8k", "photorealistic", "upper body", "cinematic lighting", "indoors"],
+        "updates": {
+            "location": "Library",
+            "affinity_change": {"Luna": 1},
+            "flags": {f"flag_{i}": f"valore {{ {i} }}" for i in range(facts)},
+        },
+    }
+    return f"{narration}\n```json\n{json.dumps(payload, ensure_ascii=False, indent=2)}\n```"
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def streamed(reply: str):
+    parser = ResponseParser(lambda piece: None)
+    for i in range(0, len(reply), CHUNK):
+        parser.feed(reply[i:i + CHUNK])
+    return parser.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark del parser delle risposte")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    cases = {
+        "tipica (2 KB)": make_reply(1500, 5),
+        "lunga (50 KB)": make_reply(40000, 200),
+        "enorme (500 KB)": make_reply(400000, 2000),
+        "graffe in narrazione (50 KB)": make_reply(40000, 200, braces=True),
+        "troncata (50 KB)": make_reply(40000, 200)[:-400],
+        "graffe senza JSON (20 KB)": "Lei disegna { " * 1500,
+    }
+
+    print(f"{'caso':<30}{'bytes':>9}{'regex':>11}{'nuovo':>11}{'stream':>11}  (ms, migliore su {args.repeat})")
+    for name, reply in cases.items():
+        legacy = timed(lambda: legacy_parse(reply), args.repeat)
+        new = timed(lambda: parse_response(reply), args.repeat)
+        stream = timed(lambda: streamed(reply), args.repeat)
+        print(f"{name:<30}{len(reply.encode('utf-8')):>9}{legacy:>11.2f}{new:>11.2f}{stream:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# file: bench/story_log.py
+"""
+Microbenchmark dello Story Log (ui/components/story_view.py): costo di un turno
+(record del giocatore + narrazione in streaming) man mano che la sessione cresce.
+Con la vista virtualizzata il costo deve restare piatto.
+
+    QT_QPA_PLATFORM=offscreen python -m bench.story_log [--turns 2000] [--chunks 40]
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtWidgets import QApplication
+
+from ui.components.story_view import StoryView
+
+CHUNK = "Luna ti guarda e si avvicina lentamente alla finestra, poi sorride. "
+
+
+def play_turn(view: StoryView, app: QApplication, turn: int, chunks: int):
+    view.append_text(f"> **YOU**: azione numero {turn}\n", "player")
+    view.append_text("\n**LUNA**: ")
+    for _ in range(chunks):
+        view.stream_text(CHUNK)
+        app.processEvents()  # Come il loop Qt tra un chunk e l'altro
+    view.stream_text("\n")
+    app.processEvents()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark dello Story Log")
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--chunks", type=int, default=40, help="Chunk di streaming per turno")
+    parser.add_argument("--every", type=int, default=250, help="Riga di report ogni N turni")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication([])
+    view = StoryView()
+    view.resize(700, 900)
+    view.show()
+
+    print(f"{'turni':>8}{'ms/turno':>12}")
+    started = time.perf_counter()
+    for turn in range(1, args.turns + 1):
+        play_turn(view, app, turn, args.chunks)
+        if turn % args.every == 0:
+            elapsed = time.perf_counter() - started
+            print(f"{turn:>8}{elapsed / args.every * 1000:>12.2f}")
+            started = time.perf_counter()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# file: bench/turn_latency.py
+"""
+Benchmark end-to-end della latenza di turno contro i backend finti (fakes/).
+
+Per ogni mondo in worlds/ gioca una sessione scriptata (intro + N turni):
+process_turn_llm ad ogni turno, process_image_generation e process_audio
+ogni K turni. Riporta p50/p95/p99 per fase (prompt_build, llm, parse,
+state_update, autosave, dispatch, sd, tts) e per il turno intero.
+
+    python -m bench.turn_latency --update-baseline    # sul commit di partenza
+    python -m bench.turn_latency                      # sulla modifica: confronta
+    python -m bench.turn_latency --worlds school_life --turns 300 --llm-latency 0.02
+
+I tempi assoluti dipendono dalla macchina, quindi la baseline non è versionata
+(bench/baselines/*.json è in .gitignore): va generata in locale, sulla stessa
+macchina e con la stessa configurazione della misura da confrontare.
+
+Exit code 1 se una fase peggiora oltre la tolleranza rispetto alla baseline, o se
+la baseline manca / ha una configurazione diversa (salvo --allow-missing-baseline).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)  # Il template del prompt e i mondi sono risolti relativi alla root
+
+from core.metrics import StageMetrics, TURN_STAGES
+from fakes import FakeBackends, FaultConfig
+
+BASELINE_FILE = ROOT / "bench" / "baselines" / "turn_latency.json"
+COMPARED_PERCENTILES = ["p50", "p95", "p99"]
+
+PLAYER_SCRIPT = [
+    "Mi guardo attorno con attenzione.",
+    "Le chiedo come sta oggi.",
+    "Mi avvicino e le prendo la mano.",
+    "Propongo di andare in un posto più tranquillo.",
+    "Le racconto cosa è successo ieri.",
+    "Apro la porta e controllo il corridoio.",
+    "Le chiedo cosa ne pensa degli altri.",
+    "Resto in silenzio e aspetto la sua reazione.",
+]
+
+
+def run_session(engine, world_id: str, turns: int, image_every: int, audio_every: int,
+                stream: bool = True) -> Dict[str, Dict[str, float]]:
+    """Gioca una sessione scriptata e ritorna il sommario delle fasi (ms)."""
+    metrics = StageMetrics.get_instance()
+    metrics.reset()
+
+    engine.start_new_game(world_id)
+    on_chunk = (lambda chunk: None) if stream else None
+    engine.process_turn_llm("", is_intro=True, on_chunk=on_chunk)
+
+    for turn in range(1, turns + 1):
+        started = time.perf_counter()
+        response = engine.process_turn_llm(PLAYER_SCRIPT[turn % len(PLAYER_SCRIPT)], on_chunk=on_chunk)
+        metrics.record("turn", time.perf_counter() - started)
+
+        if image_every and turn % image_every == 0:
+            image = engine.process_image_generation(response.get("visual_en", ""), response.get("tags_en", []))
+            if image and os.path.exists(image):
+                os.remove(image)  # Le immagini finte non servono: niente accumulo in storage/images
+        if audio_every and turn % audio_every == 0:
+            engine.process_audio(response.get("text", ""))
+
+    engine.state_manager.flush(timeout=30)
+    return metrics.summary()
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float, slack_ms: float) -> List[str]:
+    """Regressioni: percentile attuale > baseline * (1 + tolerance) + slack_ms."""
+    regressions = []
+    for world, stages in results.items():
+        for stage, current in stages.items():
+            base = baseline.get(world, {}).get(stage)
+            if not base:
+                continue
+            for pct in COMPARED_PERCENTILES:
+                limit = base[pct] * (1 + tolerance) + slack_ms
+                if current[pct] > limit:
+                    regressions.append(f"{world}/{stage} {pct}: {current[pct]:.2f}ms > {limit:.2f}ms "
+                                       f"(baseline {base[pct]:.2f}ms)")
+    return regressions
+
+
+def format_table(world: str, stages: Dict[str, Dict[str, float]]) -> str:
+    lines = [f"\n🌍 {world}", f"   {'stage':<14}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)"]
+    for stage in TURN_STAGES + ["turn"]:
+        row = stages.get(stage)
+        if row:
+            lines.append(f"   {stage:<14}{row['count']:>6}{row['p50']:>10.2f}{row['p95']:>10.2f}"
+                         f"{row['p99']:>10.2f}{row['max']:>10.2f}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark latenza di turno (backend finti)")
+    parser.add_argument("--worlds", nargs="*", help="Mondi da provare (default: tutti quelli in worlds/)")
+    parser.add_argument("--turns", type=int, default=300)
+    parser.add_argument("--image-every", type=int, default=5, help="Render SD ogni K turni (0 = mai)")
+    parser.add_argument("--audio-every", type=int, default=10, help="TTS ogni K turni (0 = mai)")
+    parser.add_argument("--no-stream", action="store_true", help="Usa generate_response invece dello streaming")
+    parser.add_argument("--structured", action="store_true", help="Risposte in modalità structured output (JSON)")
+    parser.add_argument("--backend", choices=["gemini", "openai"], default="gemini", help="Backend LLM finto")
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--sd-latency", type=float, default=0.0)
+    parser.add_argument("--tts-latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Errori 503 iniettati sull'LLM")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Peggioramento relativo ammesso")
+    parser.add_argument("--slack-ms", type=float, default=2.0, help="Peggioramento assoluto ammesso (ms)")
+    parser.add_argument("--baseline", default=str(BASELINE_FILE))
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--allow-missing-baseline", action="store_true",
+                        help="Baseline assente o con configurazione diversa: esce con 0 invece di fallire")
+    parser.add_argument("--output", help="Scrive anche i risultati completi in questo file JSON")
+    parser.add_argument("--verbose", action="store_true", help="Mostra i log del motore")
+    args = parser.parse_args(argv)
+
+    config = {
+        "turns": args.turns, "image_every": args.image_every, "audio_every": args.audio_every,
+        "stream": not args.no_stream, "structured": args.structured, "backend": args.backend, "llm_latency": args.llm_latency,
+        "sd_latency": args.sd_latency, "tts_latency": args.tts_latency, "failure_rate": args.failure_rate,
+    }
+
+    backends = FakeBackends(
+        gemini=FaultConfig(latency=args.llm_latency, failure_rate=args.failure_rate, seed=args.seed),
+        sd=FaultConfig(latency=args.sd_latency, seed=args.seed),
+        tts=FaultConfig(latency=args.tts_latency, seed=args.seed),
+        llm_backend=args.backend,
+    )
+    results: Dict[str, Dict] = {}
+
+    with backends, tempfile.TemporaryDirectory(prefix="luna_bench_") as saves_dir:
+        from core.engine import GameEngine
+
+        log = sys.stdout if args.verbose else io.StringIO()
+        with contextlib.redirect_stdout(log):
+            engine = GameEngine()
+            engine.state_manager.saves_path = Path(saves_dir)
+            engine.structured_output = args.structured
+            worlds = args.worlds or [w["id"] for w in engine.list_worlds()]
+
+        for world_id in worlds:
+            print(f"⏱️ {world_id}: {args.turns} turni...", flush=True)
+            with contextlib.redirect_stdout(log):
+                results[world_id] = run_session(engine, world_id, args.turns, args.image_every,
+                                                args.audio_every, stream=not args.no_stream)
+            if not args.verbose:
+                log.seek(0)
+                log.truncate()
+            print(format_table(world_id, results[world_id]))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+        print(f"\n💾 Baseline aggiornata: {baseline_path}")
+        return 0
+
+    skipped = 0 if args.allow_missing_baseline else 1
+    if not baseline_path.exists():
+        print(f"\n⚠️ Nessuna baseline in {baseline_path} (generala su questa macchina con --update-baseline)")
+        return skipped
+
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("config") != config:
+        print("\n⚠️ Configurazione diversa dalla baseline: confronto saltato.")
+        return skipped
+
+    regressions = compare(results, baseline.get("results", {}), args.tolerance, args.slack_ms)
+    if regressions:
+        print("\n❌ Regressioni rispetto alla baseline:")
+        for line in regressions:
+            print(f"   {line}")
+        return 1
+    print("\n✅ Nessuna regressione rispetto alla baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,7 +11,17 @@ class Settings:
         self.config = {
             "runpod_active": False,
             "runpod_url": "https://tuo-id-runpod.proxy.runpod.net",
-            "local_url": "http://127.0.0.1:7860"
+            "local_url": "http://127.0.0.1:7860",
+            "save_format": "json",  # "json" (leggibile) oppure "compact" (.lrs binario, caricamento pigro)
+            "context_cache": True,  # Prefisso statico del System Prompt nel context cache di Gemini
+            "context_token_budget": 16000,  # Budget (stimato) di token per richiesta LLM
+            "llm_deadline": 90.0,  # Secondi massimi per una risposta LLM (retry compresi)
+            "llm_retries": 2,  # Nuovi tentativi sugli errori transitori (429, 5xx, rete)
+            "llm_hedging": False,  # Richiesta di riserva se il primo token tarda oltre il p95 (costa una seconda chiamata)
+            "llm_backend": "gemini",  # "gemini" oppure "openai" (server locale OpenAI-compatibile, es. llama.cpp)
+            "openai_url": "http://127.0.0.1:8080/v1",
+            "openai_model": "local",
+            "llm_structured_output": False  # Risposta JSON vincolata a uno schema (decodifica unica, niente regex)
         }
         self.load()
 
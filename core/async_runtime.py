@@ -0,0 +1,57 @@
+# file: core/async_runtime.py
+import asyncio
+import threading
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from typing import Coroutine, Set
+
+
+class AsyncRuntime:
+    """
+    Event loop asyncio che gira in un thread dedicato, accanto al loop Qt.
+    La UI sottomette coroutine (turno LLM, immagine, audio, video) e riceve i
+    risultati tramite Signal: niente più un QThread per ogni richiesta.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.loop = asyncio.new_event_loop()
+        # Pool limitato per le librerie ancora bloccanti (requests, TTS, pygame)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="luna-io")
+        self.loop.set_default_executor(self.executor)
+
+        self._futures: Set[concurrent.futures.Future] = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="luna-asyncio", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Pianifica una coroutine sul loop (thread-safe). Ritorna un Future annullabile."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future: concurrent.futures.Future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def cancel_all(self):
+        """Annulla tutti i task ancora in volo."""
+        with self._lock:
+            pending = list(self._futures)
+        for future in pending:
+            future.cancel()
+
+    def shutdown(self, timeout: float = 5.0):
+        """Chiusura ordinata: annulla i task, ferma il loop e libera il pool."""
+        if not self.loop.is_running():
+            return
+        self.cancel_all()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,72 @@
+# file: core/chapters.py
+"""
+Riassunti gerarchici della memoria.
+
+Livello 0: i riassunti di summary_log (uno per compressione della history).
+Livello N: "capitoli" in state["chapters"], ciascuno il riassunto di ROLLUP_SIZE
+voci consecutive del livello N-1. Ogni voce copre un intervallo [start, end) di
+indici di summary_log e un intervallo di turni.
+
+Le voci non ancora assorbite da un capitolo di livello superiore formano la
+"frontiera": è la storia completa, e ha al più ROLLUP_SIZE - 1 voci per livello
+(O(log turni) in tutto) una volta che i roll-up sono al passo.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+Entry = Dict[str, Any]  # {"level", "start", "end", "turns": [primo, ultimo] | None, "text"}
+
+
+def summary_entry(summaries: Sequence[str], summary_turns: Sequence, index: int) -> Entry:
+    turns = summary_turns[index] if index < len(summary_turns) else None
+    return {"level": 0, "start": index, "end": index + 1, "turns": turns, "text": summaries[index]}
+
+
+def levels(summaries: Sequence[str], summary_turns: Sequence, chapters: Sequence[Entry],
+           from_index: int = 0) -> Dict[int, List[Entry]]:
+    """{livello: voci in ordine cronologico}; del livello 0 solo le voci da from_index in poi."""
+    result: Dict[int, List[Entry]] = {0: [summary_entry(summaries, summary_turns, i)
+                                          for i in range(from_index, len(summaries))]}
+    for chapter in chapters:
+        result.setdefault(chapter["level"], []).append(chapter)
+    return result
+
+
+def frontier(summaries: Sequence[str], summary_turns: Sequence, chapters: Sequence[Entry]) -> List[Entry]:
+    """Le voci non coperte da un livello superiore, in ordine cronologico (dal capitolo più ampio)."""
+    covered = max((c["end"] for c in chapters if c["level"] == 1), default=0)
+    by_level = levels(summaries, summary_turns, chapters, from_index=covered)
+    result: List[Entry] = []
+    covered = 0
+    for level in sorted(by_level, reverse=True):
+        entries = by_level[level]
+        result.extend(e for e in entries if e["start"] >= covered)
+        covered = max([covered] + [e["end"] for e in entries])
+    return result
+
+
+def next_rollup(summaries: Sequence[str], summary_turns: Sequence, chapters: Sequence[Entry],
+                size: int) -> Optional[List[Entry]]:
+    """Le `size` voci più vecchie del livello più basso che ne ha accumulate abbastanza, o None."""
+    open_entries: Dict[int, List[Entry]] = {}
+    for entry in frontier(summaries, summary_turns, chapters):
+        open_entries.setdefault(entry["level"], []).append(entry)
+    for level in sorted(open_entries):
+        if len(open_entries[level]) >= size:
+            return open_entries[level][:size]
+    return None
+
+
+def make_chapter(children: List[Entry], text: str) -> Entry:
+    first, last = children[0].get("turns"), children[-1].get("turns")
+    turns = [first[0], last[1]] if first and last else None
+    return {"level": children[0]["level"] + 1, "start": children[0]["start"],
+            "end": children[-1]["end"], "turns": turns, "text": text}
+
+
+def format_entry(entry: Entry) -> str:
+    """Testo della voce nel blocco memoria: i capitoli indicano l'intervallo di turni."""
+    if entry["level"] == 0:
+        return entry["text"]
+    turns = entry.get("turns")
+    span = f", turni {turns[0]}-{turns[1]}" if turns else ""
+    return f"[Capitolo L{entry['level']}{span}] {entry['text']}"
@@ -0,0 +1,85 @@
+# file: core/context_assembler.py
+from typing import Callable, Dict, List, Tuple
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima veloce e locale: ~4 caratteri per token (ordine di grandezza del tokenizer Gemini)."""
+    if not text:
+        return 0
+    return len(text) // 4 + 1
+
+
+class ContextAssembler:
+    """
+    Compone il contesto della richiesta LLM dentro un budget di token fisso.
+    Priorità:
+      1. System Prompt + input del giocatore (sempre).
+      2. Gli ultimi MIN_HISTORY messaggi (continuità della scena).
+      3. Blocco memoria (fatti + riassunti), fino a MEMORY_SHARE del budget restante.
+      4. History più vecchia, dal più recente all'indietro, finché c'è spazio.
+    """
+
+    def __init__(self, budget_tokens: int = 16000, min_history: int = 6, memory_share: float = 0.3):
+        self.budget_tokens = budget_tokens
+        self.MIN_HISTORY = min_history
+        self.MEMORY_SHARE = memory_share
+
+    def assemble(
+            self,
+            system_prompt: str,
+            history: List[Dict],
+            user_input: str,
+            memory_builder: Callable[[int], str]
+    ) -> Tuple[List[Dict], str, Dict[str, int]]:
+        """
+        memory_builder(max_tokens) deve restituire il blocco memoria entro quel budget.
+        Ritorna (history da inviare, blocco memoria, report del budget).
+        """
+        system_cost = estimate_tokens(system_prompt)
+        input_cost = estimate_tokens(user_input)
+        remaining = self.budget_tokens - system_cost - input_cost
+
+        costs = [estimate_tokens(m.get("content", "")) for m in history]
+
+        # 2. Coda recente obbligatoria
+        keep = min(self.MIN_HISTORY, len(history))
+        history_cost = sum(costs[len(history) - keep:])
+        remaining -= history_cost
+
+        # 3. Memoria (quota del budget restante)
+        memory_budget = max(0, int(remaining * self.MEMORY_SHARE))
+        memory_block = memory_builder(memory_budget)
+        memory_cost = estimate_tokens(memory_block)
+        remaining -= memory_cost
+
+        # 4. History più vecchia, finché entra
+        for cost in reversed(costs[:len(history) - keep]):
+            if cost > remaining:
+                break
+            remaining -= cost
+            history_cost += cost
+            keep += 1
+
+        selected = list(history[len(history) - keep:])
+        # La history deve iniziare con un messaggio del giocatore (alternanza user/model)
+        while len(selected) > 1 and selected[0].get("role") != "user":
+            history_cost -= estimate_tokens(selected.pop(0).get("content", ""))
+
+        report = {
+            "budget": self.budget_tokens,
+            "system": system_cost,
+            "memory": memory_cost,
+            "history": history_cost,
+            "input": input_cost,
+            "total": system_cost + memory_cost + history_cost + input_cost,
+            "history_messages": len(selected),
+            "history_dropped": len(history) - len(selected),
+        }
+        return selected, memory_block, report
+
+    @staticmethod
+    def format_report(report: Dict[str, int]) -> str:
+        return (f"📏 [CONTEXT] system {report['system']} | memory {report['memory']} | "
+                f"history {report['history']} ({report['history_messages']} msg, "
+                f"-{report['history_dropped']}) | input {report['input']} "
+                f"-> {report['total']}/{report['budget']} tok")
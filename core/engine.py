@@ -1,30 +1,60 @@
 # file: core/engine.py
-import os
 import json
-from typing import Dict, List
+import asyncio
+import time
+from typing import Dict, List, Tuple, Callable, Optional
 
 from core.world_loader import WorldLoader
 from core.state_manager import StateManager
 from core.memory_manager import MemoryManager
 from core.prompt_dispatcher import PromptDispatcher
+from core.prompt_template import PromptTemplate, SectionCache
+from core.context_assembler import ContextAssembler
+from core.metrics import StageMetrics
+from config.settings import Settings
 
-from media.llm_client import LLMClient
-from media.image_client import ImageClient
-from media.audio_client import AudioClient
+from media.registry import ClientRegistry
 
 
 class GameEngine:
+    # Campi del System Prompt che cambiano durante la partita (fuori dal context cache)
+    DYNAMIC_PROMPT_FIELDS = ["partner_personality", "npc_instructions", "time_of_day", "location",
+                             "current_outfit"]
+    # Sezioni dello stato da cui dipendono le variabili del System Prompt (vedi StateManager.versions)
+    PROMPT_STATE_SECTIONS = ("game", "npc_states", "affinity")
+
+    # Timeout (secondi) dei task asyncio
+    LLM_TIMEOUT = 120
+    IMAGE_TIMEOUT = 720  # RunPod può essere lento
+    AUDIO_TIMEOUT = 120
+    VIDEO_TIMEOUT = 1800
+
     def __init__(self):
         self.loader = WorldLoader()
         self.state_manager = StateManager()
-        self.llm = LLMClient()
-        self.imager = ImageClient()
-        self.audio = AudioClient()
+        # Client condivisi a livello di processo (connessioni HTTP in pool)
+        self.clients = ClientRegistry.get_instance()
+        self.llm = self.clients.llm()
+        self.imager = self.clients.imager()
+        self.audio = self.clients.audio()
         self.memory = MemoryManager(self.state_manager, self.llm)
+        self.context = ContextAssembler(
+            budget_tokens=Settings.get_instance().config.get("context_token_budget", 16000)
+        )
+        self.last_context_report: Dict[str, int] = {}
+        # Risposta come oggetto JSON vincolato a uno schema invece di narrazione + blocco ```json
+        self.structured_output = Settings.get_instance().config.get("llm_structured_output", False)
 
         self.world_data = {}
         self.session_active = False
 
+        # System Prompt: template compilato una volta + sezioni memoizzate
+        self.prompt_template = PromptTemplate("prompts/system_prompt.txt")
+        self.prompt_sections = SectionCache()
+
+        # Tempi per fase del turno (vedi bench/turn_latency.py)
+        self.metrics = StageMetrics.get_instance()
+
     def list_worlds(self):
         return self.loader.list_available_worlds()
 
@@ -55,10 +85,103 @@ class GameEngine:
             return True
         return False
 
-    def process_turn_llm(self, user_input: str, is_intro: bool = False) -> Dict:
+    def process_turn_llm(self, user_input: str, is_intro: bool = False,
+                         on_chunk: Optional[Callable[[str], None]] = None,
+                         on_image_prompt: Optional[Callable[[str, str], None]] = None) -> Dict:
+        """
+        Esegue un turno LLM. Se on_chunk è passato, la narrazione arriva in streaming
+        (chunk per chunk) mentre il JSON viene parsato a fine risposta.
+        Se on_image_prompt è passato il turno è "pipelined": il prompt SD (pos, neg)
+        viene consegnato appena JSON e stato sono aggiornati, prima di history e autosave,
+        così il render può partire mentre il resto del turno finisce.
+        """
+        if not self.session_active:
+            return {"text": "Error: No session.", "visual_en": "", "tags_en": []}
+
+        final_input, system_prompt, history, memory_block, prompt_parts = self._prepare_turn(user_input, is_intro)
+
+        try:
+            if on_chunk:
+                response_data = self.llm.generate_response_stream(
+                    user_input=final_input,
+                    system_instruction=system_prompt,
+                    history=history,
+                    memory_context=memory_block,
+                    on_chunk=on_chunk,
+                    prompt_parts=prompt_parts,
+                    structured=self.structured_output
+                )
+            else:
+                response_data = self.llm.generate_response(
+                    user_input=final_input,
+                    system_instruction=system_prompt,
+                    history=history,
+                    memory_context=memory_block,
+                    prompt_parts=prompt_parts,
+                    structured=self.structured_output
+                )
+        except Exception as e:
+            print(f"❌ Errore critico LLM: {e}")
+            return {"text": "La connessione neurale è instabile... (Errore Tecnico).", "visual_en": "", "tags_en": []}
+
+        if not self._is_valid_response(response_data):
+            return response_data if response_data else {"text": "Risposta vuota dall'IA. Riprova.", "visual_en": "",
+                                                        "tags_en": []}
+
+        new_facts = self._apply_turn(response_data, on_image_prompt)
+        self._commit_turn(final_input, response_data, is_intro, new_facts)
+        return response_data
+
+    async def process_turn(self, user_input: str, is_intro: bool = False,
+                           on_chunk: Optional[Callable[[str], None]] = None,
+                           on_image_prompt: Optional[Callable[[str, str], None]] = None) -> Dict:
+        """
+        Versione asyncio di process_turn_llm (da eseguire su AsyncRuntime).
+        La chiamata LLM ha un timeout e il task è annullabile; memoria e autosave
+        girano sul pool di I/O per non bloccare il loop.
+        """
         if not self.session_active:
             return {"text": "Error: No session.", "visual_en": "", "tags_en": []}
 
+        final_input, system_prompt, history, memory_block, prompt_parts = await asyncio.to_thread(
+            self._prepare_turn, user_input, is_intro
+        )
+
+        try:
+            response_data = await asyncio.wait_for(
+                self.llm.agenerate_response(
+                    user_input=final_input,
+                    system_instruction=system_prompt,
+                    history=history,
+                    memory_context=memory_block,
+                    on_chunk=on_chunk,
+                    prompt_parts=prompt_parts,
+                    structured=self.structured_output
+                ),
+                timeout=self.LLM_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            print(f"⏱️ Timeout LLM ({self.LLM_TIMEOUT}s)")
+            return {"text": "La connessione neurale è instabile... (Errore API: timeout)", "visual_en": "",
+                    "tags_en": []}
+        except Exception as e:
+            print(f"❌ Errore critico LLM: {e}")
+            return {"text": "La connessione neurale è instabile... (Errore Tecnico).", "visual_en": "", "tags_en": []}
+
+        if not self._is_valid_response(response_data):
+            return response_data if response_data else {"text": "Risposta vuota dall'IA. Riprova.", "visual_en": "",
+                                                        "tags_en": []}
+
+        new_facts = self._apply_turn(response_data, on_image_prompt)
+        await asyncio.to_thread(self._commit_turn, final_input, response_data, is_intro, new_facts)
+        return response_data
+
+    def _prepare_turn(self, user_input: str, is_intro: bool) -> Tuple[str, str, List[Dict], str, Optional[Tuple[str, str]]]:
+        """
+        Memoria + System Prompt + Input finale.
+        Ritorna (input, system_prompt, history, memory_block, prompt_parts).
+        """
+        started = time.perf_counter()
         state = self.state_manager.current_state
 
         if not is_intro:
@@ -68,8 +191,7 @@ class GameEngine:
                 print(f"⚠️ Errore Memory Manager: {e}")
 
         system_prompt = self._build_system_prompt()
-        history = state.get("history", [])
-        memory_block = self.memory.get_context_block()
+        prompt_parts = self._build_prompt_parts()
 
         final_input = user_input
 
@@ -84,35 +206,73 @@ class GameEngine:
                 f"IMPORTANT: First write the short Narration in Italian, THEN provide the JSON."
             )
 
-        try:
-            response_data = self.llm.generate_response(
-                user_input=final_input,
-                system_instruction=system_prompt,
-                history=history,
-                memory_context=memory_block
-            )
-        except Exception as e:
-            print(f"❌ Errore critico LLM: {e}")
-            return {"text": "La connessione neurale è instabile... (Errore Tecnico).", "visual_en": "", "tags_en": []}
+        # Budget di token: history e memoria vengono tagliate per priorità
+        history, memory_block, report = self.context.assemble(
+            system_prompt, state.get("history", []), final_input,
+            memory_builder=lambda budget: self.memory.get_context_block(
+                max_tokens=budget, query="" if is_intro else user_input)
+        )
+        self.last_context_report = report
+        print(ContextAssembler.format_report(report))
 
+        self.metrics.record("prompt_build", time.perf_counter() - started)
+        return final_input, system_prompt, history, memory_block, prompt_parts
+
+    @staticmethod
+    def _is_valid_response(response_data: Dict) -> bool:
         if not response_data or "Errore API" in response_data.get("text", ""):
             print("⚠️ Turno annullato per preservare la storia.")
-            return response_data if response_data else {"text": "Risposta vuota dall'IA. Riprova.", "visual_en": "",
-                                                        "tags_en": []}
+            return False
+        return True
+
+    def _apply_turn(self, response_data: Dict,
+                    on_image_prompt: Optional[Callable[[str, str], None]] = None) -> List[str]:
+        """
+        Applica gli updates allo stato e, se richiesto, consegna subito il prompt SD.
+        Ritorna i fatti effettivamente aggiunti alla Knowledge Base (per il journal).
+        """
+        knowledge_base = self.state_manager.current_state.setdefault("knowledge_base", [])
+        facts_before = len(knowledge_base)
 
         if "updates" in response_data:
             updates = response_data["updates"]
-            self.state_manager.update_state(updates)
-            if "new_fact" in updates and updates["new_fact"]:
-                self.memory.add_fact(updates["new_fact"])
+            with self.metrics.stage("state_update"):
+                self.state_manager.update_state(updates)
+                if "new_fact" in updates and updates["new_fact"]:
+                    self.memory.add_fact(updates["new_fact"])
 
-        if not is_intro:
-            state["history"].append({"role": "user", "content": final_input})
+        # PIPELINE: il dispatch dipende solo da visual/tags + stato aggiornato (outfit!)
+        if on_image_prompt:
+            try:
+                pos, neg = self.build_image_prompt(
+                    response_data.get("visual_en", ""),
+                    response_data.get("tags_en", []),
+                    response_data.get("text", "")
+                )
+                on_image_prompt(pos, neg)
+            except Exception as e:
+                print(f"⚠️ Errore Dispatch Immagine: {e}")
 
-        state["history"].append({"role": "model", "content": response_data["text"]})
-        self.state_manager.save_game("autosave.json")
+        return self.state_manager.current_state["knowledge_base"][facts_before:]
 
-        return response_data
+    def _commit_turn(self, final_input: str, response_data: Dict, is_intro: bool, new_facts: List[str]):
+        """Registra il turno nella history e scrive l'autosave (delta nel journal)."""
+        state = self.state_manager.current_state
+        messages = []
+        if not is_intro:
+            messages.append({"role": "user", "content": final_input})
+        messages.append({"role": "model", "content": response_data["text"]})
+        state["history"].extend(messages)
+        self.state_manager.touch("history")
+
+        self.state_manager.record({
+            "op": "turn",
+            "messages": messages,
+            "updates": response_data.get("updates") or {},
+            "facts": new_facts
+        })
+        with self.metrics.stage("autosave"):
+            self.state_manager.save_journaled(self.state_manager.save_name("autosave"))
 
     def process_image_generation(self, visual_en: str, tags_en: List[str]) -> str:
         history = self.state_manager.current_state.get("history", [])
@@ -120,21 +280,57 @@ class GameEngine:
         if history and history[-1]["role"] == "model":
             last_narrative = history[-1]["content"]
 
-        pos, neg = PromptDispatcher.dispatch(
-            text_response=last_narrative,
-            visual_en=visual_en,
-            tags_en=tags_en,
-            game_state=self.state_manager.current_state,
-            world_data=self.world_data
-        )
-
+        pos, neg = self.build_image_prompt(visual_en, tags_en, last_narrative)
+        return self.render_image(pos, neg)
+
+    def build_image_prompt(self, visual_en: str, tags_en: List[str], narrative: str = "") -> Tuple[str, str]:
+        """Calcola il prompt SD (positivo, negativo) dallo stato corrente."""
+        with self.metrics.stage("dispatch"):
+            pos, neg = PromptDispatcher.dispatch(
+                text_response=narrative,
+                visual_en=visual_en,
+                tags_en=tags_en,
+                game_state=self.state_manager.current_state,
+                world_data=self.world_data
+            )
         print(f"\n🎨 [SD PROMPT FINAL]: {pos[:200]}...")
-        return self.imager.generate_image(pos, neg)
+        return pos, neg
+
+    def render_image(self, pos: str, neg: str) -> str:
+        """Invia un prompt già pronto a Stable Diffusion (chiamata bloccante)."""
+        with self.metrics.stage("sd"):
+            return self.imager.generate_image(pos, neg)
 
     def process_audio(self, text: str):
         if not text: return
         name = self.state_manager.current_state["game"].get("companion_name", "Narrator")
-        self.audio.play_voice(text, name)
+        with self.metrics.stage("tts"):
+            self.audio.play_voice(text, name)
+
+    async def process_image(self, pos: str, neg: str) -> str:
+        """Render SD come task asyncio (timeout + cancellazione)."""
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(self.render_image, pos, neg),
+                                          timeout=self.IMAGE_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"⏱️ Timeout SD ({self.IMAGE_TIMEOUT}s)")
+            return ""
+
+    async def process_audio_async(self, text: str):
+        try:
+            await asyncio.wait_for(asyncio.to_thread(self.process_audio, text), timeout=self.AUDIO_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"⏱️ Timeout TTS ({self.AUDIO_TIMEOUT}s)")
+
+    async def process_video(self, image_path: str, context: str) -> str:
+        """Animazione ComfyUI come task asyncio. Il VideoClient viene creato una sola volta (registry)."""
+        video = await asyncio.to_thread(self.clients.video)
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(video.generate_video, image_path, context),
+                                          timeout=self.VIDEO_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"⏱️ Timeout Video ({self.VIDEO_TIMEOUT}s)")
+            return ""
 
     def _get_affinity_personality(self, char_name: str, current_points: int) -> str:
         companions_db = self.world_data.get("companions", {})
@@ -151,35 +347,80 @@ class GameEngine:
 
     # --- MODIFICA CHIAVE QUI SOTTO ---
     def _build_system_prompt(self) -> str:
+        """
+        Compone il System Prompt per sezioni. Le sezioni statiche (lore, plot points)
+        dipendono solo dal mondo; quelle dinamiche (affinità, outfit NPC) vengono
+        ricostruite solo quando i loro input cambiano.
+        """
+        prompt_vars = self._prompt_vars()
+
+        if not self.prompt_template.exists():
+            return f"You are a Game Master. Context: {prompt_vars}"
+
+        try:
+            return self.prompt_template.render(prompt_vars)
+        except Exception as e:
+            print(f"❌ Error formatting prompt: {e}")
+            return "System Error: Prompt generation failed."
+
+    def _build_prompt_parts(self) -> Optional[Tuple[str, str]]:
+        """(prefisso statico, stato dinamico) per il context cache dell'LLM."""
+        if not self.prompt_template.exists():
+            return None
+        try:
+            return self.prompt_template.render_split(self._prompt_vars(), self.DYNAMIC_PROMPT_FIELDS)
+        except Exception as e:
+            print(f"❌ Error formatting prompt: {e}")
+            return None
+
+    def _prompt_vars(self) -> Dict[str, str]:
+        """Variabili del prompt, ricostruite solo se il mondo o le sezioni di stato da cui dipendono cambiano."""
+        key = (id(self.world_data), self.state_manager.versions(*self.PROMPT_STATE_SECTIONS))
+        return self.prompt_sections.get("prompt_vars", key, self._build_prompt_vars)
+
+    def _build_prompt_vars(self) -> Dict[str, str]:
         meta = self.world_data.get("meta", {})
         game = self.state_manager.current_state.get("game", {})
+        world_key = (id(self.world_data), meta.get("id"))
+        sections = self.prompt_sections
 
         char_name = game.get('companion_name')
-        current_aff = game.get("affinity", {}).get(char_name, 0)
-        partner_personality = self._get_affinity_personality(char_name, current_aff)
-
-        all_companions = list(self.world_data.get("companions", {}).keys())
-        other_chars = [c for c in all_companions if c != char_name]
+        affinity = game.get("affinity", {})
+        current_aff = affinity.get(char_name, 0)
+
+        # --- SEZIONI STATICHE (per mondo) ---
+        def build_events():
+            key_events = meta.get("story_structure", {}).get("key_events", [])
+            events_str = "POSSIBLE PLOT POINTS:\n"
+            for e in key_events: events_str += f"- [KEY] {e}\n"
+            return events_str
+
+        events_str = sections.get("events_str", world_key, build_events)
+
+        # --- SEZIONI DINAMICHE ---
+        partner_personality = sections.get(
+            "partner_personality", (world_key, char_name, current_aff),
+            lambda: self._get_affinity_personality(char_name, current_aff)
+        )
 
         # COSTRUZIONE STATO NPC (Include Outfit!)
-        npc_instructions = ""
-        for npc in other_chars:
-            npc_aff = game.get("affinity", {}).get(npc, 0)
-            npc_pers = self._get_affinity_personality(npc, npc_aff)
-
-            # Recupera Outfit dallo stato NPC
-            npc_outfit = "Default"
-            if "npc_states" in game and npc in game["npc_states"]:
-                npc_outfit = game["npc_states"][npc].get("current_outfit", "Default")
+        npc_states = game.get("npc_states", {})
+        other_chars = [c for c in self.world_data.get("companions", {}) if c != char_name]
+        npc_key = tuple(
+            (npc, affinity.get(npc, 0), npc_states.get(npc, {}).get("current_outfit", "Default"))
+            for npc in other_chars
+        )
 
-            npc_instructions += f"- {npc}: {npc_pers} [CURRENT OUTFIT: {npc_outfit}]\n"
+        def build_npcs():
+            npc_instructions = ""
+            for npc, npc_aff, npc_outfit in npc_key:
+                npc_pers = self._get_affinity_personality(npc, npc_aff)
+                npc_instructions += f"- {npc}: {npc_pers} [CURRENT OUTFIT: {npc_outfit}]\n"
+            return npc_instructions
 
-        story_struct = meta.get("story_structure", {})
-        key_events = story_struct.get("key_events", [])
-        events_str = "POSSIBLE PLOT POINTS:\n"
-        for e in key_events: events_str += f"- [KEY] {e}\n"
+        npc_instructions = sections.get("npc_instructions", (world_key, npc_key), build_npcs)
 
-        prompt_vars = {
+        return {
             "genre": meta.get('genre', 'RPG'),
             "world_name": meta.get('name', 'Unknown World'),
             "world_lore": meta.get('world_lore', 'No lore available.'),
@@ -191,15 +432,3 @@ class GameEngine:
             "location": game.get('location', 'Unknown'),
             "current_outfit": game.get('current_outfit', 'default')
         }
-
-        prompt_path = "prompts/system_prompt.txt"
-        if not os.path.exists(prompt_path):
-            return f"You are a Game Master. Context: {prompt_vars}"
-
-        try:
-            with open(prompt_path, "r", encoding="utf-8") as f:
-                template = f.read()
-            return template.format(**prompt_vars)
-        except Exception as e:
-            print(f"❌ Error formatting prompt: {e}")
-            return "System Error: Prompt generation failed."
\ No newline at end of file
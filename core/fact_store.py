@@ -0,0 +1,145 @@
+# file: core/fact_store.py
+import hashlib
+import re
+import struct
+import unicodedata
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from core.retrieval import STOPWORDS
+
+_NOT_WORD = re.compile(r"[^\w\s]+", re.UNICODE)
+_SPACES = re.compile(r"\s+")
+
+NUM_HASHES = 32
+_HASHES = struct.Struct(f"<{NUM_HASHES}H")  # Un digest blake2b da 64 byte = 32 hash da 16 bit
+
+
+def normalize(text: str) -> str:
+    """Minuscole, senza accenti, punteggiatura e spazi ripetuti: 'È  arrivata!' -> 'e arrivata'."""
+    text = text.lower()
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return _SPACES.sub(" ", _NOT_WORD.sub(" ", text)).strip()
+
+
+_STOPWORDS = frozenset(normalize(w) for w in STOPWORDS)
+
+
+def dedup_terms(key: str) -> FrozenSet[str]:
+    """
+    Termini per il confronto tra fatti (da un testo già normalizzato): parole intere
+    e numeri. A differenza di core.retrieval.tokenize niente troncamento e niente
+    scarto dei numeri: "stanza 12"/"stanza 14" o "professore"/"professoressa"
+    sono fatti diversi, non riformulazioni.
+    """
+    return frozenset(w for w in key.split() if w.isdigit() or (len(w) > 2 and w not in _STOPWORDS))
+
+
+@lru_cache(maxsize=65536)
+def _term_hashes(term: str) -> Tuple[int, ...]:
+    # Deterministico (niente hash() randomizzato): le firme sono confrontabili tra sessioni
+    return _HASHES.unpack(hashlib.blake2b(term.encode("utf-8"), digest_size=64).digest())
+
+
+def minhash(terms: FrozenSet[str]) -> List[int]:
+    """Firma MinHash: per ciascuna delle NUM_HASHES funzioni, il minimo sui termini."""
+    return [min(column) for column in zip(*map(_term_hashes, terms))]
+
+
+class FactStore:
+    """
+    Indice dei fatti della Knowledge Base (i dati restano in state["knowledge_base"]):
+      - hash del testo normalizzato -> duplicati esatti in O(1);
+      - MinHash + LSH sulle parole intere (senza stopword, vedi dedup_terms) ->
+        riformulazioni dello stesso fatto, confermate con la similarità di Jaccard
+        >= THRESHOLD e solo se compaiono gli stessi numeri.
+    I fatti sono identificati dalla posizione in knowledge_base.
+    """
+
+    BANDS = 8  # 32 hash = 8 bande da 4 righe
+    THRESHOLD = 0.75
+    MIN_TERMS = 3  # Sotto questa soglia solo duplicati esatti: troppo pochi termini per giudicare
+
+    def __init__(self):
+        self._exact: Dict[str, int] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[int]] = {}
+        self._keys: List[str] = []
+        self._terms: List[FrozenSet[str]] = []
+        self._bands: List[List[Tuple[int, Tuple[int, ...]]]] = []
+        self._last: Optional[Tuple[str, str, FrozenSet[str], List[int]]] = None  # find() seguito da add()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def clear(self):
+        self._last = None
+        self._exact.clear()
+        self._buckets.clear()
+        self._keys.clear()
+        self._terms.clear()
+        self._bands.clear()
+
+    def add(self, text: str) -> int:
+        index = len(self._keys)
+        self._keys.append("")
+        self._terms.append(frozenset())
+        self._bands.append([])
+        self._index(index, text)
+        return index
+
+    def replace(self, index: int, text: str):
+        """Il fatto `index` è stato sostituito da una sua riformulazione."""
+        if self._exact.get(self._keys[index]) == index:
+            del self._exact[self._keys[index]]
+        for band in self._bands[index]:
+            self._buckets[band].discard(index)
+        self._index(index, text)
+
+    def _probe(self, text: str) -> Tuple[str, FrozenSet[str], List[Tuple[int, Tuple[int, ...]]]]:
+        """(chiave normalizzata, termini, bucket LSH) del testo; riusa il calcolo dell'ultimo find()."""
+        if self._last and self._last[0] == text:
+            return self._last[1:]
+        key = normalize(text)
+        terms = dedup_terms(key)
+        bands = []
+        if len(terms) >= self.MIN_TERMS:
+            signature = minhash(terms)
+            rows = NUM_HASHES // self.BANDS
+            bands = [(band, tuple(signature[band * rows:(band + 1) * rows])) for band in range(self.BANDS)]
+        self._last = (text, key, terms, bands)
+        return self._last[1:]
+
+    def _index(self, index: int, text: str):
+        key, terms, bands = self._probe(text)
+        self._keys[index] = key
+        self._terms[index] = terms
+        self._exact.setdefault(key, index)
+        for bucket in bands:
+            self._buckets.setdefault(bucket, set()).add(index)
+        self._bands[index] = bands
+
+    def find(self, text: str) -> Tuple[Optional[int], bool]:
+        """(indice del fatto equivalente, True se identico dopo la normalizzazione) oppure (None, False)."""
+        key, terms, bands = self._probe(text)
+        index = self._exact.get(key)
+        if index is not None:
+            return index, True
+
+        candidates: Set[int] = set()
+        for bucket in bands:
+            candidates |= self._buckets.get(bucket, set())
+
+        best, best_score = None, self.THRESHOLD
+        size = len(terms)
+        numbers = {t for t in terms if t.isdigit()}
+        for candidate in candidates:
+            other = self._terms[candidate]
+            if numbers != {t for t in other if t.isdigit()}:
+                continue  # Numeri diversi (stanza, chiave, turno...): fatti distinti
+            shared = len(terms & other)
+            score = shared / (size + len(other) - shared)  # Jaccard
+            # A parità di somiglianza vince il fatto più recente
+            if score > best_score or (score == best_score and (best is None or candidate > best)):
+                best, best_score = candidate, score
+        return best, False
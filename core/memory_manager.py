@@ -1,6 +1,12 @@
 # file: core/memory_manager.py
-from typing import List, Dict, Any
-import time
+from typing import List, Dict, Any, Optional, Tuple
+import re
+import threading
+
+from core import chapters
+from core.context_assembler import estimate_tokens
+from core.fact_store import FactStore
+from core.retrieval import BM25Index, tokenize
 
 
 class MemoryManager:
@@ -18,15 +24,65 @@ class MemoryManager:
         # Questo riduce drasticamente le interruzioni di gioco.
         self.HISTORY_LIMIT = 50
         self.PRUNE_COUNT = 20
+        # Soglia "soft": la compressione parte in anticipo, in background,
+        # così il risultato è pronto prima di arrivare a HISTORY_LIMIT.
+        # Oltre HISTORY_LIMIT si aspetta la compressione in corso (al massimo
+        # COMPRESS_WAIT secondi); se i riassunti continuano a fallire i messaggi più
+        # vecchi vengono archiviati così come sono in summary_log (vedi _enforce_limit).
+        self.SOFT_LIMIT = 40
+        self.COMPRESS_WAIT = 10.0
+
+        # --- RECUPERO PER RILEVANZA ---
+        # Per ogni richiesta solo i fatti/riassunti più pertinenti (input, luogo, personaggi)
+        # più pochi elementi "fissi" (i più recenti): il blocco memoria non cresce con la campagna.
+        self.TOP_K_FACTS = 8
+        self.TOP_K_SUMMARIES = 4
+        self.PINNED_FACTS = 3
+        self.PINNED_SUMMARIES = 1
+
+        # --- RIASSUNTI GERARCHICI ---
+        # Ogni ROLLUP_SIZE voci dello stesso livello diventano un capitolo del livello
+        # superiore (vedi core/chapters.py): la "storia finora" resta O(log turni).
+        self.ROLLUP_SIZE = 4
+
+        self._lock = threading.Lock()
+        self._job: Optional[threading.Thread] = None  # Compressione della history
+        self._rollup_thread: Optional[threading.Thread] = None  # Roll-up dei riassunti (slot proprio)
+        self._pending: Optional[Tuple[Dict, List[Dict], str, Optional[List[int]]]] = None
+        self._pending_chapter: Optional[Tuple[Dict, Dict]] = None
 
-    def get_context_block(self) -> str:
+        # Indici BM25 aggiornati in modo incrementale (add_fact, compressione)
+        # + indice dei duplicati/riformulazioni dei fatti
+        self.facts = FactStore()
+        self._fact_index = BM25Index()
+        self._summary_index = BM25Index()
+        self._indexed_state: Optional[Dict] = None
+
+    def get_context_block(self, max_tokens: Optional[int] = None, query: str = "") -> str:
         """
         Costruisce il blocco di testo da iniettare nel System Prompt.
-        Include: Fatti Chiave + Riassunti Passati.
+        Include: Fatti Chiave + Riassunti Passati, scelti per rilevanza rispetto a
+        query (input del giocatore), luogo attuale e personaggi presenti.
+        I riassunti sono la frontiera dei capitoli (vedi core/chapters.py) più i riassunti
+        di dettaglio pertinenti già assorbiti in un capitolo.
+        Con max_tokens il blocco resta nel budget: metà ai fatti e il resto ai riassunti.
         """
         state = self.state_manager.current_state
-        summaries = state.get("summary_log", [])
+        self._sync_index()
+
         facts = state.get("knowledge_base", [])
+        terms = self._query_terms(query)
+        fact_order = self._select(facts, self._fact_index, terms, self.TOP_K_FACTS, self.PINNED_FACTS)
+        fact_entries = [(i, facts[i]) for i in fact_order]
+        story_entries = self._story_entries(terms)
+
+        if max_tokens is None:
+            facts = [text for _, text in sorted(fact_entries)]
+            summaries = [text for _, text in sorted(story_entries)]
+        else:
+            facts = self._within_budget(fact_entries, max_tokens // 2)
+            used = sum(estimate_tokens(f"- {f}\n") for f in facts)
+            summaries = self._within_budget(story_entries, max_tokens - used)
 
         context_text = ""
 
@@ -46,54 +102,311 @@ class MemoryManager:
 
         return context_text
 
+    @staticmethod
+    def _select(items: List[str], index: BM25Index, terms: List[str], top_k: int, pinned: int) -> List[int]:
+        """
+        Indici in ordine di priorità: gli ultimi `pinned` elementi, poi i top_k più rilevanti.
+        Se gli elementi sono pochi li prende tutti (nessuna differenza nelle partite brevi).
+        """
+        if len(items) <= top_k + pinned:
+            return list(reversed(range(len(items))))
+        order = list(reversed(range(len(items) - pinned, len(items))))
+        chosen = set(order)
+        for doc, _ in index.search(terms, top_k, exclude=chosen):
+            order.append(doc)
+            chosen.add(doc)
+        # Query senza abbastanza riscontri: i posti liberi vanno ai più recenti
+        newest = len(items) - 1
+        while len(order) < top_k + pinned:
+            if newest not in chosen:
+                order.append(newest)
+            newest -= 1
+        return order
+
+    def _query_terms(self, query: str) -> List[str]:
+        """Input del giocatore + luogo + compagna + NPC nominati negli ultimi messaggi."""
+        state = self.state_manager.current_state
+        game = state.get("game", {})
+        recent = " ".join(m.get("content", "") for m in state.get("history", [])[-2:])
+        parts = [query, game.get("location", ""), game.get("companion_name", "")]
+        parts += [name for name in game.get("npc_states", {}) if name in recent or name in query]
+        return tokenize(" ".join(p for p in parts if p))
+
+    def _sync_index(self):
+        """
+        Porta gli indici allo stato attuale. Le liste crescono solo in coda: si indicizzano
+        i nuovi elementi; se la partita è cambiata (load/new game) gli indici si ricostruiscono.
+        """
+        state = self.state_manager.current_state
+        facts = state.get("knowledge_base", [])
+        summaries = state.get("summary_log", [])
+        if (state is not self._indexed_state or len(facts) < len(self._fact_index)
+                or len(summaries) < len(self._summary_index)):
+            self.facts.clear()
+            self._fact_index.clear()
+            self._summary_index.clear()
+            self._indexed_state = state
+        for fact in facts[len(self._fact_index):]:
+            self.facts.add(fact)
+            self._fact_index.add(fact)
+        for summary in summaries[len(self._summary_index):]:
+            self._summary_index.add(summary)
+
+    def _story_entries(self, terms: List[str]) -> List[Tuple[Tuple[int, int], str]]:
+        """
+        Voci della "storia finora" in ordine di priorità, come ((chiave cronologica), testo):
+        le ultime PINNED_SUMMARIES della frontiera, poi i TOP_K_SUMMARIES riassunti di
+        livello 0 più pertinenti tra quelli già dentro un capitolo (drill-down),
+        poi il resto della frontiera dal più recente.
+        """
+        state = self.state_manager.current_state
+        summaries = state.get("summary_log", [])
+        front = chapters.frontier(summaries, state.get("summary_turns", []), state.get("chapters", []))
+        front.reverse()
+
+        def key(entry: Dict) -> Tuple[int, int]:
+            return entry["start"], -entry["level"]  # Il capitolo prima dei suoi dettagli
+
+        order = [(key(e), chapters.format_entry(e)) for e in front[:self.PINNED_SUMMARIES]]
+        shown = {e["start"] for e in front if e["level"] == 0}
+        for doc, _ in self._summary_index.search(terms, self.TOP_K_SUMMARIES, exclude=shown):
+            order.append(((doc, 0), summaries[doc]))
+        order += [(key(e), chapters.format_entry(e)) for e in front[self.PINNED_SUMMARIES:]]
+        return order
+
+    @staticmethod
+    def _within_budget(entries: List[Tuple[Any, str]], max_tokens: int) -> List[str]:
+        """Le voci (chiave, testo) che entrano nel budget, prese in ordine di priorità e restituite in ordine di chiave."""
+        selected = []
+        for key, text in entries:
+            cost = estimate_tokens(f"- {text}\n")
+            if cost > max_tokens:
+                break
+            max_tokens -= cost
+            selected.append((key, text))
+        return [text for _, text in sorted(selected)]
+
     def manage_memory_drift(self):
         """
-        Controlla se la storia recente è troppo lunga e innesca la compressione.
+        Chiamata tra un turno e l'altro. Applica un eventuale riassunto già pronto
+        e, superata la soglia "soft", avvia la compressione in background:
+        il turno non aspetta mai la chiamata LLM di riassunto.
+        Se un livello ha accumulato ROLLUP_SIZE voci, le riassume in un capitolo del
+        livello superiore (sempre in background, senza bloccare la compressione).
         """
-        history = self.state_manager.current_state.get("history", [])
+        self._apply_pending()
 
+        history = self.state_manager.current_state.get("history", [])
         if len(history) > self.HISTORY_LIMIT:
-            print(f"🧠 [MEMORY] Buffer limit reached ({len(history)}/{self.HISTORY_LIMIT}). Starting compression...")
+            history = self._enforce_limit(history)
+        if len(history) > self.SOFT_LIMIT:
+            self._start_compression(history)
+        self._start_rollup()
+
+    def _start_compression(self, history: List[Dict]):
+        with self._lock:
+            if self._job and self._job.is_alive():
+                return
+
+            # Fotografia dei messaggi da archiviare: il thread non tocca mai lo stato
+            to_prune = list(history[:self.PRUNE_COUNT])
+            turns = self._pruned_turns(history, len(to_prune))
+            print(f"🧠 [MEMORY] Soft limit reached ({len(history)}/{self.HISTORY_LIMIT}). "
+                  f"Background compression started...")
+            self._job = threading.Thread(
+                target=self._compress_job,
+                args=(self.state_manager.current_state, to_prune, turns),
+                name="luna-memory",
+                daemon=True
+            )
+            self._job.start()
+
+    def _enforce_limit(self, history: List[Dict]) -> List[Dict]:
+        """
+        Limite rigido HISTORY_LIMIT: prima si aspetta (e si applica) la compressione in
+        corso; se non arriva un riassunto, i messaggi più vecchi finiscono in summary_log
+        come archivio testuale. Nessun messaggio viene perso.
+        """
+        job = self._job
+        if job and job.is_alive():
+            print(f"⏳ [MEMORY] History limit reached ({len(history)}/{self.HISTORY_LIMIT}): waiting for compression...")
+            job.join(self.COMPRESS_WAIT)
+        self._apply_pending()
+
+        current = self.state_manager.current_state
+        history = current.get("history", [])
+        if len(history) <= self.HISTORY_LIMIT:
+            return history
+
+        count = max(self.PRUNE_COUNT, len(history) - self.HISTORY_LIMIT)
+        to_prune = history[:count]
+        turns = self._pruned_turns(history, count)
+        self._archive(current, self._raw_archive(to_prune), count, turns)
+        print(f"⚠️ [MEMORY] No summary available: {count} messages archived verbatim.")
+        return current["history"]
+
+    @staticmethod
+    def _raw_archive(messages: List[Dict], max_chars: int = 200) -> str:
+        """Archivio senza LLM: i messaggi (senza blocchi JSON), accorciati a max_chars ciascuno."""
+        lines = []
+        for m in messages:
+            role = "Player" if m.get("role") == "user" else "Game Master"
+            content = re.sub(r"```json.*?```", "", m.get("content", ""), flags=re.DOTALL).strip()
+            if content:
+                lines.append(f"{role}: {content[:max_chars]}")
+        return "[Archivio senza riassunto] " + " | ".join(lines)
+
+    def _pruned_turns(self, history: List[Dict], count: int) -> Optional[List[int]]:
+        """
+        Intervallo di turni dei messaggi archiviati. La history non ha numeri di turno:
+        si stima dal contatore dei turni meno i turni (coppie di messaggi) che restano.
+        """
+        state = self.state_manager.current_state
+        turn_count = state.get("meta", {}).get("turn_count")
+        if turn_count is None:
+            return None
+        previous = state.get("summary_turns", [])
+        first = previous[-1][1] + 1 if previous and previous[-1] else 1
+        last = max(first, turn_count - (len(history) - count) // 2)
+        return [first, last]
+
+    def _compress_job(self, state: Dict, to_prune: List[Dict], turns: Optional[List[int]]):
+        try:
+            summary = self.llm.summarize_history(to_prune)
+        except Exception as e:
+            print(f"❌ [MEMORY] Error during compression: {e}")
+            return
+
+        if not summary:
+            print("⚠️ [MEMORY] Summary skipped (empty response).")
+            return
 
-            # Separa i messaggi da archiviare e quelli da tenere
-            to_prune = history[:self.PRUNE_COUNT]
-            remaining = history[self.PRUNE_COUNT:]
+        with self._lock:
+            self._pending = (state, to_prune, summary, turns)
 
-            try:
-                # Chiama la funzione di riassunto (assicurati che media/llm_client.py sia aggiornato)
-                summary = self.llm.summarize_history(to_prune)
+    def _apply_pending(self):
+        """Scambio atomico (tra due turni) di history/summary_log con il risultato del job."""
+        with self._lock:
+            pending, self._pending = self._pending, None
+            pending_chapter, self._pending_chapter = self._pending_chapter, None
+        if pending_chapter:
+            self._apply_chapter(*pending_chapter)
+        if not pending:
+            return
 
-                if summary:
-                    # Aggiorna lo stato
-                    if "summary_log" not in self.state_manager.current_state:
-                        self.state_manager.current_state["summary_log"] = []
+        state, to_prune, summary, turns = pending
+        current = self.state_manager.current_state
+        history = current.get("history", [])
+        count = len(to_prune)
 
-                    self.state_manager.current_state["summary_log"].append(summary)
-                    self.state_manager.current_state["history"] = remaining
+        # Partita cambiata (load/new game) o history già modificata: il riassunto non vale più
+        if state is not current or len(history) < count or \
+                any(a is not b for a, b in zip(history[:count], to_prune)):
+            print("⚠️ [MEMORY] Stale summary discarded.")
+            return
 
-                    print(f"✅ [MEMORY] Archived: {summary[:60]}...")
+        self._archive(current, summary, count, turns)
+        print(f"✅ [MEMORY] Archived: {summary[:60]}...")
 
-                    # Pausa di sicurezza (avviene molto di rado ora)
-                    print("⏳ [MEMORY] Saving changes (5s)...")
-                    time.sleep(5)
-                else:
-                    print("⚠️ [MEMORY] Summary skipped (empty response).")
+    def _archive(self, current: Dict, summary: str, count: int, turns: Optional[List[int]]):
+        """Sposta i primi `count` messaggi della history in summary_log (come `summary`)."""
+        if "summary_log" not in current:
+            current["summary_log"] = []
 
-            except Exception as e:
-                print(f"❌ [MEMORY] Error during compression: {e}")
+        # summary_turns è parallela a summary_log (i save vecchi ne sono privi)
+        summary_turns = current.setdefault("summary_turns", [])
+        summary_turns.extend([None] * (len(current["summary_log"]) - len(summary_turns)))
+        current["summary_log"].append(summary)
+        summary_turns.append(turns)
+        current["history"] = current.get("history", [])[count:]
+        self._sync_index()
+        self.state_manager.touch("summaries", [len(current["summary_log"]) - 1])
+        self.state_manager.touch("history")
+        self.state_manager.record({"op": "compress", "summary": summary, "pruned": count, "turns": turns})
+
+    # --- ROLL-UP DEI RIASSUNTI ---
+
+    def _start_rollup(self):
+        state = self.state_manager.current_state
+        children = chapters.next_rollup(state.get("summary_log", []), state.get("summary_turns", []),
+                                        state.get("chapters", []), self.ROLLUP_SIZE)
+        if not children:
+            return
+        with self._lock:
+            if self._rollup_thread and self._rollup_thread.is_alive():
+                return
+            if self._pending_chapter:
+                return  # Capitolo pronto ma non ancora applicato: il prossimo roll-up parte dopo
+            print(f"🧠 [MEMORY] Roll-up of {len(children)} level-{children[0]['level']} summaries started...")
+            self._rollup_thread = threading.Thread(
+                target=self._rollup_job,
+                args=(state, children),
+                name="luna-memory-rollup",
+                daemon=True
+            )
+            self._rollup_thread.start()
+
+    def _rollup_job(self, state: Dict, children: List[Dict]):
+        try:
+            text = self.llm.summarize_chapter([c["text"] for c in children])
+        except Exception as e:
+            print(f"❌ [MEMORY] Error during roll-up: {e}")
+            return
+
+        if not text:
+            print("⚠️ [MEMORY] Roll-up skipped (empty response).")
+            return
+
+        with self._lock:
+            self._pending_chapter = (state, chapters.make_chapter(children, text))
+
+    def _apply_chapter(self, state: Dict, chapter: Dict):
+        current = self.state_manager.current_state
+        existing = current.setdefault("chapters", [])
+        # Partita cambiata o voci già assorbite da un altro capitolo dello stesso livello
+        if state is not current or any(c["level"] == chapter["level"] and c["end"] > chapter["start"]
+                                       for c in existing):
+            print("⚠️ [MEMORY] Stale chapter discarded.")
+            return
+
+        existing.append(chapter)
+        self.state_manager.touch("summaries")
+        self.state_manager.record({"op": "rollup", "chapter": chapter})
+        print(f"✅ [MEMORY] Chapter L{chapter['level']} (turns {chapter['turns']}): {chapter['text'][:60]}...")
 
     def add_fact(self, fact_text: str):
         """
         Aggiunge un fatto permanente alla Knowledge Base.
-        Questa funzione mancava e causava il crash.
+        Un fatto già noto (anche con maiuscole/punteggiatura diverse) ne aggiorna solo
+        turno e contatore; una riformulazione (vedi core/fact_store.py) sostituisce il
+        testo del fatto originale invece di accodarne un secondo.
         """
         if not fact_text: return
 
         state = self.state_manager.current_state
-        if "knowledge_base" not in state:
-            state["knowledge_base"] = []
+        knowledge_base = state.setdefault("knowledge_base", [])
+        # fact_meta è parallela a knowledge_base: [primo turno, ultimo turno, volte in cui è stato detto]
+        fact_meta = state.setdefault("fact_meta", [])
+        fact_meta.extend([None] * (len(knowledge_base) - len(fact_meta)))
+        turn = state.get("meta", {}).get("turn_count", 0)
+        self._sync_index()
+
+        index, exact = self.facts.find(fact_text)
+        if index is None:
+            knowledge_base.append(fact_text)
+            fact_meta.append([turn, turn, 1])
+            self._sync_index()
+            self.state_manager.touch("facts", [len(knowledge_base) - 1])
+            print(f"🧠 [MEMORY] New Fact Learned: {fact_text}")
+            return
 
-        # Evita duplicati esatti
-        if fact_text not in state["knowledge_base"]:
-            state["knowledge_base"].append(fact_text)
-            print(f"🧠 [MEMORY] New Fact Learned: {fact_text}")
\ No newline at end of file
+        first, _, hits = fact_meta[index] or [turn, turn, 1]
+        fact_meta[index] = [first, turn, hits + 1]
+        if not exact:
+            print(f"🧠 [MEMORY] Fact restated: {knowledge_base[index]} -> {fact_text}")
+            knowledge_base[index] = fact_text
+            self.facts.replace(index, fact_text)
+            self._fact_index.replace(index, fact_text)
+        self.state_manager.touch("facts", [index])
+        self.state_manager.record({"op": "fact", "index": index, "text": knowledge_base[index],
+                                   "meta": fact_meta[index]})
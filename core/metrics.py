@@ -0,0 +1,86 @@
+# file: core/metrics.py
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List
+
+# Ordine delle fasi di un turno (per i report)
+TURN_STAGES = ["prompt_build", "llm", "parse", "state_update", "autosave", "dispatch", "sd", "tts"]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Percentile con interpolazione lineare su una lista già ordinata."""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    low, high = math.floor(rank), math.ceil(rank)
+    if low == high:
+        return sorted_values[low]
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+class StageMetrics:
+    """
+    Tempi (in secondi) delle fasi del turno, condivisi nel processo.
+    Costo trascurabile: due perf_counter() e un append per fase.
+    Ogni fase conserva solo gli ultimi MAX_SAMPLES campioni.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    MAX_SAMPLES = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+
+    @classmethod
+    def get_instance(cls) -> "StageMetrics":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.MAX_SAMPLES)
+            samples.append(seconds)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def samples(self, stage: str) -> List[float]:
+        with self._lock:
+            return list(self._samples.get(stage, ()))
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """{fase: {count, mean, p50, p95, p99, max}} in millisecondi."""
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self._samples.items()}
+        result = {}
+        for name, values in snapshot.items():
+            if not values:
+                continue
+            result[name] = {
+                "count": len(values),
+                "mean": round(sum(values) / len(values) * 1000, 3),
+                "p50": round(percentile(values, 50) * 1000, 3),
+                "p95": round(percentile(values, 95) * 1000, 3),
+                "p99": round(percentile(values, 99) * 1000, 3),
+                "max": round(values[-1] * 1000, 3),
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
@@ -0,0 +1,118 @@
+# file: core/prompt_template.py
+import os
+from pathlib import Path
+from string import Formatter
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class PromptTemplate:
+    """
+    Template del System Prompt (prompts/system_prompt.txt).
+    Il file viene letto e "compilato" (diviso in testo fisso + campi) una sola volta
+    e ricaricato solo quando cambia il suo mtime. Se i valori dei campi non cambiano
+    tra un turno e l'altro viene restituita direttamente l'ultima stringa generata.
+    I campi seguono le regole di str.format: attributi/indici ({a.b}, {a[0]}),
+    conversioni (!r, !s, !a) e format spec, anche annidate ({x:>{w}}).
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._mtime: Optional[float] = None
+        self._segments: List[Tuple[str, Optional[str], str, Optional[str]]] = []
+        self._formatter = Formatter()
+        self._last_values: Optional[Dict[str, Any]] = None
+        self._last_render = ""
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def _ensure_compiled(self):
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            source = f.read()
+        # Formatter.parse gestisce già gli escape {{ }} del template
+        self._segments = list(self._formatter.parse(source))
+        self._mtime = mtime
+        self._last_values = None
+        print(f"📝 [PROMPT] Template compiled: {self.path.name} ({len(self._segments)} segments)")
+
+    @property
+    def fields(self) -> List[str]:
+        self._ensure_compiled()
+        return [field for _, field, _, _ in self._segments if field]
+
+    def render(self, values: Dict[str, Any]) -> str:
+        """Equivalente a template.format(**values), senza ri-parsare il template."""
+        self._ensure_compiled()
+        if values == self._last_values:
+            return self._last_render
+
+        parts = []
+        for literal, field, spec, conversion in self._segments:
+            parts.append(literal)
+            if field is not None:
+                parts.append(self._format(field, spec, conversion, values))
+
+        self._last_values = dict(values)
+        self._last_render = "".join(parts)
+        return self._last_render
+
+    def render_split(self, values: Dict[str, Any], dynamic_fields: List[str]) -> Tuple[str, str]:
+        """
+        Divide il prompt in (prefisso statico, blocco di stato dinamico).
+        Nel prefisso i campi dinamici diventano riferimenti al blocco CURRENT STATE,
+        così il prefisso resta identico tra i turni e può stare nel context cache.
+        """
+        self._ensure_compiled()
+        dynamic = set(dynamic_fields)
+        formats: Dict[str, Tuple[str, Optional[str]]] = {}  # Campo dinamico -> (spec, conversione) nel template
+
+        parts = []
+        for literal, field, spec, conversion in self._segments:
+            parts.append(literal)
+            if field is None:
+                continue
+            if field in dynamic:
+                # Segnaposto senza spec: una spec numerica (es. :.2f) non si applica al testo
+                formats.setdefault(field, (spec, conversion))
+                parts.append(f"[{field}: see CURRENT STATE]")
+            else:
+                parts.append(self._format(field, spec, conversion, values))
+
+        state_block = "CURRENT STATE (values for the system instructions):\n"
+        for field in dynamic_fields:
+            spec, conversion = formats.get(field, ("", None))
+            state_block += f"### {field}\n{self._format(field, spec, conversion, values)}\n"
+        return "".join(parts), state_block
+
+    def _format(self, field: str, spec: str, conversion: Optional[str], values: Dict[str, Any]) -> str:
+        """Un campo come lo formatterebbe str.format(**values)."""
+        value, _ = self._formatter.get_field(field, (), values)
+        value = self._formatter.convert_field(value, conversion)
+        if "{" in spec:
+            spec = self._formatter.vformat(spec, (), values)  # Spec annidata, es. {x:>{width}}
+        return self._formatter.format_field(value, spec)
+
+
+class SectionCache:
+    """
+    Memoizza le sezioni del prompt: ogni sezione viene ricostruita solo se la sua
+    chiave (gli input da cui dipende) è cambiata rispetto al turno precedente.
+    """
+
+    def __init__(self):
+        self._cache: Dict[str, Tuple[Hashable, Any]] = {}
+
+    def get(self, name: str, key: Hashable, build: Callable[[], Any]) -> Any:
+        cached = self._cache.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        value = build()
+        self._cache[name] = (key, value)
+        return value
+
+    def clear(self):
+        self._cache.clear()
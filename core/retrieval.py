@@ -0,0 +1,98 @@
+# file: core/retrieval.py
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# Parole troppo frequenti per distinguere un fatto dall'altro (italiano + inglese)
+STOPWORDS = {
+    "che", "non", "per", "con", "una", "uno", "del", "della", "dello", "dei", "degli", "delle",
+    "nel", "nella", "nello", "nei", "negli", "nelle", "sul", "sulla", "sui", "sulle", "dal", "dalla",
+    "dai", "dalle", "alla", "allo", "alle", "agli", "gli", "sono", "suo", "sua", "suoi", "sue",
+    "lei", "lui", "loro", "anche", "come", "poi", "più", "già", "quando", "dove", "mentre", "questo",
+    "questa", "quello", "quella", "essere", "stato", "stata", "hanno", "aveva", "era", "molto",
+    "the", "and", "for", "with", "that", "this", "from", "was", "were", "has", "have", "his", "her",
+    "player", "giocatore",
+}
+STEM_LENGTH = 6  # Troncamento come stemmer povero: "ragazza"/"ragazze" -> "ragazz"
+
+
+def tokenize(text: str) -> List[str]:
+    """Parole minuscole, senza stopword e parole corte, troncate a STEM_LENGTH caratteri."""
+    return [w[:STEM_LENGTH] for w in _WORD.findall(text.lower())
+            if len(w) > 2 and w not in STOPWORDS and not w.isdigit()]
+
+
+class BM25Index:
+    """
+    Indice BM25 in memoria, aggiornato in modo incrementale (add) senza ricostruzioni.
+    I documenti sono identificati dalla posizione di inserimento (0, 1, 2...).
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = {}  # termine -> {doc: frequenza}
+        self._lengths: List[int] = []
+        self._terms: List[Counter] = []
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, text: str) -> int:
+        doc = len(self._lengths)
+        self._lengths.append(0)
+        self._terms.append(Counter())
+        self._index(doc, text)
+        return doc
+
+    def replace(self, doc: int, text: str):
+        """Sostituisce il testo del documento doc (es. un fatto riformulato)."""
+        for term in self._terms[doc]:
+            postings = self._postings[term]
+            del postings[doc]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths[doc]
+        self._index(doc, text)
+
+    def _index(self, doc: int, text: str):
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[doc] = tf
+        self._terms[doc] = terms
+        self._lengths[doc] = sum(terms.values())
+        self._total_length += self._lengths[doc]
+
+    def clear(self):
+        self._postings.clear()
+        self._lengths.clear()
+        self._terms.clear()
+        self._total_length = 0
+
+    def search(self, query: Iterable[str], k: int, exclude: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """
+        I k documenti con punteggio > 0 più rilevanti per i termini (già tokenizzati) della query.
+        A parità di punteggio vince il documento più recente.
+        """
+        if not self._lengths or k <= 0:
+            return []
+        n = len(self._lengths)
+        avg_length = self._total_length / n or 1.0
+        scores: Dict[int, float] = {}
+        for term, weight in Counter(query).items():
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[doc] / avg_length)
+                scores[doc] = scores.get(doc, 0.0) + weight * idf * tf * (self.k1 + 1) / norm
+        if exclude:
+            for doc in exclude:
+                scores.pop(doc, None)
+        ranked = sorted(scores.items(), key=lambda item: (item[1], item[0]), reverse=True)
+        return ranked[:k]
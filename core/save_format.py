@@ -0,0 +1,167 @@
+# file: core/save_format.py
+"""
+Formato di salvataggio compatto (.lrs).
+
+    MAGIC (4 byte) | lunghezza header (uint32 LE) | header zlib(JSON) | sezioni zlib(JSON)
+
+L'header contiene lo stato "giocabile" (meta, game, ...) e la tabella delle
+sezioni {nome: [offset, lunghezza, numero_elementi, ultimo_elemento]}. Le sezioni
+(history, summary_log, knowledge_base, fact_meta) restano compresse in memoria e vengono
+decodificate solo al primo accesso (LazySection). Caricamento, replay del journal e
+pannello di stato usano solo len(), l'ultimo elemento e le aggiunte in coda: le sezioni
+che crescono con la partita (summary_log, knowledge_base, fact_meta) si decodificano
+al primo prompt, quando MemoryManager costruisce i suoi indici. La history resta sotto
+HISTORY_LIMIT messaggi e viene decodificata subito dal log della storia.
+"""
+import copy
+import json
+import struct
+import zlib
+from collections import UserList
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+MAGIC = b"LRS1"
+SECTIONS = ("history", "summary_log", "knowledge_base", "fact_meta")
+_HEADER_LEN = struct.Struct("<I")
+
+
+class LazySection(UserList):
+    """
+    Lista decodificata al primo accesso: fino ad allora tiene solo il blob compresso.
+    Senza decodificare si possono leggere len() e l'ultimo elemento (copiato nella
+    tabella delle sezioni) e accodare elementi (replay del journal, nuovi turni).
+    """
+
+    _MISSING = object()
+
+    def __init__(self, blob: bytes, count: int, last: Any = _MISSING):
+        # Niente super().__init__: imposterebbe data = [] e perderemmo la pigrizia
+        self._blob: Optional[bytes] = blob
+        self._count = count
+        self._last = last
+        self._tail: List = []  # Elementi accodati prima della decodifica
+        self._data: Optional[List] = None
+
+    @property
+    def data(self) -> List:
+        if self._data is None:
+            self._data = json.loads(zlib.decompress(self._blob).decode("utf-8")) + self._tail
+            self._blob = None
+            self._tail = []
+        return self._data
+
+    @data.setter
+    def data(self, value: List):
+        self._data = list(value)
+        self._blob = None
+        self._tail = []
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    def raw_blob(self) -> Optional[bytes]:
+        """Blob compresso originale (solo se la sezione non è mai stata toccata)."""
+        return None if self._tail else self._blob
+
+    def __len__(self):
+        return self._count + len(self._tail) if self._data is None else len(self._data)
+
+    # UserList ricostruisce self.__class__ su slice/concatenazioni: restituiamo liste normali
+    def __getitem__(self, i):
+        if self._data is None and isinstance(i, int) and -len(self) <= i < 0:
+            if -i <= len(self._tail):
+                return self._tail[i]
+            if i == -1 and self._last is not self._MISSING:
+                return self._last
+        return self.data[i]
+
+    def append(self, item):
+        if self._data is None:
+            self._tail.append(item)
+        else:
+            self._data.append(item)
+
+    def extend(self, other):
+        if self._data is None:
+            self._tail.extend(other)
+        else:
+            self._data.extend(other)
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __add__(self, other):
+        return self.data + list(other)
+
+    def copy(self):
+        return list(self.data)
+
+    def __deepcopy__(self, memo):
+        if self._data is None:
+            # Blob immutabile: condivisibile
+            clone = LazySection(self._blob, self._count, copy.deepcopy(self._last, memo))
+            clone._tail = copy.deepcopy(self._tail, memo)
+            return clone
+        return json.loads(json.dumps(self._data))
+
+
+def json_default(obj: Any):
+    """Hook per json.dump: materializza le LazySection."""
+    if isinstance(obj, UserList):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _pack(value: Any) -> bytes:
+    raw = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=json_default)
+    return zlib.compress(raw.encode("utf-8"), 6)
+
+
+def encode_compact(state: Dict[str, Any]) -> bytes:
+    header = {k: v for k, v in state.items() if k not in SECTIONS}
+    table = {}
+    blobs = []
+    offset = 0
+    for name in SECTIONS:
+        section = state.get(name, [])
+        blob = section.raw_blob() if isinstance(section, LazySection) else None
+        if blob is None:
+            blob = _pack(list(section))
+        # L'ultimo elemento va anche in tabella: si legge senza decodificare la sezione
+        table[name] = [offset, len(blob), len(section)] + ([section[-1]] if len(section) else [])
+        blobs.append(blob)
+        offset += len(blob)
+
+    header["_sections"] = table
+    header_blob = _pack(header)
+    return MAGIC + _HEADER_LEN.pack(len(header_blob)) + header_blob + b"".join(blobs)
+
+
+def is_compact(path: Path) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def read_compact(path: Path) -> Dict[str, Any]:
+    """Carica header e sezioni; le sezioni restano compresse fino al primo accesso."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a compact save: {path}")
+        (header_len,) = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+        state = json.loads(zlib.decompress(f.read(header_len)).decode("utf-8"))
+        body = f.read()
+
+    table = state.pop("_sections", {})
+    for name in SECTIONS:
+        if name in table:
+            offset, length, count, *last = table[name]
+            state[name] = LazySection(body[offset:offset + length], count, *last)
+        else:
+            state[name] = []
+    return state
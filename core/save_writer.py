@@ -0,0 +1,128 @@
+# file: core/save_writer.py
+import json
+import os
+import threading
+import tempfile
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, List, Optional
+
+from core.save_format import json_default
+
+
+class SaveWriter:
+    """
+    Thread dedicato alla scrittura dei salvataggi.
+    - Il thread di gioco accoda e torna subito (mai I/O su disco nel turno).
+    - Più snapshot dello stesso file in coda vengono fusi: si scrive solo l'ultimo.
+    - Scrittura atomica: file temporaneo -> fsync -> rename (niente save troncati).
+    """
+
+    def __init__(self):
+        self._jobs: Deque[dict] = deque()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="luna-save-writer", daemon=True)
+        self._thread.start()
+
+    # --- API (thread di gioco) ---
+
+    def write_snapshot(self, path: Path, state: Any, reset_journal: Optional[Path] = None,
+                       encoder: Optional[Callable[[Any], bytes]] = None):
+        """
+        Accoda lo snapshot completo di 'state' (già copiato dal chiamante).
+        Gli snapshot e le righe di journal ancora in coda per lo stesso file vengono
+        scartati: il nuovo snapshot li contiene già.
+        'encoder' trasforma lo stato in bytes (default: JSON indentato).
+        """
+        job = {"kind": "snapshot", "path": Path(path), "state": state,
+               "reset_journal": reset_journal, "encoder": encoder or _encode_json}
+        with self._cond:
+            self._jobs = deque(j for j in self._jobs if not self._is_superseded(j, job))
+            self._jobs.append(job)
+            self._cond.notify()
+
+    def append_lines(self, path: Path, lines: List[str]):
+        """Accoda righe da aggiungere (in ordine) a un file di journal."""
+        with self._cond:
+            self._jobs.append({"kind": "append", "path": Path(path), "lines": lines})
+            self._cond.notify()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Attende che la coda sia vuota. Da chiamare prima di leggere un save o in uscita."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._jobs and not self._busy, timeout)
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Hook di uscita: scrive tutto ciò che è in coda e ferma il thread."""
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    # --- Thread di scrittura ---
+
+    @staticmethod
+    def _is_superseded(old: dict, new: dict) -> bool:
+        if old["kind"] == "snapshot":
+            return old["path"] == new["path"]
+        return new["reset_journal"] is not None and old["path"] == new["reset_journal"]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._jobs or self._closed)
+                if not self._jobs and self._closed:
+                    return
+                job = self._jobs.popleft()
+                self._busy = True
+            try:
+                if job["kind"] == "snapshot":
+                    self._write_snapshot(job)
+                else:
+                    self._append(job)
+            except Exception as e:
+                print(f"❌ Save Writer Error ({job['path'].name}): {e}")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    @staticmethod
+    def _write_snapshot(job: dict):
+        path = job["path"]
+        data = job["encoder"](job["state"])
+        atomic_write(path, data)
+        if job["reset_journal"] is not None:
+            atomic_write(job["reset_journal"], b"")
+
+    @staticmethod
+    def _append(job: dict):
+        with open(job["path"], "a", encoding="utf-8") as f:
+            f.writelines(job["lines"])
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _encode_json(state: Any) -> bytes:
+    return json.dumps(state, indent=2, ensure_ascii=False, default=json_default).encode("utf-8")
+
+
+def atomic_write(path: Path, data: bytes):
+    """Scrive su file temporaneo nella stessa cartella, fsync, poi rename atomico."""
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.remove(tmp_name)
+        except OSError:
+            pass
+        raise
@@ -1,9 +1,37 @@
 # file: core/state_manager.py
 import json
 import os
+import copy
 import time
+import atexit
+import threading
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
+
+from config.settings import Settings
+from core.save_format import encode_compact, is_compact, read_compact
+from core.save_writer import SaveWriter
+
+COMPACT_EXT = ".lrs"
+
+# Sezioni versionate dello stato (vedi StateManager.versions / subscribe)
+STATE_SECTIONS = ("game", "npc_states", "inventory", "affinity", "stats", "flags",
+                  "turn", "history", "facts", "summaries")
+GAME_FIELDS = ["location", "current_outfit", "gold", "hp", "time_of_day"]
+
+
+class StateChange:
+    """Evento di modifica: sezione, nuova versione e chiavi toccate (vuoto = tutta la sezione)."""
+
+    __slots__ = ("section", "version", "keys")
+
+    def __init__(self, section: str, version: int, keys: Tuple = ()):
+        self.section = section
+        self.version = version
+        self.keys = keys
+
+    def __repr__(self):
+        return f"StateChange({self.section!r}, {self.version}, {self.keys!r})"
 
 
 class StateManager:
@@ -18,6 +46,69 @@ class StateManager:
         self.saves_path.mkdir(parents=True, exist_ok=True)
         self.current_state: Dict[str, Any] = {}
 
+        # Thread di scrittura: salvataggi asincroni, atomici e fusi tra loro
+        self.writer = SaveWriter()
+        atexit.register(self.writer.close)
+
+        # --- JOURNAL (autosave incrementale) ---
+        # Ogni turno aggiunge una riga compatta a <file>.journal (es. autosave.json.journal);
+        # ogni JOURNAL_COMPACT_EVERY righe si riscrive lo snapshot completo.
+        self.JOURNAL_COMPACT_EVERY = 50
+        self._journal_pending: List[Dict] = []
+        self._journal_count = 0
+        self._journal_target: Optional[str] = None  # Snapshot su disco allineato allo stato corrente
+
+        # --- VERSIONI ---
+        # Ogni sezione ha una versione che cresce a ogni modifica (orologio unico e monotono,
+        # mai azzerato: anche una partita nuova o caricata ha versioni più alte della precedente).
+        self._clock = 0
+        self._versions: Dict[str, int] = {section: 0 for section in STATE_SECTIONS}
+        self._listeners: List[Tuple[Callable[[StateChange], None], Optional[frozenset]]] = []
+        self._version_lock = threading.Lock()
+
+    # --- VERSIONI E NOTIFICHE ---
+
+    def versions(self, *sections: str) -> Tuple[int, ...]:
+        """Versioni delle sezioni richieste: una chiave di memoizzazione per chi ne dipende."""
+        with self._version_lock:
+            return tuple(self._versions[section] for section in sections)
+
+    def subscribe(self, callback: Callable[[StateChange], None],
+                  sections: Optional[Iterable[str]] = None) -> Callable[[], None]:
+        """
+        callback(StateChange) a ogni modifica delle sezioni indicate (tutte se None).
+        Viene chiamata nel thread che modifica lo stato: la UI deve passare da un segnale.
+        Ritorna la funzione che annulla l'iscrizione.
+        """
+        entry = (callback, frozenset(sections) if sections is not None else None)
+        with self._version_lock:
+            self._listeners.append(entry)
+
+        def unsubscribe():
+            with self._version_lock:
+                if entry in self._listeners:
+                    self._listeners.remove(entry)
+
+        return unsubscribe
+
+    def touch(self, section: str, keys: Iterable = ()):
+        """Segna la sezione come modificata (nuova versione) e avvisa gli iscritti."""
+        with self._version_lock:
+            self._clock += 1
+            self._versions[section] = self._clock
+            change = StateChange(section, self._clock, tuple(keys))
+            listeners = [cb for cb, wanted in self._listeners if wanted is None or section in wanted]
+        for callback in listeners:
+            try:
+                callback(change)
+            except Exception as e:
+                print(f"⚠️ [STATE] Listener error on {section}: {e}")
+
+    def _touch_all(self):
+        """Stato sostituito per intero (nuova partita, caricamento)."""
+        for section in STATE_SECTIONS:
+            self.touch(section)
+
     def create_new_session(self, world_data: Dict, companion_name: str = "Luna") -> Dict:
         """Inizializza una nuova partita."""
         companions_db = world_data.get("companions", {})
@@ -66,34 +157,69 @@ class StateManager:
             },
             "history": [],
             "summary_log": [],
-            "knowledge_base": []
+            "summary_turns": [],  # [primo, ultimo] turno di ogni voce di summary_log
+            "chapters": [],  # Riassunti gerarchici di summary_log (vedi core/chapters.py)
+            "knowledge_base": [],
+            "fact_meta": []  # [primo turno, ultimo turno, ripetizioni] di ogni fatto
         }
+        self._reset_journal()
+        self._touch_all()
         print(f"✨ Session Created: {companion_name} + NPCs initialized.")
         return self.current_state
 
     def save_game(self, filename: str = "quicksave.json") -> str:
+        """
+        Accoda il salvataggio al SaveWriter e ritorna subito: la serializzazione e la
+        scrittura (atomica) avvengono sul thread di scrittura, mai nel turno.
+        """
         full_path = self.saves_path / filename
         try:
-            with open(full_path, "w", encoding="utf-8") as f:
-                json.dump(self.current_state, f, indent=2, ensure_ascii=False)
+            self.writer.write_snapshot(full_path, copy.deepcopy(self.current_state),
+                                       encoder=self._encoder_for(full_path))
             return str(full_path)
         except Exception as e:
             print(f"❌ Save Error: {e}")
             return ""
 
+    def save_name(self, stem: str) -> str:
+        """Nome file del save secondo il formato scelto nei Settings ("json" o "compact")."""
+        if Settings.get_instance().config.get("save_format") == "compact":
+            return f"{stem}{COMPACT_EXT}"
+        return f"{stem}.json"
+
+    @staticmethod
+    def _encoder_for(full_path: Path):
+        return encode_compact if full_path.suffix == COMPACT_EXT else None
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Attende che tutti i salvataggi in coda siano su disco (es. prima di uscire)."""
+        return self.writer.flush(timeout)
+
     def load_game(self, filename: str) -> bool:
         full_path = self.saves_path / filename
+        self.writer.flush()  # Eventuali scritture in coda devono arrivare prima della lettura
         if not full_path.exists():
             print(f"❌ File non trovato: {full_path}")
             return False
 
         try:
-            with open(full_path, "r", encoding="utf-8") as f:
-                self.current_state = json.load(f)
+            if is_compact(full_path):
+                # Header subito, history/summary_log/knowledge_base decodificati al primo accesso
+                self.current_state = read_compact(full_path)
+            else:
+                with open(full_path, "r", encoding="utf-8") as f:
+                    self.current_state = json.load(f)
+
+            self._reset_journal()
+            replayed = self._replay_journal(full_path)
+            if replayed:
+                print(f"📒 Journal: {replayed} turni ripristinati.")
+            self._journal_target = str(full_path)
 
             # Fix retroattività: se carichi un vecchio save senza npc_states, lo crea vuoto
             if "game" in self.current_state and "npc_states" not in self.current_state["game"]:
                 self.current_state["game"]["npc_states"] = {}
+            self._touch_all()
 
             print(f"✅ Caricamento riuscito: {self.current_state['game']['location']}")
             return True
@@ -101,65 +227,205 @@ class StateManager:
             print(f"❌ Load Error: {e}")
             return False
 
+    # --- JOURNAL ---
+
+    def record(self, entry: Dict):
+        """Accoda un delta (turno, compressione memoria...) per il prossimo save_journaled."""
+        self._journal_pending.append(entry)
+
+    def save_journaled(self, filename: str = "autosave.json") -> str:
+        """
+        Autosave a costo costante: scrive solo i delta accumulati in <file>.journal.
+        Lo snapshot completo viene riscritto (compattazione) solo se la partita non è
+        quella dello snapshot, o ogni JOURNAL_COMPACT_EVERY righe.
+        """
+        full_path = self.saves_path / filename
+        if (self._journal_target != str(full_path)
+                or self._journal_count + len(self._journal_pending) > self.JOURNAL_COMPACT_EVERY):
+            return self._compact_journal(full_path)
+
+        if not self._journal_pending:
+            return str(full_path)
+
+        gen = self.current_state["meta"].get("journal_gen", 0)
+        try:
+            lines = [json.dumps({"gen": gen, **entry}, ensure_ascii=False, separators=(",", ":")) + "\n"
+                     for entry in self._journal_pending]
+            self.writer.append_lines(self._journal_path(full_path), lines)
+            self._journal_count += len(self._journal_pending)
+            self._journal_pending = []
+            return str(full_path)
+        except Exception as e:
+            print(f"❌ Journal Error: {e}")
+            return ""
+
+    def _compact_journal(self, full_path: Path) -> str:
+        """Riscrive lo snapshot (nuova generazione) e svuota il journal."""
+        meta = self.current_state.setdefault("meta", {})
+        meta["journal_gen"] = meta.get("journal_gen", 0) + 1
+
+        try:
+            # Snapshot + svuotamento del journal nello stesso job del writer
+            self.writer.write_snapshot(full_path, copy.deepcopy(self.current_state),
+                                       reset_journal=self._journal_path(full_path),
+                                       encoder=self._encoder_for(full_path))
+        except Exception as e:
+            print(f"❌ Save Error: {e}")
+            return ""
+
+        self._journal_pending = []
+        self._journal_count = 0
+        self._journal_target = str(full_path)
+        return str(full_path)
+
+    def _replay_journal(self, full_path: Path) -> int:
+        """Riapplica i delta del journal allo snapshot appena caricato. Ritorna le righe applicate."""
+        journal = self._journal_path(full_path)
+        if not journal.exists():
+            return 0
+
+        gen = self.current_state.get("meta", {}).get("journal_gen", 0)
+        applied = 0
+        with open(journal, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Riga troncata da un crash: tutto ciò che segue non è affidabile
+                    break
+                if entry.get("gen") != gen:
+                    continue  # Riga di una generazione precedente (già nello snapshot)
+                self._apply_journal_entry(entry)
+                applied += 1
+
+        self._journal_count = applied
+        return applied
+
+    def _apply_journal_entry(self, entry: Dict):
+        state = self.current_state
+        op = entry.get("op")
+        if op == "turn":
+            self.update_state(entry.get("updates") or {})
+            knowledge_base = state.setdefault("knowledge_base", [])
+            fact_meta = state.setdefault("fact_meta", [])
+            fact_meta.extend([None] * (len(knowledge_base) - len(fact_meta)))
+            turn = state.get("meta", {}).get("turn_count", 0)
+            for fact in entry.get("facts", []):
+                knowledge_base.append(fact)
+                fact_meta.append([turn, turn, 1])
+            state.setdefault("history", []).extend(entry.get("messages", []))
+        elif op == "compress":
+            summary_log = state.setdefault("summary_log", [])
+            summary_turns = state.setdefault("summary_turns", [])
+            summary_turns.extend([None] * (len(summary_log) - len(summary_turns)))
+            summary_log.append(entry["summary"])
+            summary_turns.append(entry.get("turns"))
+            state["history"] = state.get("history", [])[entry.get("pruned", 0):]
+        elif op == "fact":
+            # Fatto ripetuto o riformulato (vedi MemoryManager.add_fact)
+            index = entry["index"]
+            fact_meta = state.setdefault("fact_meta", [])
+            fact_meta.extend([None] * (index + 1 - len(fact_meta)))
+            state["knowledge_base"][index] = entry["text"]
+            fact_meta[index] = entry["meta"]
+        elif op == "rollup":
+            state.setdefault("chapters", []).append(entry["chapter"])
+
+    @staticmethod
+    def _journal_path(full_path: Path) -> Path:
+        # Nome completo + .journal: autosave.json e autosave.lrs hanno journal distinti
+        return full_path.with_name(full_path.name + ".journal")
+
+    def _reset_journal(self):
+        self._journal_pending = []
+        self._journal_count = 0
+        self._journal_target = None
+
     def update_state(self, updates: Dict):
-        """Aggiorna lo stato del gioco con i dati ricevuti dall'LLM."""
+        """Aggiorna lo stato del gioco con i dati ricevuti dall'LLM (una nuova versione per sezione toccata)."""
         if not updates: return
         game_data = self.current_state.get("game", {})
 
         # 1. Aggiornamento Campi Diretti
-        for key in ["location", "current_outfit", "gold", "hp", "time_of_day"]:
-            if key in updates and updates[key] is not None:
+        changed = []
+        for key in GAME_FIELDS:
+            if key in updates and updates[key] is not None and game_data.get(key) != updates[key]:
                 game_data[key] = updates[key]
+                changed.append(key)
+        if changed:
+            self.touch("game", changed)
 
         # 2. Aggiornamento NPC OUTFIT (Fondamentale!)
         # Se l'LLM manda: "npc_updates": {"Maria": {"outfit": "nude"}}
         if "npc_updates" in updates:
+            changed = []
             for npc_name, npc_data in updates["npc_updates"].items():
                 if "npc_states" not in game_data: game_data["npc_states"] = {}
 
                 # Inizializza se manca
                 if npc_name not in game_data["npc_states"]:
                     game_data["npc_states"][npc_name] = {}
+                    changed.append(npc_name)
 
                 # Aggiorna Outfit
-                if "outfit" in npc_data:
+                if "outfit" in npc_data and game_data["npc_states"][npc_name].get("current_outfit") != npc_data["outfit"]:
                     game_data["npc_states"][npc_name]["current_outfit"] = npc_data["outfit"]
+                    changed.append(npc_name)
                     print(f"👗 [STATE] {npc_name} changed outfit to: {npc_data['outfit']}")
+            if changed:
+                self.touch("npc_states", dict.fromkeys(changed))
 
         # 3. Inventario
         if "add_item" in updates:
             item = updates["add_item"]
             if item and item not in game_data["inventory"]:
                 game_data["inventory"].append(item)
+                self.touch("inventory", [item])
 
         if "remove_item" in updates:
             item = updates["remove_item"]
             if item and item in game_data["inventory"]:
                 game_data["inventory"].remove(item)
+                self.touch("inventory", [item])
 
         # 4. Flag
         if "flags" in updates:
+            flags = game_data["flags"]
+            changed = [k for k, v in updates["flags"].items() if k not in flags or flags[k] != v]
             game_data["flags"].update(updates["flags"])
+            if changed:
+                self.touch("flags", changed)
 
         # 5. Affinità
         if "affinity_change" in updates:
             changes = updates["affinity_change"]
             if isinstance(changes, dict):
+                changed = []
                 for char, val in changes.items():
                     if val is not None and isinstance(val, (int, float)):
                         if char in game_data["affinity"]:
-                            new_val = game_data["affinity"][char] + int(val)
-                            game_data["affinity"][char] = max(0, min(100, new_val))
+                            new_val = max(0, min(100, game_data["affinity"][char] + int(val)))
+                            if new_val != game_data["affinity"][char]:
+                                game_data["affinity"][char] = new_val
+                                changed.append(char)
+                if changed:
+                    self.touch("affinity", changed)
 
         # 6. Statistiche
         if "stat_changes" in updates:
             changes = updates["stat_changes"]
             if isinstance(changes, dict):
+                changed = []
                 for stat, val in changes.items():
                     if val is not None and isinstance(val, (int, float)):
                         if stat in game_data.get("stats", {}):
-                            new_val = game_data["stats"][stat] + int(val)
-                            game_data["stats"][stat] = max(0, new_val)
+                            new_val = max(0, game_data["stats"][stat] + int(val))
+                            if new_val != game_data["stats"][stat]:
+                                game_data["stats"][stat] = new_val
+                                changed.append(stat)
+                if changed:
+                    self.touch("stats", changed)
 
         # Avanzamento Turno
-        self.current_state["meta"]["turn_count"] += 1
\ No newline at end of file
+        self.current_state["meta"]["turn_count"] += 1
+        self.touch("turn")
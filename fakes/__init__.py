@@ -0,0 +1,99 @@
+# file: fakes/__init__.py
+"""
+Server finti (solo stdlib) per Gemini, un server LLM OpenAI-compatibile,
+Stable Diffusion A1111, ComfyUI e Google TTS.
+Servono a eseguire turni completi - incluso il ciclo WebSocket di VideoClient -
+senza rete né GPU, con latenza e guasti configurabili (FaultConfig).
+
+    with FakeBackends(gemini=FaultConfig(latency=0.05)) as fakes:
+        engine = GameEngine()
+        ...
+"""
+import os
+from typing import Dict, Optional
+
+from fakes.base import FakeServer, FaultConfig
+from fakes.comfy import FakeComfyUI
+from fakes.gemini import FakeGemini
+from fakes.openai_compat import FakeOpenAICompat
+from fakes.sd import FakeStableDiffusion
+from fakes.tts import FakeTextToSpeech
+
+__all__ = ["FakeBackends", "FakeServer", "FaultConfig", "FakeGemini", "FakeOpenAICompat",
+           "FakeStableDiffusion", "FakeComfyUI", "FakeTextToSpeech"]
+
+
+class FakeBackends:
+    """
+    Avvia tutti i server finti e punta i client del gioco verso di loro:
+    variabili d'ambiente (GEMINI_BASE_URL, TTS_ENDPOINT) e Settings in memoria
+    (local_url, comfy_url, openai_url, llm_backend; settings.json non viene riscritto).
+    llm_backend sceglie quale LLM finto usa il gioco: "gemini" oppure "openai".
+    Va attivato prima di creare GameEngine / ClientRegistry.
+    """
+
+    def __init__(self, gemini: Optional[FaultConfig] = None, sd: Optional[FaultConfig] = None,
+                 comfy: Optional[FaultConfig] = None, tts: Optional[FaultConfig] = None,
+                 render_latency: float = 0.0, video_latency: float = 0.0, llm_backend: str = "gemini"):
+        self.llm_backend = llm_backend
+        self.gemini = FakeGemini(gemini)
+        self.openai = FakeOpenAICompat(gemini)
+        self.sd = FakeStableDiffusion(sd, render_latency=render_latency)
+        self.comfy = FakeComfyUI(comfy, render_latency=video_latency)
+        self.tts = FakeTextToSpeech(tts)
+        self._saved_env: Dict[str, Optional[str]] = {}
+        self._saved_settings: Dict[str, object] = {}
+
+    @property
+    def servers(self):
+        return [self.gemini, self.openai, self.sd, self.comfy, self.tts]
+
+    def start(self) -> "FakeBackends":
+        for server in self.servers:
+            server.start()
+        self.configure()
+        return self
+
+    def configure(self):
+        env = {
+            "GEMINI_API_KEY": "fake-key",
+            "GEMINI_BASE_URL": self.gemini.url,
+            "TTS_ENDPOINT": self.tts.url,
+            "SDL_AUDIODRIVER": os.environ.get("SDL_AUDIODRIVER", "dummy"),
+        }
+        for key, value in env.items():
+            self._saved_env.setdefault(key, os.environ.get(key))
+            os.environ[key] = value
+
+        from config.settings import Settings
+        config = Settings.get_instance().config
+        overrides = {"runpod_active": False, "local_url": self.sd.url, "comfy_url": self.comfy.url,
+                     "openai_url": f"{self.openai.url}/v1", "llm_backend": self.llm_backend}
+        for key, value in overrides.items():
+            self._saved_settings.setdefault(key, config.get(key))
+            config[key] = value
+
+    def stop(self):
+        for key, value in self._saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        if self._saved_settings:
+            from config.settings import Settings
+            config = Settings.get_instance().config
+            for key, value in self._saved_settings.items():
+                if value is None:
+                    config.pop(key, None)
+                else:
+                    config[key] = value
+        self._saved_env.clear()
+        self._saved_settings.clear()
+        for server in self.servers:
+            server.stop()
+
+    def __enter__(self) -> "FakeBackends":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,41 @@
+# file: fakes/__main__.py
+"""
+Avvia i server finti in primo piano:  python -m fakes [--latency 0.2] [--failure-rate 0.1]
+Poi esportare le variabili stampate prima di lanciare main.py.
+"""
+import argparse
+import time
+
+from fakes import FakeBackends, FaultConfig
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend finti per Luna RPG")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latenza di rete simulata (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Jitter massimo aggiunto (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probabilità di errore 503 (0-1)")
+    parser.add_argument("--render-latency", type=float, default=0.0, help="Tempo di generazione SD (s)")
+    parser.add_argument("--video-latency", type=float, default=0.0, help="Tempo di generazione ComfyUI (s)")
+    args = parser.parse_args()
+
+    def faults():
+        return FaultConfig(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate)
+
+    backends = FakeBackends(gemini=faults(), sd=faults(), comfy=faults(), tts=faults(),
+                            render_latency=args.render_latency, video_latency=args.video_latency)
+    backends.start()
+    print("🧪 Backend finti attivi:")
+    print(f"   export GEMINI_API_KEY=fake-key GEMINI_BASE_URL={backends.gemini.url} "
+          f"TTS_ENDPOINT={backends.tts.url}")
+    print(f"   settings.json: \"local_url\": \"{backends.sd.url}\", \"comfy_url\": \"{backends.comfy.url}\"")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        backends.stop()
+
+
+if __name__ == "__main__":
+    main()
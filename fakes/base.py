@@ -0,0 +1,133 @@
+# file: fakes/base.py
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import urlsplit, parse_qs
+
+
+class FaultConfig:
+    """
+    Latenza e guasti simulati di un server finto. Modificabile a caldo
+    (es. dal benchmark) anche mentre il server è in esecuzione.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 failure_status: int = 503, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, extra: float = 0.0):
+        with self._lock:
+            wait = self.latency + extra + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if wait > 0:
+            time.sleep(wait)
+
+    def should_fail(self) -> bool:
+        if self.failure_rate <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < self.failure_rate
+
+
+class FakeServer:
+    """
+    Base dei server finti: ThreadingHTTPServer su 127.0.0.1 (porta libera) in un thread daemon.
+    Le sottoclassi implementano handle(req, method, path, query).
+    """
+
+    name = "fake"
+
+    def __init__(self, faults: Optional[FaultConfig] = None, port: int = 0):
+        self.faults = faults or FaultConfig()
+        self.calls = Counter()  # "METHOD /path" -> numero di chiamate
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=f"fake-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _dispatch(self, method):
+                parts = urlsplit(self.path)
+                server.calls[f"{method} {parts.path}"] += 1
+                try:
+                    server.handle(self, method, parts.path, parse_qs(parts.query))
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_PATCH(self):
+                self._dispatch("PATCH")
+
+            def do_DELETE(self):
+                self._dispatch("DELETE")
+
+            def log_message(self, format, *args):
+                pass  # Silenzioso: i benchmark fanno migliaia di richieste
+
+        return Handler
+
+    def handle(self, req: BaseHTTPRequestHandler, method: str, path: str, query: dict):
+        send_json(req, {"error": "not found"}, 404)
+
+    def fail_if_needed(self, req: BaseHTTPRequestHandler, body: Any = None) -> bool:
+        """Applica latenza e, se estratto, risponde con un errore. True se la richiesta è fallita."""
+        self.faults.delay()
+        if self.faults.should_fail():
+            status = self.faults.failure_status
+            send_json(req, body or {"error": {"code": status, "message": "fake failure", "status": "UNAVAILABLE"}},
+                      status)
+            return True
+        return False
+
+
+def read_body(req: BaseHTTPRequestHandler) -> bytes:
+    length = int(req.headers.get("Content-Length") or 0)
+    return req.rfile.read(length) if length else b""
+
+
+def read_json(req: BaseHTTPRequestHandler) -> Any:
+    body = read_body(req)
+    return json.loads(body) if body else {}
+
+
+def send_bytes(req: BaseHTTPRequestHandler, data: bytes, content_type: str, status: int = 200):
+    req.send_response(status)
+    req.send_header("Content-Type", content_type)
+    req.send_header("Content-Length", str(len(data)))
+    req.end_headers()
+    req.wfile.write(data)
+
+
+def send_json(req: BaseHTTPRequestHandler, obj: Any, status: int = 200):
+    send_bytes(req, json.dumps(obj).encode("utf-8"), "application/json", status)
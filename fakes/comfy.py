@@ -0,0 +1,144 @@
+# file: fakes/comfy.py
+import base64
+import hashlib
+import itertools
+import json
+import queue
+import select
+import struct
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from fakes.base import FakeServer, FaultConfig, read_body, read_json, send_bytes, send_json
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Finto MP4: basta l'header 'ftyp', VideoClient scrive i byte su disco così come sono
+FAKE_VIDEO = b"\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom" + b"\x00" * 64
+
+
+class FakeComfyUI(FakeServer):
+    """
+    Finto ComfyUI: /upload/image, /prompt, /ws (WebSocket RFC 6455 minimale),
+    /history/{prompt_id} e /view. Dopo render_latency secondi dal /prompt invia
+    sul WebSocket del client gli eventi 'executing' fino a node=None (fine coda),
+    esattamente il ciclo che VideoClient aspetta.
+    """
+
+    name = "comfy"
+
+    def __init__(self, faults: Optional[FaultConfig] = None, port: int = 0,
+                 render_latency: float = 0.0, node_ids=("6", "5", "3", "9")):
+        super().__init__(faults, port)
+        self.render_latency = render_latency
+        self.node_ids = list(node_ids)
+        self.history: Dict[str, dict] = {}
+        self._queues: Dict[str, "queue.Queue"] = {}
+        self._lock = threading.Lock()
+        self._uploads = itertools.count(1)
+        self._numbers = itertools.count()
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+        super().stop()
+
+    def _queue_for(self, client_id: str) -> "queue.Queue":
+        with self._lock:
+            return self._queues.setdefault(client_id, queue.Queue())
+
+    # --- ROUTING ---
+
+    def handle(self, req, method, path, query):
+        if method == "GET" and path == "/ws":
+            self._websocket(req, query.get("clientId", [""])[0])
+        elif method == "POST" and path == "/upload/image":
+            read_body(req)  # multipart: il contenuto non serve
+            if self.fail_if_needed(req):
+                return
+            send_json(req, {"name": f"fake_upload_{next(self._uploads)}.png", "subfolder": "", "type": "input"})
+        elif method == "POST" and path == "/prompt":
+            body = read_json(req)
+            if self.fail_if_needed(req):
+                return
+            prompt_id = str(uuid.uuid4())
+            threading.Thread(target=self._execute, args=(prompt_id, body.get("client_id", "")),
+                             daemon=True).start()
+            send_json(req, {"prompt_id": prompt_id, "number": next(self._numbers), "node_errors": {}})
+        elif method == "GET" and path.startswith("/history/"):
+            prompt_id = path[len("/history/"):]
+            entry = self.history.get(prompt_id)
+            send_json(req, {prompt_id: entry} if entry else {})
+        elif method == "GET" and path == "/view":
+            send_bytes(req, FAKE_VIDEO, "video/mp4")
+        else:
+            super().handle(req, method, path, query)
+
+    # --- ESECUZIONE SIMULATA ---
+
+    def _execute(self, prompt_id: str, client_id: str):
+        events = self._queue_for(client_id)
+        events.put({"type": "execution_start", "data": {"prompt_id": prompt_id}})
+        step = self.render_latency / max(1, len(self.node_ids))
+        for node in self.node_ids:
+            events.put({"type": "executing", "data": {"node": node, "prompt_id": prompt_id}})
+            if step:
+                time.sleep(step)
+        # La history va scritta prima dell'evento finale: il client la legge subito dopo
+        self.history[prompt_id] = {
+            "prompt": [],
+            "outputs": {"9": {"gifs": [{"filename": f"fake_{prompt_id[:8]}.mp4", "subfolder": "",
+                                        "type": "output", "format": "video/h264-mp4"}]}},
+            "status": {"status_str": "success", "completed": True},
+        }
+        events.put({"type": "executing", "data": {"node": None, "prompt_id": prompt_id}})
+
+    # --- WEBSOCKET ---
+
+    def _websocket(self, req, client_id: str):
+        key = req.headers.get("Sec-WebSocket-Key", "")
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode("ascii")).digest()).decode("ascii")
+        req.send_response(101, "Switching Protocols")
+        req.send_header("Upgrade", "websocket")
+        req.send_header("Connection", "Upgrade")
+        req.send_header("Sec-WebSocket-Accept", accept)
+        req.end_headers()
+        req.wfile.flush()
+        req.close_connection = True
+
+        events = self._queue_for(client_id)
+        self._send_frame(req, {"type": "status", "data": {"status": {"exec_info": {"queue_remaining": 0}},
+                                                          "sid": client_id}})
+        sock = req.connection
+        while not self._stopping.is_set():
+            try:
+                self._send_frame(req, events.get(timeout=0.05))
+                continue
+            except queue.Empty:
+                pass
+            readable, _, _ = select.select([sock], [], [], 0)
+            if readable:
+                data = sock.recv(2)
+                # EOF oppure frame di chiusura (opcode 0x8): il client ha finito
+                if not data or (data[0] & 0x0F) == 0x8:
+                    if data:
+                        self._send_raw(req, 0x88, b"")
+                    break
+
+    @staticmethod
+    def _send_frame(req, message: dict):
+        FakeComfyUI._send_raw(req, 0x81, json.dumps(message).encode("utf-8"))
+
+    @staticmethod
+    def _send_raw(req, head: int, payload: bytes):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", head, length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", head, 126, length)
+        else:
+            header = struct.pack("!BBQ", head, 127, length)
+        req.wfile.write(header + payload)
+        req.wfile.flush()
@@ -0,0 +1,170 @@
+# file: fakes/gemini.py
+import itertools
+import json
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+from fakes.base import FakeServer, FaultConfig, read_json, send_json
+
+_MODEL_PATH = re.compile(r"^/(v1beta|v1alpha|v1)/models/([^:/]+):(generateContent|streamGenerateContent)$")
+_CACHE_PATH = re.compile(r"^/(v1beta|v1alpha|v1)/(cachedContents)(?:/([^/]+))?$")
+
+LOCATIONS = ["Classroom", "Library", "Gym", "Rooftop", "Hallway", "Cafeteria"]
+TIMES = ["Morning", "Afternoon", "Evening", "Night"]
+
+
+class FakeGemini(FakeServer):
+    """
+    Finto endpoint Gemini (generativelanguage API) per google-genai:
+    :generateContent, :streamGenerateContent?alt=sse e cachedContents.
+    Le risposte di turno seguono il formato del System Prompt (narrazione + JSON).
+    I modelli in missing_models rispondono 404 NOT_FOUND (modello ritirato o non abilitato).
+    """
+
+    name = "gemini"
+
+    def __init__(self, faults: Optional[FaultConfig] = None, port: int = 0,
+                 chunk_size: int = 24, chunk_delay: float = 0.0, first_token_latency: float = 0.0):
+        super().__init__(faults, port)
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.first_token_latency = first_token_latency
+        self.caches: Dict[str, dict] = {}
+        self.missing_models = set()
+        self._turns = itertools.count()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    # --- ROUTING ---
+
+    def handle(self, req, method, path, query):
+        match = _MODEL_PATH.match(path)
+        if match and method == "POST":
+            model, action = match.group(2), match.group(3)
+            body = read_json(req)
+            if model in self.missing_models:
+                send_json(req, {"error": {"code": 404, "message": f"models/{model} is not found",
+                                          "status": "NOT_FOUND"}}, 404)
+                return
+            if self.fail_if_needed(req):
+                return
+            text = self.reply_for(body)
+            if action == "streamGenerateContent":
+                self._stream(req, model, text)
+            else:
+                send_json(req, self._response(model, text))
+            return
+
+        match = _CACHE_PATH.match(path)
+        if match:
+            self._handle_cache(req, method, match.group(3))
+            return
+
+        send_json(req, {"error": {"code": 404, "message": f"Unknown path {path}", "status": "NOT_FOUND"}}, 404)
+
+    def _handle_cache(self, req, method, cache_id):
+        if method == "POST" and not cache_id:
+            body = read_json(req)
+            name = f"cachedContents/fake-{next(self._ids)}"
+            entry = {"name": name, "model": body.get("model", ""), "displayName": body.get("displayName", ""),
+                     "systemInstruction": body.get("systemInstruction"),
+                     "expireTime": "2099-01-01T00:00:00Z"}
+            self.caches[name] = entry
+            send_json(req, {k: v for k, v in entry.items() if k != "systemInstruction"})
+        elif method == "DELETE" and cache_id:
+            self.caches.pop(f"cachedContents/{cache_id}", None)
+            send_json(req, {})
+        elif method in ("GET", "PATCH") and cache_id:
+            entry = self.caches.get(f"cachedContents/{cache_id}")
+            if entry is None:
+                send_json(req, {"error": {"code": 404, "message": "cache not found", "status": "NOT_FOUND"}}, 404)
+            else:
+                send_json(req, {k: v for k, v in entry.items() if k != "systemInstruction"})
+        else:
+            send_json(req, {"error": {"code": 400, "message": "bad cache request", "status": "INVALID_ARGUMENT"}}, 400)
+
+    # --- RISPOSTE ---
+
+    @staticmethod
+    def _response(model: str, text: str, finish: bool = True) -> dict:
+        candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+        if finish:
+            candidate["finishReason"] = "STOP"
+        return {
+            "candidates": [candidate],
+            "usageMetadata": {"promptTokenCount": 0, "candidatesTokenCount": len(text) // 4,
+                              "totalTokenCount": len(text) // 4},
+            "modelVersion": model,
+        }
+
+    def _stream(self, req, model: str, text: str):
+        req.send_response(200)
+        req.send_header("Content-Type", "text/event-stream")
+        req.send_header("Connection", "close")
+        req.end_headers()
+        req.close_connection = True
+
+        if self.first_token_latency:
+            time.sleep(self.first_token_latency)
+        pieces = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+        for i, piece in enumerate(pieces):
+            payload = self._response(model, piece, finish=(i == len(pieces) - 1))
+            req.wfile.write(f"data: {json.dumps(payload)}\r\n\r\n".encode("utf-8"))
+            req.wfile.flush()
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+
+    def reply_for(self, body: dict) -> str:
+        """Testo della risposta in base all'ultimo messaggio utente."""
+        last = _last_user_text(body.get("contents", []))
+        if "Test connection" in last:
+            return "OK"
+        if "LOG DA RIASSUMERE" in last:
+            return "Il giocatore ha esplorato la scuola e ha parlato con la sua compagna."
+        with self._lock:
+            turn = next(self._turns)
+        partner = self._partner_name(body)
+        if body.get("generationConfig", {}).get("responseMimeType") == "application/json":
+            payload = {"narration": self._narration(partner, turn), **self.turn_payload(partner, turn)}
+            return json.dumps(payload, ensure_ascii=False)
+        payload = self.turn_payload(partner, turn)
+        return f"{self._narration(partner, turn)}\n```json\n{json.dumps(payload, ensure_ascii=False, indent=2)}\n```"
+
+    @staticmethod
+    def turn_payload(partner: str, turn: int) -> dict:
+        updates = {
+            "time_of_day": TIMES[(turn // 4) % len(TIMES)],
+            "location": LOCATIONS[turn % len(LOCATIONS)],
+            "affinity_change": {partner: 1 if turn % 3 else -1},
+        }
+        if turn % 5 == 0:
+            updates["new_fact"] = f"{partner} ha rivelato un segreto al turno {turn}."
+        return {
+            "visual_en": f"Cinematic shot of {partner} in the {updates['location'].lower()}, medium shot",
+            "tags_en": ["8k", "photorealistic", "upper body", "cinematic lighting", "indoors"],
+            "updates": updates,
+        }
+
+    def _partner_name(self, body: dict) -> str:
+        """Companion attivo, letto dal System Prompt (o dal CachedContent che lo contiene)."""
+        system = body.get("systemInstruction")
+        if not system and body.get("cachedContent") in self.caches:
+            system = self.caches[body["cachedContent"]].get("systemInstruction")
+        text = "".join(p.get("text", "") for p in (system or {}).get("parts", []))
+        match = re.search(r"ACTIVE PARTNER \((\w+)\)", text)
+        return match.group(1) if match else "Luna"
+
+    @staticmethod
+    def _narration(partner: str, turn: int) -> str:
+        return (f"{partner} ti guarda per un lungo istante, poi sorride. "
+                f"\"Non pensavo che saresti venuto davvero,\" sussurra. "
+                f"Il corridoio è silenzioso, rotto solo dai vostri passi (turno {turn}).")
+
+
+def _last_user_text(contents: List[dict]) -> str:
+    for content in reversed(contents):
+        if content.get("role", "user") == "user":
+            return "".join(p.get("text", "") for p in content.get("parts", []))
+    return ""
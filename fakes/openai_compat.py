@@ -0,0 +1,70 @@
+# file: fakes/openai_compat.py
+import json
+import time
+
+from fakes.base import read_json, send_json
+from fakes.gemini import FakeGemini
+
+
+class FakeOpenAICompat(FakeGemini):
+    """
+    Finto server locale OpenAI-compatibile (llama.cpp e simili):
+    /v1/chat/completions (anche stream SSE) e /v1/models.
+    Le risposte sono le stesse di FakeGemini: la richiesta viene tradotta nel suo formato.
+    """
+
+    name = "openai"
+
+    def handle(self, req, method, path, query):
+        if method == "GET" and path == "/v1/models":
+            send_json(req, {"object": "list", "data": [{"id": "local", "object": "model"}]})
+            return
+        if method != "POST" or path != "/v1/chat/completions":
+            send_json(req, {"error": {"message": f"Unknown path {path}", "type": "not_found"}}, 404)
+            return
+
+        body = read_json(req)
+        if self.fail_if_needed(req, {"error": {"message": "fake failure", "type": "server_error"}}):
+            return
+        text = self.reply_for(self._as_gemini(body))
+        model = body.get("model", "local")
+        if body.get("stream"):
+            self._stream_openai(req, model, text)
+        else:
+            send_json(req, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(text) // 4},
+            })
+
+    @staticmethod
+    def _as_gemini(body: dict) -> dict:
+        system = [m["content"] for m in body.get("messages", []) if m.get("role") == "system"]
+        contents = [{"role": "model" if m.get("role") == "assistant" else "user", "parts": [{"text": m["content"]}]}
+                    for m in body.get("messages", []) if m.get("role") != "system"]
+        converted = {"contents": contents}
+        if system:
+            converted["systemInstruction"] = {"parts": [{"text": s} for s in system]}
+        if (body.get("response_format") or {}).get("type") in ("json_object", "json_schema"):
+            converted["generationConfig"] = {"responseMimeType": "application/json"}
+        return converted
+
+    def _stream_openai(self, req, model: str, text: str):
+        req.send_response(200)
+        req.send_header("Content-Type", "text/event-stream")
+        req.send_header("Connection", "close")
+        req.end_headers()
+        req.close_connection = True
+
+        if self.first_token_latency:
+            time.sleep(self.first_token_latency)
+        for i in range(0, len(text), self.chunk_size):
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": text[i:i + self.chunk_size]},
+                                  "finish_reason": None}]}
+            req.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            req.wfile.flush()
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+        req.wfile.write(b"data: [DONE]\n\n")
+        req.wfile.flush()
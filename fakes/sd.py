@@ -0,0 +1,51 @@
+# file: fakes/sd.py
+import base64
+import json
+import struct
+import time
+import zlib
+from typing import Optional
+
+from fakes.base import FakeServer, FaultConfig, read_json, send_json
+
+
+def tiny_png(width: int = 8, height: int = 8, rgb=(40, 60, 90)) -> bytes:
+    """PNG valido a tinta unita, generato senza dipendenze (niente Pillow)."""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    row = b"\x00" + bytes(rgb) * width
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(row * height)) + chunk(b"IEND", b""))
+
+
+class FakeStableDiffusion(FakeServer):
+    """
+    Finto backend A1111 (/sdapi/v1/txt2img) più gli endpoint VRAM usati da VideoClient.
+    render_latency simula il tempo di generazione, separato dalla latenza di rete.
+    """
+
+    name = "sd"
+
+    def __init__(self, faults: Optional[FaultConfig] = None, port: int = 0, render_latency: float = 0.0):
+        super().__init__(faults, port)
+        self.render_latency = render_latency
+        self.image_b64 = base64.b64encode(tiny_png()).decode("ascii")
+        self.last_payload: Optional[dict] = None
+
+    def handle(self, req, method, path, query):
+        if method == "POST" and path == "/sdapi/v1/txt2img":
+            payload = read_json(req)
+            if self.fail_if_needed(req):
+                return
+            if self.render_latency:
+                time.sleep(self.render_latency)
+            self.last_payload = payload
+            send_json(req, {"images": [self.image_b64], "parameters": payload,
+                            "info": json.dumps({"seed": payload.get("seed", -1)})})
+        elif method == "POST" and path in ("/sdapi/v1/unload-checkpoint", "/sdapi/v1/reload-checkpoint",
+                                           "/sdapi/v1/free-memory"):
+            send_json(req, {})
+        else:
+            super().handle(req, method, path, query)
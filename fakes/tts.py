@@ -0,0 +1,33 @@
+# file: fakes/tts.py
+import base64
+from typing import Optional
+
+from fakes.base import FakeServer, FaultConfig, read_json, send_json
+
+
+def silent_mp3(frames: int = 4) -> bytes:
+    """Frame MPEG-1 Layer III (128 kbps, 44.1 kHz) a side info nulla: silenzio valido per pygame."""
+    frame = b"\xff\xfb\x90\x64" + b"\x00" * 413  # 144 * 128000 / 44100 = 417 byte per frame
+    return frame * frames
+
+
+class FakeTextToSpeech(FakeServer):
+    """
+    Finto Google Cloud TTS (trasporto REST): POST /v1/text:synthesize.
+    Restituisce sempre un breve MP3 muto (l'encoding chiesto da AudioClient).
+    """
+
+    name = "tts"
+
+    def __init__(self, faults: Optional[FaultConfig] = None, port: int = 0, frames: int = 4):
+        super().__init__(faults, port)
+        self.audio_b64 = base64.b64encode(silent_mp3(frames)).decode("ascii")
+
+    def handle(self, req, method, path, query):
+        if method == "POST" and path in ("/v1/text:synthesize", "/v1beta1/text:synthesize"):
+            read_json(req)
+            if self.fail_if_needed(req):
+                return
+            send_json(req, {"audioContent": self.audio_b64})
+        else:
+            super().handle(req, method, path, query)
@@ -4,6 +4,7 @@ import time
 import tempfile
 import pygame
 from google.cloud import texttospeech
+from google.auth.credentials import AnonymousCredentials
 from google.oauth2 import service_account
 
 # Mappa delle voci (Google Cloud TTS)
@@ -22,11 +23,18 @@ class AudioClient:
 
         # 1. Carica Credenziali
         cred_path = "google_credentials.json"
+        # TTS_ENDPOINT: endpoint REST alternativo senza credenziali (es. server finto, vedi fakes/)
+        endpoint = os.getenv("TTS_ENDPOINT")
 
-        if os.path.exists(cred_path):
+        if endpoint or os.path.exists(cred_path):
             try:
-                credentials = service_account.Credentials.from_service_account_file(cred_path)
-                self.client = texttospeech.TextToSpeechClient(credentials=credentials)
+                if endpoint:
+                    self.client = texttospeech.TextToSpeechClient(
+                        credentials=AnonymousCredentials(), transport="rest",
+                        client_options={"api_endpoint": endpoint})
+                else:
+                    credentials = service_account.Credentials.from_service_account_file(cred_path)
+                    self.client = texttospeech.TextToSpeechClient(credentials=credentials)
 
                 # Init Pygame Mixer con configurazione sicura
                 # Buffer più alto riduce il rischio di crash
@@ -0,0 +1,171 @@
+# file: media/context_cache.py
+import hashlib
+import itertools
+import threading
+import time
+from typing import Dict, Optional
+
+RETRY_BACKOFF = (30.0, 600.0)  # Attesa (iniziale, massima) prima di riprovare una create() fallita per errore transitorio
+
+
+class GeminiCacheBackend:
+    """Crea/cancella CachedContent reali tramite l'API caches di google-genai."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, model: str, system_instruction: str, ttl_seconds: int) -> str:
+        from google.genai import types
+        cache = self.client.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                display_name="luna-world-prefix",
+                ttl=f"{ttl_seconds}s"
+            )
+        )
+        return cache.name
+
+    def delete(self, name: str):
+        self.client.caches.delete(name=name)
+
+
+class LocalCacheBackend:
+    """
+    Sostituto locale (offline) del servizio di caching: non chiama nessuna API,
+    tiene solo traccia di cosa verrebbe creato/cancellato. Serve a verificare
+    la logica hit/miss/refresh senza rete.
+    """
+
+    def __init__(self, fail: bool = False, fail_code: int = 400):
+        self.fail = fail
+        self.fail_code = fail_code  # 400 = prefisso rifiutato, 5xx/429 = errore transitorio
+        self.created: Dict[str, str] = {}  # name -> system_instruction
+        self.deleted = []
+        self._ids = itertools.count(1)
+
+    def create(self, model: str, system_instruction: str, ttl_seconds: int) -> str:
+        if self.fail:
+            error = RuntimeError(f"{self.fail_code} Cached content not available (local stand-in)")
+            error.code = self.fail_code
+            raise error
+        name = f"cachedContents/local-{next(self._ids)}"
+        self.created[name] = system_instruction
+        return name
+
+    def delete(self, name: str):
+        self.created.pop(name, None)
+        self.deleted.append(name)
+
+
+class ContextCacheManager:
+    """
+    Gestisce il CachedContent del prefisso statico (lore, eventi, regole) di una sessione.
+    La chiave è l'hash di modello + testo statico: cambia solo se cambiano mondo,
+    companion o template. Alla scadenza del TTL il cache viene ricreato.
+    Thread-safe (tentativi in hedging, percorso sync/async, thread dei riassunti):
+    per ogni chiave c'è al massimo una create() in corso, gli altri thread la aspettano.
+    Un rifiuto definitivo (4xx diverso da 408/429, es. prefisso troppo corto) esclude
+    la chiave per tutta la sessione; gli errori transitori (rete, 5xx, quota) vengono
+    riprovati dopo un'attesa crescente, come la verifica dei modelli.
+    """
+
+    def __init__(self, backend, ttl_seconds: int = 3600, refresh_margin: int = 60):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+
+        self._lock = threading.Lock()
+        self._creating: Dict[str, threading.Event] = {}  # Chiave -> create() in corso
+        self._key: Optional[str] = None
+        self._name: Optional[str] = None
+        self._expires_at = 0.0
+        self._failed_key: Optional[str] = None  # Prefisso rifiutato (es. troppo corto): non riprovare
+        self._retry_key: Optional[str] = None  # Chiave fallita per errore transitorio
+        self._retry_at = 0.0  # Prossima create() ammessa per _retry_key (time.time)
+        self._retry_backoff = RETRY_BACKOFF[0]
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _is_rejection(exc: BaseException) -> bool:
+        """True se il servizio ha rifiutato la richiesta in modo definitivo (4xx tranne 408/429)."""
+        code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+        return isinstance(code, int) and 400 <= code < 500 and code not in (408, 429)
+
+    @staticmethod
+    def _make_key(model: str, static_text: str) -> str:
+        return hashlib.sha256(f"{model}\x00{static_text}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, static_text: str) -> Optional[str]:
+        """Nome del CachedContent da usare per questa chiamata, oppure None (niente cache)."""
+        key = self._make_key(model, static_text)
+
+        while True:
+            with self._lock:
+                if key == self._key and self._name and time.time() < self._expires_at - self.refresh_margin:
+                    self.hits += 1
+                    return self._name
+                if key == self._failed_key or (key == self._retry_key and time.time() < self._retry_at):
+                    self.misses += 1
+                    return None
+                pending = self._creating.get(key)
+                if pending is None:
+                    self.misses += 1
+                    pending = self._creating[key] = threading.Event()
+                    stale = self._release()
+                    break
+            pending.wait()  # Stesso prefisso già in creazione su un altro thread: si usa il suo
+
+        self._delete(stale)
+        try:
+            name = self.backend.create(model, static_text, self.ttl_seconds)
+        except Exception as e:
+            with self._lock:
+                if self._is_rejection(e):
+                    print(f"⚠️ [CACHE] Prefisso rifiutato, context cache disattivato: {e}")
+                    self._failed_key = key
+                else:
+                    if key != self._retry_key:
+                        self._retry_key = key
+                        self._retry_backoff = RETRY_BACKOFF[0]
+                    print(f"⚠️ [CACHE] Context cache non disponibile: {e} (nuovo tentativo tra {self._retry_backoff:.0f}s)")
+                    self._retry_at = time.time() + self._retry_backoff
+                    self._retry_backoff = min(self._retry_backoff * 2, RETRY_BACKOFF[1])
+                self._creating.pop(key).set()
+            return None
+
+        with self._lock:
+            replaced = self._release()  # Un'altra chiave creata nel frattempo
+            self._key = key
+            self._name = name
+            self._expires_at = time.time() + self.ttl_seconds
+            if key == self._retry_key:
+                self._retry_key = None
+                self._retry_backoff = RETRY_BACKOFF[0]
+            self._creating.pop(key).set()
+        self._delete(replaced)
+        print(f"🗄️ [CACHE] Prefisso statico in cache: {name}")
+        return name
+
+    def invalidate(self):
+        """Rilascia il cache corrente (es. cambio mondo o chiusura)."""
+        with self._lock:
+            name = self._release()
+        self._delete(name)
+
+    def _release(self) -> Optional[str]:
+        """Dimentica il cache corrente (da chiamare col lock); ritorna il nome da cancellare."""
+        name = self._name
+        self._key = None
+        self._name = None
+        self._expires_at = 0.0
+        return name
+
+    def _delete(self, name: Optional[str]):
+        if name:
+            try:
+                self.backend.delete(name)
+            except Exception:
+                pass
@@ -1,10 +1,10 @@
 # file: media/image_client.py
 import base64
-import requests
 import os
 import time
 from datetime import datetime
 from config.settings import Settings
+from media.registry import ClientRegistry
 
 
 class ImageClient:
@@ -35,7 +35,9 @@ class ImageClient:
         print(f"📡 Connecting to SD Backend: {base_url} ...")
 
         try:
-            response = requests.post(api_url, json=payload, timeout=720)  # Timeout lungo per RunPod
+            # Sessione condivisa: connessione keep-alive riusata tra un'immagine e l'altra
+            session = ClientRegistry.get_instance().http_session(base_url)
+            response = session.post(api_url, json=payload, timeout=720)  # Timeout lungo per RunPod
 
             if response.status_code == 200:
                 r = response.json()
@@ -0,0 +1,458 @@
+# file: media/llm_backends.py
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from config.settings import Settings
+from media.context_cache import ContextCacheManager, GeminiCacheBackend
+
+# Configurazione di emergenza
+HARDCODED_KEY = "INCOLLA_QUI_SOLO_SE_ENV_NON_VA"
+
+# LISTA MODELLI (Priorità: Potenza -> Velocità)
+MODEL_CANDIDATES = [
+    "gemini-3-flash-preview",  # Se hai accesso alla 2.0 Flash
+    "gemini-1.5-pro",
+    "gemini-1.5-flash"
+]
+# Risolto dalla root del progetto (come i save di StateManager), non dalla cartella di lavoro
+MODEL_CACHE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "storage", "cache", "llm_model.json")
+MODEL_CACHE_TTL = 24 * 3600  # Secondi prima di ri-verificare i modelli
+MAX_FAILURES = 3  # Errori consecutivi prima di cercare un altro modello
+PROBE_BACKOFF = (30.0, 600.0)  # Attesa (iniziale, massima) prima di riprovare se nessun modello risponde
+
+MEMORY_ACK = "Memory loaded."
+
+
+class LLMRequest:
+    """
+    Richiesta neutra rispetto al backend: System Prompt (o la coppia prefisso
+    statico / stato dinamico), memoria, history e input del giocatore.
+    Con response_schema il backend chiede output JSON vincolato allo schema.
+    """
+
+    def __init__(self, user_input: str, system_instruction: Optional[str] = None,
+                 history: Optional[List[Dict]] = None, memory_context: str = "",
+                 prompt_parts: Optional[Tuple[str, str]] = None,
+                 temperature: float = 0.9, max_output_tokens: int = 2048,
+                 response_schema: Optional[Dict[str, Any]] = None):
+        self.user_input = user_input
+        self.system_instruction = system_instruction
+        self.history = history or []
+        self.memory_context = memory_context
+        self.prompt_parts = prompt_parts
+        self.temperature = temperature
+        self.max_output_tokens = max_output_tokens
+        self.response_schema = response_schema  # JSON Schema: risposta vincolata a un oggetto JSON
+
+    def messages(self, state_block: Optional[str] = None) -> List[Dict[str, str]]:
+        """Memoria + Storia + (stato dinamico) + Input, come [{"role": "user"|"model", "content"}]."""
+        messages = []
+        if self.memory_context:
+            # Lo passiamo come un messaggio "di sistema" simulato o user pre-prompt
+            messages.append({"role": "user", "content": f"SYSTEM MEMORY LOG:\n{self.memory_context}"})
+            messages.append({"role": "model", "content": MEMORY_ACK})
+        for msg in self.history:
+            messages.append({"role": "user" if msg["role"] == "user" else "model", "content": msg["content"]})
+        if state_block:
+            messages.append({"role": "user", "content": state_block})
+        messages.append({"role": "user", "content": self.user_input})
+        return messages
+
+
+class LLMBackend:
+    """
+    Interfaccia dei backend LLM usati da LLMClient.
+    prepare() costruisce la richiesta una volta sola; generate/stream/astream
+    possono essere chiamati più volte sullo stesso oggetto (retry, hedging).
+    timeout (secondi) è il tempo che resta alla deadline della chiamata: diventa
+    il timeout HTTP, così un tentativo abbandonato non resta appeso oltre la deadline.
+    """
+
+    name = "base"
+
+    @property
+    def model_id(self) -> Optional[str]:
+        return None
+
+    def is_ready(self) -> bool:
+        return self.model_id is not None
+
+    def prepare(self, request: LLMRequest) -> Any:
+        return request
+
+    def generate(self, prepared: Any, timeout: Optional[float] = None) -> str:
+        raise NotImplementedError
+
+    def stream(self, prepared: Any, timeout: Optional[float] = None) -> Iterator[str]:
+        yield self.generate(prepared, timeout)
+
+    async def astream(self, prepared: Any, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        yield await asyncio.to_thread(self.generate, prepared, timeout)
+
+    def report_success(self):
+        pass
+
+    def report_failure(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# --- GEMINI ---
+
+class GeminiBackend(LLMBackend):
+    """google-genai: scelta modello pigra/parallela/persistita e context cache del prefisso statico."""
+
+    name = "gemini"
+
+    def __init__(self):
+        from google import genai
+        from google.genai import types
+        self.types = types
+
+        self.client = None
+        self.context_cache = None  # Cache del prefisso statico del System Prompt
+        self._model_id = None
+        self._next_probe_at = 0.0  # Prima verifica modelli ammessa (time.time)
+        self._probe_backoff = PROBE_BACKOFF[0]
+        self._probe_lock = threading.Lock()
+        self._reprobe_thread: Optional[threading.Thread] = None
+        self._failures = 0
+        self._endpoint = ""  # Hash di endpoint + chiave (vedi _endpoint_key)
+
+        # 1. Recupera la chiave
+        self.api_key = os.getenv("GEMINI_API_KEY")
+
+        if not self.api_key:
+            if "INCOLLA_QUI" not in HARDCODED_KEY:
+                self.api_key = HARDCODED_KEY
+                print("⚠️ .env non letto correttamente: Utilizzo chiave hardcoded.")
+            else:
+                print("❌ ERRORE CRITICO: GEMINI_API_KEY non trovata.")
+                return
+
+        # 2. Inizializzazione Client
+        try:
+            # GEMINI_BASE_URL: endpoint alternativo (proxy o server finto, vedi fakes/)
+            base_url = os.getenv("GEMINI_BASE_URL")
+            self._endpoint = self._endpoint_key(base_url, self.api_key)
+            http_options = types.HttpOptions(base_url=base_url) if base_url else None
+            self.client = genai.Client(api_key=self.api_key, http_options=http_options)
+        except Exception as e:
+            print(f"❌ Errore Inizializzazione Client: {e}")
+            self.client = None
+            return
+
+        if Settings.get_instance().config.get("context_cache", True):
+            self.context_cache = ContextCacheManager(GeminiCacheBackend(self.client))
+        # Il modello viene scelto al primo utilizzo (vedi model_id), non qui:
+        # costruire il backend non costa nessuna chiamata di rete.
+
+    # --- SCELTA MODELLO (pigra, parallela, persistita) ---
+
+    @property
+    def model_id(self) -> Optional[str]:
+        """
+        Modello scelto alla prima richiesta. Se nessun candidato risponde (es. rete
+        assente all'avvio) si riprova alla prima richiesta dopo un backoff esponenziale.
+        """
+        if self._model_id is None and self.client and time.time() >= self._next_probe_at:
+            with self._probe_lock:
+                if self._model_id is None and time.time() >= self._next_probe_at:
+                    self._model_id = self._load_cached_model() or self._probe_models()
+                    if self._model_id is None:
+                        print(f"🔁 [LLM] Nuova verifica modelli tra {self._probe_backoff:.0f}s.")
+                        self._next_probe_at = time.time() + self._probe_backoff
+                        self._probe_backoff = min(self._probe_backoff * 2, PROBE_BACKOFF[1])
+                    else:
+                        self._probe_backoff = PROBE_BACKOFF[0]
+        return self._model_id
+
+    @model_id.setter
+    def model_id(self, value: Optional[str]):
+        self._model_id = value
+
+    @staticmethod
+    def _endpoint_key(base_url: Optional[str], api_key: str) -> str:
+        """Hash di endpoint + chiave: la scelta del modello vale solo per la stessa coppia (mai la chiave in chiaro)."""
+        return hashlib.sha256(f"{base_url or ''}\x00{api_key}".encode("utf-8")).hexdigest()
+
+    def _load_cached_model(self) -> Optional[str]:
+        try:
+            with open(MODEL_CACHE_FILE, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        model = cached.get("model")
+        if cached.get("endpoint") != self._endpoint:
+            return None  # Scelta fatta su un altro endpoint (es. server finto) o con un'altra chiave
+        if model in MODEL_CANDIDATES and time.time() - cached.get("checked_at", 0) < MODEL_CACHE_TTL:
+            print(f"✅ Modello LLM (cache): {model}")
+            return model
+        return None
+
+    def _save_cached_model(self, model: str):
+        try:
+            os.makedirs(os.path.dirname(MODEL_CACHE_FILE), exist_ok=True)
+            with open(MODEL_CACHE_FILE, "w", encoding="utf-8") as f:
+                json.dump({"model": model, "endpoint": self._endpoint, "checked_at": time.time()}, f)
+        except OSError as e:
+            print(f"⚠️ Cache modello non salvata: {e}")
+
+    def _probe_models(self) -> Optional[str]:
+        """Prova tutti i candidati in parallelo; vince il primo in ordine di priorità che risponde."""
+        print("🤖 [LLM Init] Connessione a Gemini...")
+
+        def ping(model_name):
+            self.client.models.generate_content(model=model_name, contents="Test connection")
+            return model_name
+
+        pool = ThreadPoolExecutor(max_workers=len(MODEL_CANDIDATES), thread_name_prefix="llm-probe")
+        futures = [pool.submit(ping, m) for m in MODEL_CANDIDATES]
+        chosen = None
+        try:
+            for future in futures:  # Ordine di priorità, non di arrivo
+                try:
+                    chosen = future.result()
+                    break
+                except Exception:
+                    pass
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        if chosen:
+            print(f"✅ Modello LLM attivato: {chosen}")
+            self._save_cached_model(chosen)
+        else:
+            print("❌ ERRORE: Nessun modello Gemini funzionante trovato.")
+        return chosen
+
+    def report_success(self):
+        self._failures = 0
+
+    def report_failure(self):
+        """Dopo MAX_FAILURES errori consecutivi, ri-verifica i modelli in background."""
+        self._failures += 1
+        if self._failures < MAX_FAILURES or not self.client:
+            return
+        if self._reprobe_thread and self._reprobe_thread.is_alive():
+            return
+        self._failures = 0
+
+        def reprobe():
+            model = self._probe_models()
+            if model:
+                self._model_id = model
+
+        print(f"🔁 [LLM] {MAX_FAILURES} errori consecutivi su {self._model_id}: nuova verifica modelli...")
+        self._reprobe_thread = threading.Thread(target=reprobe, name="llm-reprobe", daemon=True)
+        self._reprobe_thread.start()
+
+    # --- RICHIESTE ---
+
+    def _build_contents(self, messages: List[Dict[str, str]]) -> List:
+        types = self.types
+        return [types.Content(role=m["role"], parts=[types.Part.from_text(text=m["content"])]) for m in messages]
+
+    def prepare(self, request: LLMRequest):
+        """
+        Ritorna (contents, config). Con prompt_parts = (prefisso statico, stato dinamico)
+        il prefisso viene servito dal context cache di Gemini e lo stato dinamico viaggia
+        come messaggio prima dell'input; altrimenti si invia il System Prompt completo.
+        """
+        cache_name = None
+        if request.prompt_parts and self.context_cache:
+            cache_name = self.context_cache.get(self.model_id, request.prompt_parts[0])
+
+        if not cache_name:
+            return (self._build_contents(request.messages()),
+                    self._build_config(request, request.system_instruction))
+
+        contents = self._build_contents(request.messages(state_block=request.prompt_parts[1]))
+        return contents, self._build_config(request, None, cached_content=cache_name)
+
+    def _build_config(self, request: LLMRequest, system_instruction: Optional[str],
+                      cached_content: Optional[str] = None):
+        return self.types.GenerateContentConfig(
+            system_instruction=system_instruction,
+            cached_content=cached_content,
+            temperature=request.temperature,
+            top_p=0.95,
+            top_k=40,
+            max_output_tokens=request.max_output_tokens,
+            response_mime_type="application/json" if request.response_schema else "text/plain",
+            response_json_schema=request.response_schema
+        )
+
+    def _with_timeout(self, config, timeout: Optional[float]):
+        if timeout is None:
+            return config
+        return config.model_copy(update={"http_options": self.types.HttpOptions(timeout=int(timeout * 1000))})
+
+    def generate(self, prepared, timeout: Optional[float] = None) -> str:
+        contents, config = prepared
+        response = self.client.models.generate_content(model=self.model_id, contents=contents,
+                                                       config=self._with_timeout(config, timeout))
+        return response.text
+
+    def stream(self, prepared, timeout: Optional[float] = None) -> Iterator[str]:
+        contents, config = prepared
+        for response in self.client.models.generate_content_stream(
+                model=self.model_id, contents=contents, config=self._with_timeout(config, timeout)):
+            if response.text:
+                yield response.text
+
+    async def astream(self, prepared, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        contents, config = prepared
+        config = self._with_timeout(config, timeout)
+        async for response in await self.client.aio.models.generate_content_stream(
+                model=self.model_id, contents=contents, config=config):
+            if response.text:
+                yield response.text
+
+    def close(self):
+        if self.context_cache:
+            self.context_cache.invalidate()
+
+
+# --- SERVER LOCALE OPENAI-COMPATIBILE (llama.cpp, vLLM, LM Studio, Ollama...) ---
+
+class OpenAICompatBackend(LLMBackend):
+    """
+    /v1/chat/completions di un server locale, in streaming SSE, con connessioni
+    persistenti (sessione HTTP condivisa del ClientRegistry).
+    Con prompt_parts il prefisso statico va nel messaggio di sistema e lo stato
+    dinamico in un messaggio a parte: il prefisso resta identico tra i turni e il
+    server può riusare la sua prompt cache (KV) invece di ri-elaborarlo.
+    """
+
+    name = "openai"
+    TIMEOUT = (5, 300)  # (connessione, lettura) in secondi
+
+    def __init__(self, base_url: Optional[str] = None, model: Optional[str] = None):
+        from media.registry import ClientRegistry
+
+        config = Settings.get_instance().config
+        self.base_url = (base_url or config.get("openai_url", "http://127.0.0.1:8080/v1")).rstrip("/")
+        self._model = model or config.get("openai_model", "local")
+        self.api_key = os.getenv("OPENAI_API_KEY", "")
+        self.http = ClientRegistry.get_instance().http_session(self.base_url)
+        print(f"✅ Modello LLM (server locale): {self._model} @ {self.base_url}")
+
+    @property
+    def model_id(self) -> Optional[str]:
+        return self._model
+
+    def prepare(self, request: LLMRequest) -> Dict[str, Any]:
+        if request.prompt_parts:
+            system, state_block = request.prompt_parts
+        else:
+            system, state_block = request.system_instruction, None
+
+        messages = [{"role": "system", "content": system}] if system else []
+        for m in request.messages(state_block=state_block):
+            messages.append({"role": "assistant" if m["role"] == "model" else "user", "content": m["content"]})
+        payload = {
+            "model": self._model,
+            "messages": messages,
+            "temperature": request.temperature,
+            "top_p": 0.95,
+            "max_tokens": request.max_output_tokens,
+        }
+        if request.response_schema:
+            # llama.cpp converte lo schema in una grammatica: l'output è JSON valido per costruzione
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "turn", "schema": request.response_schema},
+            }
+        return payload
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def _raise_for_status(self, response):
+        if response.status_code >= 400:
+            error = RuntimeError(f"{response.status_code} {response.text[:200]}")
+            error.code = response.status_code  # Letto da request_policy.is_transient
+            raise error
+
+    def _timeout(self, timeout: Optional[float]) -> Tuple[float, float]:
+        connect, read = self.TIMEOUT
+        return (connect, read) if timeout is None else (min(connect, timeout), min(read, timeout))
+
+    def generate(self, prepared: Dict[str, Any], timeout: Optional[float] = None) -> str:
+        response = self.http.post(f"{self.base_url}/chat/completions", json=prepared,
+                                  headers=self._headers(), timeout=self._timeout(timeout))
+        self._raise_for_status(response)
+        return response.json()["choices"][0]["message"].get("content") or ""
+
+    def stream(self, prepared: Dict[str, Any], timeout: Optional[float] = None) -> Iterator[str]:
+        payload = dict(prepared, stream=True)
+        with self.http.post(f"{self.base_url}/chat/completions", json=payload, headers=self._headers(),
+                            timeout=self._timeout(timeout), stream=True) as response:
+            self._raise_for_status(response)
+            # SSE è sempre UTF-8: senza charset nel Content-Type requests userebbe ISO-8859-1
+            for raw in response.iter_lines():
+                line = raw.decode("utf-8")
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                text = (choices[0].get("delta") or {}).get("content")
+                if text:
+                    yield text
+
+    async def astream(self, prepared: Dict[str, Any], timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Lo stream sincrono gira in un thread; i chunk arrivano al loop tramite una coda."""
+        loop = asyncio.get_running_loop()
+        chunks: "asyncio.Queue" = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def pump():
+            try:
+                for text in self.stream(prepared, timeout):
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(chunks.put_nowait, text)
+                loop.call_soon_threadsafe(chunks.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+
+        threading.Thread(target=pump, name="llm-openai-stream", daemon=True).start()
+        try:
+            while True:
+                item = await chunks.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+
+BACKENDS = {
+    GeminiBackend.name: GeminiBackend,
+    OpenAICompatBackend.name: OpenAICompatBackend,
+}
+
+
+def create_backend(name: Optional[str] = None) -> LLMBackend:
+    """Backend scelto in settings.json ("llm_backend": "gemini" | "openai")."""
+    name = name or Settings.get_instance().config.get("llm_backend", "gemini")
+    backend_cls = BACKENDS.get(name)
+    if backend_cls is None:
+        print(f"⚠️ Backend LLM sconosciuto '{name}': uso Gemini.")
+        backend_cls = GeminiBackend
+    return backend_cls()
@@ -1,139 +1,233 @@
 # file: media/llm_client.py
-import os
-import json
+import asyncio
 import re
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Callable, Optional, Tuple
 
 # --- LIBRERIE NECESSARIE ---
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
 
+from config.settings import Settings
+from core.metrics import StageMetrics
+from media.llm_backends import LLMBackend, LLMRequest, create_backend
+from media.request_policy import Attempt, DeadlineExceeded, RequestPolicy
+from media.response_parser import (STRUCTURED_INSTRUCTION, TURN_SCHEMA, ResponseParser,
+                                   StructuredResponseParser, parse_response, parse_structured)
+
 # --- CARICAMENTO .ENV ---
 load_dotenv()
 
-# Configurazione di emergenza
-HARDCODED_KEY = "INCOLLA_QUI_SOLO_SE_ENV_NON_VA"
-
 
 class LLMClient:
-    def __init__(self):
-        # 1. Recupera la chiave
-        self.api_key = os.getenv("GEMINI_API_KEY")
-
-        if not self.api_key:
-            if "INCOLLA_QUI" not in HARDCODED_KEY:
-                self.api_key = HARDCODED_KEY
-                print("⚠️ .env non letto correttamente: Utilizzo chiave hardcoded.")
-            else:
-                print("❌ ERRORE CRITICO: GEMINI_API_KEY non trovata.")
-                self.client = None
-                self.model_id = None
-                return
+    """
+    Client LLM del gioco: politica delle richieste (deadline, retry, hedging),
+    streaming della narrazione e parsing della risposta. La chiamata vera e propria
+    è delegata a un backend (vedi media/llm_backends.py): Gemini oppure un server
+    locale OpenAI-compatibile, scelto con "llm_backend" in settings.json.
+
+    Con structured=True la risposta è un oggetto JSON vincolato a TURN_SCHEMA
+    (narrazione compresa): una sola decodifica invece di narrazione + blocco ```json.
+    """
+
+    def __init__(self, backend: Optional[LLMBackend] = None):
+        self.metrics = StageMetrics.get_instance()
+
+        # Deadline, retry con jitter e hedging delle richieste (vedi media/request_policy.py)
+        config = Settings.get_instance().config
+        self.policy = RequestPolicy(
+            deadline=config.get("llm_deadline", 90.0),
+            max_retries=config.get("llm_retries", 2),
+            hedge=config.get("llm_hedging", False)
+        )
 
-        # 2. Inizializzazione Client
         try:
-            self.client = genai.Client(api_key=self.api_key)
+            self.backend = backend or create_backend()
         except Exception as e:
-            print(f"❌ Errore Inizializzazione Client: {e}")
-            self.client = None
-            return
-
-        self.model_id = None
-
-        # LISTA MODELLI (Priorità: Potenza -> Velocità)
-        candidates = [
-            "gemini-3-flash-preview",  # Se hai accesso alla 2.0 Flash
-            "gemini-1.5-pro",
-            "gemini-1.5-flash"
-        ]
-
-        print("🤖 [LLM Init] Connessione a Gemini...")
-
-        for model_name in candidates:
-            try:
-                self.client.models.generate_content(
-                    model=model_name,
-                    contents="Test connection"
-                )
-                self.model_id = model_name
-                print(f"✅ Modello LLM attivato: {model_name}")
-                break
-            except Exception as e:
-                pass
-
-        if not self.model_id:
-            print("❌ ERRORE: Nessun modello Gemini funzionante trovato.")
+            print(f"❌ Errore Inizializzazione Backend LLM: {e}")
+            self.backend = LLMBackend()
+
+    @property
+    def model_id(self) -> Optional[str]:
+        return self.backend.model_id
+
+    def close(self):
+        self.backend.close()
 
     def generate_response(
             self,
             user_input: str,
             system_instruction: str,
             history: List[Dict],
-            memory_context: str = ""  # <--- NUOVO PARAMETRO per la Memoria
+            memory_context: str = "",  # <--- NUOVO PARAMETRO per la Memoria
+            prompt_parts: Optional[Tuple[str, str]] = None,
+            structured: bool = False
     ) -> Dict[str, Any]:
-        """Invia il contesto a Gemini e parsa la risposta."""
-        if not self.client or not self.model_id:
+        """Invia il contesto al backend LLM e parsa la risposta."""
+        if not self.backend.is_ready():
             return {"text": "Errore: Nessun modello AI connesso.", "visual_en": "", "tags_en": []}
 
-        contents = []
-
-        # A. Iniezione Memoria (Fatti + Riassunti precedenti)
-        if memory_context:
-            # Lo passiamo come un messaggio "di sistema" simulato o user pre-prompt
-            contents.append(types.Content(
-                role="user",
-                parts=[types.Part.from_text(text=f"SYSTEM MEMORY LOG:\n{memory_context}")]
-            ))
-            contents.append(types.Content(
-                role="model",
-                parts=[types.Part.from_text(text="Memory loaded.")]
-            ))
-
-        # B. Storia Recente
-        for msg in history:
-            role = "user" if msg['role'] == 'user' else "model"
-            contents.append(types.Content(role=role, parts=[types.Part.from_text(text=msg['content'])]))
-
-        # C. Input Attuale
-        contents.append(types.Content(role="user", parts=[types.Part.from_text(text=user_input)]))
-
-        # Configurazione
-        config = types.GenerateContentConfig(
-            system_instruction=system_instruction,
-            temperature=0.9,
-            top_p=0.95,
-            top_k=40,
-            max_output_tokens=2048,
-            response_mime_type="text/plain"
-        )
+        prepared = self.backend.prepare(self._request(user_input, system_instruction, history,
+                                                      memory_context, prompt_parts, structured))
+        started = time.perf_counter()
 
-        try:
-            response = self.client.models.generate_content(
-                model=self.model_id,
-                contents=contents,
-                config=config
-            )
+        def attempt_call(attempt: Attempt) -> str:
+            text = self.backend.generate(prepared, timeout=attempt.remaining())
+            attempt.token()
+            return text
 
-            raw_text = response.text
+        try:
+            raw_text = self.policy.call(attempt_call, kind="full")
             if not raw_text:
                 raise ValueError("Risposta vuota dal modello")
 
-            return self._parse_output(raw_text)
+            self.metrics.record("llm", time.perf_counter() - started)
+            self.backend.report_success()
+            with self.metrics.stage("parse"):
+                return parse_structured(raw_text) if structured else self._parse_output(raw_text)
+
+        except Exception as e:
+            print(f"❌ Errore Generazione LLM ({self.backend.name}): {e}")
+            return self._error_response(e)
+
+    def generate_response_stream(
+            self,
+            user_input: str,
+            system_instruction: str,
+            history: List[Dict],
+            memory_context: str = "",
+            on_chunk: Optional[Callable[[str], None]] = None,
+            prompt_parts: Optional[Tuple[str, str]] = None,
+            structured: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Come generate_response, ma in streaming: la narrazione viene passata a on_chunk
+        man mano che arriva, il blocco JSON viene trattenuto e decodificato appena si chiude.
+        Con l'hedging solo il tentativo che inizia per primo a produrre testo arriva alla UI.
+        """
+        if not self.backend.is_ready():
+            return {"text": "Errore: Nessun modello AI connesso.", "visual_en": "", "tags_en": []}
+
+        prepared = self.backend.prepare(self._request(user_input, system_instruction, history,
+                                                      memory_context, prompt_parts, structured))
+        started = time.perf_counter()
+
+        def attempt_stream(attempt: Attempt) -> str:
+            parser = self._parser(self._owned_output(attempt, on_chunk), structured)
+            for text in self.backend.stream(prepared, timeout=attempt.remaining()):
+                attempt.check()
+                attempt.token()
+                parser.feed(text)
+            attempt.check()
+            return parser
+
+        try:
+            parser = self.policy.call(attempt_stream, kind="stream")
+            if not parser.raw:
+                raise ValueError("Risposta vuota dal modello")
+
+            self.metrics.record("llm", time.perf_counter() - started)
+            self.backend.report_success()
+            with self.metrics.stage("parse"):
+                return parser.finish()
+
+        except Exception as e:
+            print(f"❌ Errore Streaming LLM ({self.backend.name}): {e}")
+            return self._error_response(e)
+
+    async def agenerate_response(
+            self,
+            user_input: str,
+            system_instruction: str,
+            history: List[Dict],
+            memory_context: str = "",
+            on_chunk: Optional[Callable[[str], None]] = None,
+            prompt_parts: Optional[Tuple[str, str]] = None,
+            structured: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Versione asyncio di generate_response_stream: non occupa il loop durante
+        l'attesa del backend ed è annullabile dal task che la esegue.
+        Scelta del modello e creazione del context cache sono chiamate di rete
+        sincrone: girano in un thread, non sul loop (SD/TTS/video vanno avanti).
+        """
+        if not await asyncio.to_thread(self.backend.is_ready):
+            return {"text": "Errore: Nessun modello AI connesso.", "visual_en": "", "tags_en": []}
+
+        prepared = await asyncio.to_thread(
+            self.backend.prepare,
+            self._request(user_input, system_instruction, history, memory_context, prompt_parts, structured)
+        )
+        started = time.perf_counter()
+
+        async def attempt_stream(attempt: Attempt) -> str:
+            parser = self._parser(self._owned_output(attempt, on_chunk), structured)
+            async for text in self.backend.astream(prepared, timeout=attempt.remaining()):
+                attempt.check()
+                attempt.token()
+                parser.feed(text)
+            attempt.check()
+            return parser
+
+        try:
+            parser = await self.policy.acall(attempt_stream, kind="stream")
+            if not parser.raw:
+                raise ValueError("Risposta vuota dal modello")
+
+            self.metrics.record("llm", time.perf_counter() - started)
+            self.backend.report_success()
+            with self.metrics.stage("parse"):
+                return parser.finish()
 
         except Exception as e:
-            print(f"❌ Errore Generazione Gemini: {e}")
-            return {
-                "text": "La connessione neurale è instabile... (Errore API)",
-                "visual_en": "",
-                "tags_en": []
-            }
+            print(f"❌ Errore Streaming LLM ({self.backend.name}, async): {e}")
+            return self._error_response(e)
+
+    @staticmethod
+    def _request(user_input: str, system_instruction: Optional[str], history: List[Dict],
+                 memory_context: str, prompt_parts: Optional[Tuple[str, str]],
+                 structured: bool) -> LLMRequest:
+        """In modalità structured l'istruzione di formato va nel prefisso statico (resta in cache)."""
+        if not structured:
+            return LLMRequest(user_input, system_instruction, history, memory_context, prompt_parts)
+        if system_instruction:
+            system_instruction += STRUCTURED_INSTRUCTION
+        if prompt_parts:
+            prompt_parts = (prompt_parts[0] + STRUCTURED_INSTRUCTION, prompt_parts[1])
+        return LLMRequest(user_input, system_instruction, history, memory_context, prompt_parts,
+                          response_schema=TURN_SCHEMA)
+
+    @staticmethod
+    def _parser(on_narration: Optional[Callable[[str], None]], structured: bool):
+        return StructuredResponseParser(on_narration) if structured else ResponseParser(on_narration)
+
+    @staticmethod
+    def _owned_output(attempt: Attempt, on_chunk: Optional[Callable[[str], None]]) -> Optional[Callable[[str], None]]:
+        """on_chunk filtrato: il primo tentativo che emette testo se lo aggiudica, gli altri vengono annullati."""
+        if on_chunk is None:
+            return None
+
+        def emit(text: str):
+            if attempt.claim():
+                on_chunk(text)
+            else:
+                attempt.check()
+
+        return emit
+
+    def _error_response(self, error: Exception) -> Dict[str, Any]:
+        self.backend.report_failure()
+        reason = "timeout" if isinstance(error, DeadlineExceeded) else None
+        return {
+            "text": f"La connessione neurale è instabile... (Errore API{': ' + reason if reason else ''})",
+            "visual_en": "",
+            "tags_en": []
+        }
 
     def summarize_history(self, messages: List[Dict]) -> str:
         """
         Crea un riassunto ESTREMAMENTE CONCISO focalizzato solo sugli eventi chiave.
         """
-        if not self.client: return "Dati persi."
+        if not self.backend.is_ready(): return "Dati persi."
 
         # 1. Preparazione del testo pulito (senza JSON)
         txt_block = ""
@@ -162,48 +256,33 @@ class LLMClient:
         )
 
         try:
-            response = self.client.models.generate_content(
-                model=self.model_id,
-                contents=prompt
-            )
-            return response.text.strip()
+            return self.backend.generate(self.backend.prepare(LLMRequest(prompt))).strip()
         except Exception as e:
             print(f"Summary Error: {e}")
             return "Riassunto non disponibile."
 
-    def _parse_output(self, raw_text: str) -> Dict[str, Any]:
-        result = {
-            "text": raw_text,
-            "visual_en": "",
-            "tags_en": [],
-            "updates": {}
-        }
+    def summarize_chapter(self, summaries: List[str]) -> str:
+        """Fonde riassunti consecutivi in un unico "capitolo" (roll-up gerarchico della memoria)."""
+        if not self.backend.is_ready(): return ""
+
+        entries = "\n".join(f"- {s}" for s in summaries)
+        prompt = (
+            "Questi sono riassunti consecutivi di una partita di gioco di ruolo (RPG), in ordine cronologico.\n"
+            "Fondili in UN SOLO riassunto di capitolo.\n"
+            "ISTRUZIONI:\n"
+            "1. Conserva SOLO: decisioni chiave, luoghi, fatti importanti, NPC incontrati, cambi nelle relazioni.\n"
+            "2. Scrivi in ITALIANO, terza persona, massimo 4 frasi.\n"
+            "3. Non aggiungere nulla che non sia nei riassunti.\n\n"
+            f"RIASSUNTI:\n{entries}"
+        )
+
+        try:
+            return self.backend.generate(self.backend.prepare(LLMRequest(prompt))).strip()
+        except Exception as e:
+            print(f"Chapter Summary Error: {e}")
+            return ""
 
-        # Pulizia preliminare: a volte Gemini mette caratteri invisibili
-        raw_text = raw_text.strip()
-
-        # Cerchiamo il JSON con una logica più robusta
-        json_match = re.search(r"\{.*\}", raw_text, re.DOTALL)
-
-        if json_match:
-            json_str = json_match.group(0)
-            # Rimuoviamo il JSON dal testo narrativo per pulire la chat
-            result["text"] = raw_text.replace(json_match.group(0), "").replace("```json", "").replace("```", "").strip()
-
-            try:
-                # Tentativo di caricamento
-                data = json.loads(json_str)
-                result["visual_en"] = data.get("visual_en", "")
-                result["tags_en"] = data.get("tags_en", [])
-                result["updates"] = data.get("updates", {})
-            except json.JSONDecodeError:
-                # Se fallisce, proviamo a chiudere forzatamente le parentesi (fix comune)
-                try:
-                    data = json.loads(json_str + "}")
-                    result["visual_en"] = data.get("visual_en", "")
-                    result["tags_en"] = data.get("tags_en", [])
-                    result["updates"] = data.get("updates", {})
-                except:
-                    print("⚠️ JSON irrecuperabile: Risposta salvata come solo testo.")
-
-        return result
\ No newline at end of file
+    @staticmethod
+    def _parse_output(raw_text: str) -> Dict[str, Any]:
+        """Narrazione + blocco JSON validato (vedi media/response_parser.py)."""
+        return parse_response(raw_text)
@@ -0,0 +1,141 @@
+# file: media/registry.py
+import atexit
+import threading
+from typing import Any, Callable, Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ClientRegistry:
+    """
+    Registro unico (per processo) dei client media: LLM, SD, TTS e ComfyUI.
+    Ogni client viene costruito una volta sola e condiviso tra i thread; le chiamate
+    HTTP usano sessioni persistenti (keep-alive) per host, così SD su :7860, i proxy
+    RunPod e ComfyUI su :8188 non rifanno TCP/TLS a ogni richiesta.
+    Dopo shutdown() il registro è chiuso: get() e http_session() sollevano RuntimeError.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    POOL_CONNECTIONS = 4
+    POOL_MAXSIZE = 8
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clients: Dict[str, Any] = {}
+        self._creating: Dict[str, threading.Event] = {}  # Client in costruzione (factory fuori dal lock)
+        self._sessions: Dict[str, requests.Session] = {}
+        self._closed = False
+
+    @classmethod
+    def get_instance(cls) -> "ClientRegistry":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                atexit.register(cls._instance.shutdown)
+            return cls._instance
+
+    # --- CLIENT ---
+
+    def get(self, name: str, factory: Callable[[], Any]) -> Any:
+        """
+        Restituisce il client 'name', creandolo con factory() al primo accesso.
+        La factory gira fuori dal lock (può fare I/O o chiedere altri client al registro);
+        chi chiede lo stesso client nel frattempo aspetta la stessa costruzione.
+        """
+        while True:
+            with self._lock:
+                self._check_open()
+                if name in self._clients:
+                    return self._clients[name]
+                pending = self._creating.get(name)
+                if pending is None:
+                    self._creating[name] = threading.Event()
+                    break
+            pending.wait()  # Costruito da un altro thread: al prossimo giro è in _clients
+
+        try:
+            client = factory()
+        except Exception:
+            with self._lock:
+                self._creating.pop(name).set()
+            raise
+
+        with self._lock:
+            self._creating.pop(name).set()
+            closed = self._closed
+            if not closed:
+                self._clients[name] = client
+        if closed:
+            # shutdown() arrivato durante la costruzione: il client non va consegnato
+            self._close_clients({name: client})
+            self._check_open()
+        return client
+
+    def _check_open(self):
+        if self._closed:
+            raise RuntimeError("ClientRegistry chiuso (shutdown già eseguito)")
+
+    def llm(self):
+        from media.llm_client import LLMClient
+        return self.get("llm", LLMClient)
+
+    def imager(self):
+        from media.image_client import ImageClient
+        return self.get("image", ImageClient)
+
+    def audio(self):
+        from media.audio_client import AudioClient
+        return self.get("audio", AudioClient)
+
+    def video(self):
+        from media.video_client import VideoClient
+        return self.get("video", VideoClient)
+
+    # --- HTTP ---
+
+    def http_session(self, base_url: str) -> requests.Session:
+        """Sessione HTTP con pool di connessioni, una per schema+host+porta."""
+        parts = urlsplit(base_url)
+        key = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            self._check_open()
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.POOL_CONNECTIONS, pool_maxsize=self.POOL_MAXSIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[key] = session
+            return session
+
+    # --- CHIUSURA ---
+
+    def shutdown(self):
+        """Chiusura ordinata: ferma l'audio, rilascia il context cache, chiude le connessioni."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            clients, self._clients = self._clients, {}
+            sessions, self._sessions = self._sessions, {}
+
+        self._close_clients(clients)
+        for session in sessions.values():
+            session.close()
+
+    @staticmethod
+    def _close_clients(clients: Dict[str, Any]):
+        audio = clients.get("audio")
+        if audio:
+            try:
+                audio.stop_all()
+            except Exception:
+                pass
+
+        llm = clients.get("llm")
+        if llm:
+            llm.close()
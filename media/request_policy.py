@@ -0,0 +1,298 @@
+# file: media/request_policy.py
+import asyncio
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from core.metrics import percentile
+
+# Codici HTTP per cui ha senso riprovare (sovraccarico, rate limit, errori del server)
+TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+# Eccezioni di rete di httpx/requests/urllib3, riconosciute per nome (niente import opzionali)
+TRANSIENT_NAMES = ("Timeout", "ConnectError", "ConnectionError", "RemoteProtocolError", "ReadError")
+
+
+class DeadlineExceeded(TimeoutError):
+    """La chiamata ha superato la deadline complessiva (retry e hedging compresi)."""
+
+
+class AttemptCancelled(Exception):
+    """Il tentativo è stato scartato perché un altro ha già vinto."""
+
+
+def is_transient(exc: BaseException) -> bool:
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    if isinstance(code, int):
+        return code in TRANSIENT_CODES
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    return any(name in type(exc).__name__ for name in TRANSIENT_NAMES)
+
+
+class Attempt:
+    """
+    Un singolo tentativo dentro una gara (primario o hedge).
+    Il codice che esegue la richiesta chiama token() al primo chunk ricevuto,
+    claim() prima di mostrare output all'utente e controlla cancelled tra un chunk e l'altro.
+    remaining() è il timeout HTTP da dare al backend: un tentativo sincrono abbandonato
+    (il thread non si può interrompere) tiene aperta la sua richiesta al massimo fino
+    alla deadline, poi il client HTTP la chiude.
+    """
+
+    def __init__(self, race: "_Race", index: int, hedge: bool):
+        self.race = race
+        self.index = index
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.cancelled = threading.Event()
+        self.first_token = threading.Event()
+
+    def token(self):
+        if not self.first_token.is_set():
+            self.first_token.set()
+            self.race.policy.observe(self.race.kind, time.monotonic() - self.started)
+
+    def claim(self) -> bool:
+        """True se questo tentativo possiede l'uscita (streaming verso la UI); gli altri vengono annullati."""
+        return self.race.claim(self)
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise AttemptCancelled()
+
+    def remaining(self) -> float:
+        """Secondi alla deadline della chiamata (minimo 1: il client HTTP non accetta 0)."""
+        return max(1.0, self.race.deadline_at - time.monotonic())
+
+
+class _Race:
+    def __init__(self, policy: "RequestPolicy", kind: str, deadline_at: float):
+        self.policy = policy
+        self.kind = kind
+        self.deadline_at = deadline_at
+        self.attempts: List[Attempt] = []
+        self.owner: Optional[Attempt] = None
+        self._lock = threading.Lock()
+
+    def new_attempt(self, hedge: bool) -> Attempt:
+        attempt = Attempt(self, len(self.attempts), hedge)
+        self.attempts.append(attempt)
+        return attempt
+
+    def claim(self, attempt: Attempt) -> bool:
+        with self._lock:
+            if self.owner is None and not attempt.cancelled.is_set():
+                self.owner = attempt
+                self.cancel_others(attempt)
+            return self.owner is attempt
+
+    def cancel_others(self, winner: Optional[Attempt]):
+        for other in self.attempts:
+            if other is not winner:
+                other.cancelled.set()
+
+    def any_token(self) -> bool:
+        return any(a.first_token.is_set() for a in self.attempts)
+
+
+class RequestPolicy:
+    """
+    Politica delle richieste LLM:
+      - deadline complessiva per chiamata;
+      - retry con backoff esponenziale e jitter sugli errori transitori
+        (mai dopo che parte della risposta è già stata mostrata);
+      - hedging (opzionale, spento di default: costa una seconda chiamata a
+        pagamento): se il primo tentativo non produce il primo token entro il p95
+        storico (o hedge_default_delay finché i campioni sono pochi) parte un
+        secondo tentativo identico; vince chi termina (o inizia lo streaming) per primo.
+    """
+
+    def __init__(self, deadline: float = 90.0, max_retries: int = 2, backoff_base: float = 0.5,
+                 backoff_max: float = 4.0, hedge: bool = False, hedge_default_delay: float = 15.0,
+                 hedge_min_delay: float = 1.0, hedge_percentile: float = 95, min_samples: int = 20,
+                 seed: Optional[int] = None):
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self.stats = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "deadlines": 0}
+
+    # --- STATISTICHE ---
+
+    def observe(self, kind: str, seconds: float):
+        """Registra la latenza del primo token (o della risposta intera, se non in streaming)."""
+        with self._lock:
+            self._samples.setdefault(kind, deque(maxlen=200)).append(seconds)
+
+    def hedge_delay(self, kind: str) -> Optional[float]:
+        if not self.hedge:
+            return None
+        with self._lock:
+            samples = sorted(self._samples.get(kind, ()))
+        if len(samples) < self.min_samples:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, percentile(samples, self.hedge_percentile))
+
+    def backoff(self, retry: int) -> float:
+        """Full jitter: uniforme in [0, min(max, base * 2^retry)]."""
+        with self._lock:
+            return self._rng.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** retry)))
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    # --- ESECUZIONE (thread) ---
+
+    def call(self, fn: Callable[[Attempt], Any], kind: str = "default") -> Any:
+        """Esegue fn(attempt) in thread separati secondo la politica. Solleva l'ultimo errore."""
+        self._count("calls")
+        deadline_at = time.monotonic() + self.deadline
+        retry = 0
+        while True:
+            race = _Race(self, kind, deadline_at)
+            try:
+                return self._race(race, fn, deadline_at)
+            except DeadlineExceeded:
+                self._count("deadlines")
+                raise
+            except Exception as e:
+                wait = self._retry_wait(race, e, retry, deadline_at)
+                if wait is None:
+                    raise
+                retry += 1
+                time.sleep(wait)
+
+    def _retry_wait(self, race: _Race, error: Exception, retry: int, deadline_at: float) -> Optional[float]:
+        if race.owner is not None or retry >= self.max_retries or not is_transient(error):
+            return None
+        wait = self.backoff(retry)
+        if time.monotonic() + wait >= deadline_at:
+            return None
+        self._count("retries")
+        print(f"🔁 [LLM] Errore transitorio ({error}), nuovo tentativo tra {wait:.1f}s")
+        return wait
+
+    def _race(self, race: _Race, fn: Callable[[Attempt], Any], deadline_at: float) -> Any:
+        results: "queue.Queue" = queue.Queue()
+
+        def launch(hedge: bool):
+            attempt = race.new_attempt(hedge)
+
+            def run():
+                try:
+                    results.put((attempt, fn(attempt), None))
+                except BaseException as e:
+                    results.put((attempt, None, e))
+
+            # Daemon: un tentativo abbandonato non deve bloccare la chiusura del programma
+            threading.Thread(target=run, name=f"llm-attempt-{attempt.index}", daemon=True).start()
+
+        delay = self.hedge_delay(race.kind)
+        hedge_at = time.monotonic() + delay if delay is not None else None
+        launch(False)
+        pending, error = 1, None
+
+        while pending:
+            now = time.monotonic()
+            wake = deadline_at if hedge_at is None else min(deadline_at, hedge_at)
+            try:
+                attempt, value, exc = results.get(timeout=max(0.0, wake - now))
+            except queue.Empty:
+                if time.monotonic() >= deadline_at:
+                    race.cancel_others(None)
+                    raise DeadlineExceeded(f"deadline di {self.deadline:g}s superata")
+                hedge_at = None
+                if not race.any_token():
+                    self._count("hedges")
+                    print(f"🐢 [LLM] Nessun token dopo {delay:.1f}s: parte una richiesta di riserva")
+                    launch(True)
+                    pending += 1
+                continue
+
+            pending -= 1
+            if exc is None and not attempt.cancelled.is_set():
+                race.cancel_others(attempt)
+                if attempt.hedge:
+                    self._count("hedge_wins")
+                return value
+            if not isinstance(exc, AttemptCancelled) and error is None:
+                error = exc
+
+        raise error or AttemptCancelled()
+
+    # --- ESECUZIONE (asyncio) ---
+
+    async def acall(self, fn: Callable[[Attempt], Awaitable[Any]], kind: str = "default") -> Any:
+        """Come call(), con i tentativi come task asyncio (annullabili davvero)."""
+        self._count("calls")
+        deadline_at = time.monotonic() + self.deadline
+        retry = 0
+        while True:
+            race = _Race(self, kind, deadline_at)
+            try:
+                return await self._arace(race, fn, deadline_at)
+            except DeadlineExceeded:
+                self._count("deadlines")
+                raise
+            except Exception as e:
+                wait = self._retry_wait(race, e, retry, deadline_at)
+                if wait is None:
+                    raise
+                retry += 1
+                await asyncio.sleep(wait)
+
+    async def _arace(self, race: _Race, fn: Callable[[Attempt], Awaitable[Any]], deadline_at: float) -> Any:
+        tasks: Dict[asyncio.Future, Attempt] = {}
+
+        def launch(hedge: bool):
+            attempt = race.new_attempt(hedge)
+            tasks[asyncio.ensure_future(fn(attempt))] = attempt
+
+        delay = self.hedge_delay(race.kind)
+        hedge_at = time.monotonic() + delay if delay is not None else None
+        launch(False)
+        error = None
+
+        try:
+            while tasks:
+                wake = deadline_at if hedge_at is None else min(deadline_at, hedge_at)
+                done, _ = await asyncio.wait(list(tasks), timeout=max(0.0, wake - time.monotonic()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if time.monotonic() >= deadline_at:
+                        raise DeadlineExceeded(f"deadline di {self.deadline:g}s superata")
+                    hedge_at = None
+                    if not race.any_token():
+                        self._count("hedges")
+                        print(f"🐢 [LLM] Nessun token dopo {delay:.1f}s: parte una richiesta di riserva")
+                        launch(True)
+                    continue
+
+                for task in done:
+                    attempt = tasks.pop(task)
+                    if task.cancelled():
+                        continue
+                    exc = task.exception()
+                    if exc is None and not attempt.cancelled.is_set():
+                        if attempt.hedge:
+                            self._count("hedge_wins")
+                        return task.result()
+                    if exc is not None and not isinstance(exc, AttemptCancelled) and error is None:
+                        error = exc
+            raise error or AttemptCancelled()
+        finally:
+            for task, attempt in tasks.items():
+                attempt.cancelled.set()
+                task.cancel()
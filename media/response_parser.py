@@ -0,0 +1,535 @@
+# file: media/response_parser.py
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Chiavi che identificano il blocco tecnico del turno (vedi prompts/system_prompt.txt)
+TURN_KEYS = ("visual_en", "tags_en", "updates")
+
+_FENCE = "```"
+_JSON_TOKEN = re.compile(r'[{}\[\]",:]')  # Caratteri strutturali fuori dalle stringhe
+_STRING_TOKEN = re.compile(r'["\\]')  # Dentro una stringa contano solo " e \
+_NOT_SPACE = re.compile(r"\S")
+
+# Stati dello scanner
+NARRATION, FENCE_INFO, FENCE_BODY, JSON_BLOCK, AFTER_JSON, TAIL = range(6)
+
+
+class ResponseParser:
+    """
+    Parser incrementale della risposta del GM: narrazione italiana + blocco JSON
+    (con o senza ```json). Ogni carattere viene esaminato una volta sola mentre i
+    chunk arrivano: la narrazione è inoltrata subito a on_narration, il blocco
+    JSON viene trattenuto, riconosciuto dal bilanciamento di parentesi e stringhe
+    (le graffe dentro la narrazione o dentro le stringhe JSON non lo confondono)
+    e decodificato appena si chiude. finish() ripara i troncamenti e valida i campi.
+    """
+
+    def __init__(self, on_narration: Optional[Callable[[str], None]] = None):
+        self.on_narration = on_narration
+        self.state = NARRATION
+        self._raw: List[str] = []
+        self._narration: List[str] = []
+        self._pending = ""  # Coda non ancora classificabile (es. "`" o "{" a fine chunk)
+
+        # Blocco JSON in corso
+        self._json: List[str] = []
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._boundary: Optional[Tuple[int, Tuple[str, ...], str]] = None  # (offset, stack, token)
+        self._json_len = 0
+        self._fence_open = False
+        self._in_code = False  # Dentro un blocco ``` senza JSON: il prossimo ``` lo chiude
+
+        self.data: Optional[Dict[str, Any]] = None  # Blocco decodificato (se trovato)
+        self.repaired = False
+
+    # --- INGRESSO ---
+
+    @property
+    def raw(self) -> str:
+        return "".join(self._raw)
+
+    def feed(self, chunk: str):
+        if not chunk:
+            return
+        self._raw.append(chunk)
+        text, self._pending = self._pending + chunk, ""
+        pos = 0
+        while pos < len(text):
+            if self.state == NARRATION or self.state == TAIL:
+                pos = self._scan_narration(text, pos)
+            elif self.state == FENCE_INFO:
+                newline = text.find("\n", pos)
+                close = text.find(_FENCE, pos)
+                if close >= 0 and (newline < 0 or close < newline):
+                    # ```codice``` sulla stessa riga: il contenuto resta narrazione
+                    self._emit(text[pos:close])
+                    self._fence_open = False
+                    self.state = NARRATION
+                    pos = close + 3
+                    continue
+                if newline < 0:
+                    self._pending = text[pos:]
+                    return
+                pos = newline + 1
+                self.state = FENCE_BODY
+            elif self.state == FENCE_BODY:
+                match = _NOT_SPACE.search(text, pos)
+                if not match:
+                    return
+                pos = match.start()
+                if text[pos] == "{":
+                    self._start_json()
+                else:
+                    # Blocco ``` che non contiene JSON: torna narrazione (senza i backtick)
+                    self._fence_open = False
+                    self._in_code = True
+                    self.state = NARRATION
+            elif self.state == JSON_BLOCK:
+                pos = self._scan_json(text, pos)
+            else:  # AFTER_JSON: solo la chiusura ``` (se c'era l'apertura) prima della coda narrativa
+                match = _NOT_SPACE.search(text, pos)
+                if not match:
+                    return
+                pos = match.start()
+                if self._fence_open and text.startswith("`", pos):
+                    if len(text) - pos < 3 and _FENCE.startswith(text[pos:]):
+                        self._pending = text[pos:]
+                        return
+                    if text.startswith(_FENCE, pos):
+                        pos += 3
+                self._fence_open = False
+                self.state = TAIL
+
+    def _emit(self, piece: str):
+        if not piece:
+            return
+        self._narration.append(piece)
+        if self.on_narration:
+            self.on_narration(piece)
+
+    def _scan_narration(self, text: str, pos: int) -> int:
+        """Inoltra la narrazione fino al prossimo possibile inizio di blocco (``` oppure {")."""
+        length = len(text)
+        next_tick = text.find("`", pos)
+        next_brace = text.find("{", pos) if self.state == NARRATION else -1
+        while True:
+            if next_tick < 0 and next_brace < 0:
+                self._emit(text[pos:])
+                return length
+            if next_brace < 0 or 0 <= next_tick < next_brace:
+                i = next_tick
+                if text.startswith(_FENCE, i) and self.state == NARRATION and self._in_code:
+                    # Chiusura del blocco di codice: si prosegue con la narrazione
+                    self._emit(text[pos:i])
+                    self._in_code = False
+                    return i + 3
+                if text.startswith(_FENCE, i) and self.state == NARRATION:
+                    self._emit(text[pos:i])
+                    self._fence_open = True
+                    self.state = FENCE_INFO
+                    return i + 3
+                if length - i < 3 and text[i:] == "`" * (length - i):
+                    # Possibile ``` spezzato tra due chunk
+                    self._emit(text[pos:i])
+                    self._pending = text[i:]
+                    return length
+                next_tick = text.find("`", i + 1)
+            else:
+                i = next_brace
+                match = _NOT_SPACE.search(text, i + 1)
+                if not match:
+                    self._emit(text[pos:i])
+                    self._pending = text[i:]
+                    return length
+                if text[match.start()] == '"':
+                    self._emit(text[pos:i])
+                    self._fence_open = False
+                    self._start_json()
+                    return i
+                next_brace = text.find("{", i + 1)
+
+    def _start_json(self):
+        self.state = JSON_BLOCK
+        self._json = []
+        self._json_len = 0
+        self._stack = []
+        self._in_string = self._escape = False
+        self._boundary = None
+
+    def _scan_json(self, text: str, pos: int) -> int:
+        start = pos
+        length = len(text)
+        while pos < length:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    pos += 1
+                    continue
+                match = _STRING_TOKEN.search(text, pos)
+                if not match:
+                    pos = length
+                    break
+                pos = match.end()
+                if match.group() == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                continue
+
+            match = _JSON_TOKEN.search(text, pos)
+            if not match:
+                pos = length
+                break
+            char, pos = match.group(), match.end()
+            if char == '"':
+                self._in_string = True
+                continue
+            if char in "{[":
+                self._stack.append(char)
+                self._boundary = (self._json_len + pos - start - 1, tuple(self._stack), char)
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if not self._stack:
+                    self._json.append(text[start:pos])
+                    self._close_json()
+                    return pos
+            elif char == ",":
+                self._boundary = (self._json_len + pos - start - 1, tuple(self._stack), char)
+
+        self._json.append(text[start:pos])
+        self._json_len += pos - start
+        return pos
+
+    def _close_json(self):
+        """Blocco bilanciato: se è davvero il JSON del turno lo teniamo, altrimenti torna narrazione."""
+        block = "".join(self._json)
+        try:
+            data = json.loads(block)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and any(k in data for k in TURN_KEYS) and self.data is None:
+            self.data = data
+            self.state = AFTER_JSON
+        else:
+            self._emit(block)
+            self.state = NARRATION if self.data is None else TAIL
+        self._json = []
+
+    # --- CHIUSURA ---
+
+    def finish(self) -> Dict[str, Any]:
+        """Chiude lo stream: ripara un eventuale blocco troncato e restituisce il turno validato."""
+        if self._pending and self.state in (NARRATION, TAIL, FENCE_INFO):
+            self._emit(self._pending)
+        self._pending = ""
+
+        if self.state == JSON_BLOCK:
+            block = "".join(self._json)
+            data = repair_json(block, self._stack, self._in_string, self._boundary)
+            if data is not None and any(k in data for k in TURN_KEYS):
+                self.data = data
+                self.repaired = True
+            else:
+                print("⚠️ JSON irrecuperabile: Risposta salvata come solo testo.")
+            self.state = TAIL
+
+        text = "".join(self._narration).strip()
+        if self.data is None:
+            return {"text": text or self.raw, "visual_en": "", "tags_en": [], "updates": {}}
+
+        turn, problems = validate_turn(self.data)
+        if problems:
+            print(f"⚠️ [PARSER] Campi corretti: {'; '.join(problems)}")
+        turn["text"] = text
+        return turn
+
+
+def parse_response(raw_text: str) -> Dict[str, Any]:
+    """Parsing in un colpo solo di una risposta completa."""
+    parser = ResponseParser()
+    parser.feed(raw_text)
+    return parser.finish()
+
+
+# --- MODALITÀ STRUCTURED OUTPUT (JSON con schema) ---
+
+# Schema della risposta di turno in modalità structured output (JSON Schema).
+# "narration" è la prima proprietà: in streaming arriva per prima ed è inoltrata alla UI.
+TURN_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "narration": {"type": "string", "description": "Narrazione del turno, in italiano."},
+        "visual_en": {"type": "string", "description": "English scene description for the image generator."},
+        "tags_en": {"type": "array", "items": {"type": "string"}},
+        "updates": {
+            "type": "object",
+            "properties": {
+                "location": {"type": "string"},
+                "time_of_day": {"type": "string"},
+                "current_outfit": {"type": "string"},
+                "npc_updates": {
+                    "type": "object",
+                    "additionalProperties": {"type": "object", "properties": {"outfit": {"type": "string"}}},
+                },
+                "affinity_change": {"type": "object", "additionalProperties": {"type": "integer"}},
+                "stat_changes": {"type": "object", "additionalProperties": {"type": "integer"}},
+                "new_fact": {"type": "string"},
+                "add_item": {"type": "string"},
+                "remove_item": {"type": "string"},
+                "gold": {"type": "integer"},
+                "hp": {"type": "integer"},
+                "flags": {"type": "object"},
+            },
+        },
+    },
+    "required": ["narration", "visual_en", "tags_en", "updates"],
+    "propertyOrdering": ["narration", "visual_en", "tags_en", "updates"],
+}
+
+STRUCTURED_INSTRUCTION = (
+    "\n\n### OUTPUT FORMAT OVERRIDE (STRUCTURED MODE)\n"
+    "Ignore the 'narration + ```json block' layout above. Reply with ONE JSON object that matches "
+    "the response schema: the Italian narration goes in \"narration\", the technical data in "
+    "\"visual_en\", \"tags_en\" and \"updates\". No text outside the JSON object."
+)
+
+_NARRATION_KEY = re.compile(r'"narration"\s*:\s*"')
+_ESCAPE = re.compile(r'\\(?:u[0-9a-fA-F]{4}(?:\\u[0-9a-fA-F]{4})?|[^u])')
+
+
+class StructuredResponseParser:
+    """
+    Parser della risposta in modalità structured output: un unico oggetto JSON.
+    Il valore di "narration" viene decodificato e inoltrato a on_narration mentre
+    arriva; il resto passa da ResponseParser (bilanciamento, riparazione, schema).
+    """
+
+    def __init__(self, on_narration: Optional[Callable[[str], None]] = None):
+        self.on_narration = on_narration
+        self._block = ResponseParser()
+        self._seek = ""  # Testo in cui cercare la chiave "narration"
+        self._pending = ""  # Escape non ancora completo a fine chunk
+        self._streaming = False
+        self._done = False
+        self._narration: List[str] = []
+
+    @property
+    def raw(self) -> str:
+        return self._block.raw
+
+    def feed(self, chunk: str):
+        if not chunk:
+            return
+        self._block.feed(chunk)
+        if self._done:
+            return
+        if not self._streaming:
+            self._seek += chunk
+            match = _NARRATION_KEY.search(self._seek)
+            if not match:
+                self._seek = self._seek[-64:]  # Basta una coda: la chiave può essere spezzata tra due chunk
+                return
+            chunk, self._seek = self._seek[match.end():], ""
+            self._streaming = True
+        self._stream_value(self._pending + chunk)
+
+    def _stream_value(self, text: str):
+        self._pending = ""
+        pos = 0
+        while pos < len(text):
+            quote = text.find('"', pos)
+            backslash = text.find("\\", pos)
+            if backslash < 0 or (0 <= quote < backslash):
+                # Nessun escape prima della fine: o chiude la stringa o finisce il chunk
+                self._emit(text[pos:] if quote < 0 else text[pos:quote])
+                self._done = quote >= 0
+                return
+            self._emit(text[pos:backslash])
+            match = _ESCAPE.match(text, backslash)
+            incomplete = not match or (match.group().startswith("\\u") and len(match.group()) == 6
+                                       and 0xD800 <= int(match.group()[2:], 16) < 0xDC00
+                                       and len(text) - backslash < 12)
+            if incomplete:
+                self._pending = text[backslash:]
+                return
+            self._emit(json.loads(f'"{match.group()}"'))
+            pos = match.end()
+
+    def _emit(self, piece: str):
+        if not piece:
+            return
+        self._narration.append(piece)
+        if self.on_narration:
+            self.on_narration(piece)
+
+    def finish(self) -> Dict[str, Any]:
+        turn = self._block.finish()
+        data = self._block.data or {}
+        narration = data.get("narration")
+        if not isinstance(narration, str):
+            # Narrazione troncata (la riparazione scarta le stringhe a metà): vale quella già mostrata
+            narration = "".join(self._narration) if self._streaming else turn["text"]
+        turn["text"] = narration.strip()
+        return turn
+
+
+def parse_structured(raw_text: str) -> Dict[str, Any]:
+    """Risposta structured completa: una sola decodifica JSON; il parser incrementale solo se fallisce."""
+    try:
+        data = json.loads(raw_text)
+    except ValueError:
+        data = None
+    if isinstance(data, dict) and isinstance(data.get("narration"), str):
+        turn, problems = validate_turn(data)
+        if problems:
+            print(f"⚠️ [PARSER] Campi corretti: {'; '.join(problems)}")
+        turn["text"] = data["narration"].strip()
+        return turn
+
+    parser = StructuredResponseParser()
+    parser.feed(raw_text)
+    return parser.finish()
+
+
+# --- RIPARAZIONE ---
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def repair_json(block: str, stack: List[str], in_string: bool,
+                boundary: Optional[Tuple[int, Tuple[str, ...], str]]) -> Optional[Dict]:
+    """
+    Ripara in modo deterministico un blocco JSON troncato, con al massimo due tentativi:
+      1. (fuori da una stringa) completa ":" con null, toglie la "," finale e chiude le parentesi;
+      2. torna all'ultimo confine sicuro (ultima "," o parentesi aperta) e chiude da lì.
+    Una stringa troncata non viene mai chiusa: una location o un outfit a metà
+    sarebbero peggio di un campo mancante.
+    """
+    candidates = []
+    if not in_string:
+        head = block.rstrip()
+        if head.endswith(":"):
+            head += " null"
+        elif head.endswith(","):
+            head = head[:-1]
+        candidates.append(head + "".join(_CLOSERS[c] for c in reversed(stack)))
+
+    if boundary:
+        offset, boundary_stack, token = boundary
+        head = block[:offset] if token == "," else block[:offset + 1]
+        candidates.append(head + "".join(_CLOSERS[c] for c in reversed(boundary_stack)))
+
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+
+# --- SCHEMA ---
+
+_TEXT_UPDATES = ("location", "current_outfit", "time_of_day", "add_item", "remove_item", "new_fact")
+_NUMBER_UPDATES = ("gold", "hp")
+_DELTA_UPDATES = ("affinity_change", "stat_changes")
+
+
+def _as_number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value.strip().lstrip("+"))
+        except ValueError:
+            return None
+    return None
+
+
+def validate_turn(data: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Normalizza visual_en / tags_en / updates ai tipi attesi da engine e state_manager.
+    I valori recuperabili vengono convertiti, gli altri scartati; chiavi sconosciute
+    in updates restano (compatibilità con prompt futuri). Ritorna (turno, problemi).
+    """
+    problems = []
+    # null equivale a campo assente (succede anche dopo la riparazione di un troncamento)
+    data = {k: v for k, v in data.items() if v is not None}
+
+    visual = data.get("visual_en", "")
+    if not isinstance(visual, str):
+        problems.append("visual_en non è testo")
+        visual = "" if visual is None else str(visual)
+
+    tags = data.get("tags_en", [])
+    if isinstance(tags, str):
+        tags = [t.strip() for t in tags.split(",") if t.strip()]
+    elif not isinstance(tags, list):
+        problems.append("tags_en non è una lista")
+        tags = []
+    if any(not isinstance(t, str) for t in tags):
+        problems.append("tags_en con elementi non testuali")
+        tags = [str(t) for t in tags if isinstance(t, (str, int, float)) and not isinstance(t, bool)]
+
+    updates = data.get("updates", {})
+    if not isinstance(updates, dict):
+        problems.append("updates non è un oggetto")
+        updates = {}
+    updates = {k: v for k, v in updates.items() if v is not None}
+
+    for key in _TEXT_UPDATES:
+        if key in updates and updates[key] is not None and not isinstance(updates[key], str):
+            problems.append(f"updates.{key} non è testo")
+            updates[key] = str(updates[key])
+
+    for key in _NUMBER_UPDATES:
+        if key in updates and updates[key] is not None:
+            number = _as_number(updates[key])
+            if number is None:
+                problems.append(f"updates.{key} non è un numero")
+                del updates[key]
+            else:
+                updates[key] = number
+
+    for key in _DELTA_UPDATES:
+        if key not in updates:
+            continue
+        changes = updates[key]
+        if not isinstance(changes, dict):
+            problems.append(f"updates.{key} non è un oggetto")
+            del updates[key]
+            continue
+        clean = {}
+        for name, value in changes.items():
+            if value is None:
+                continue
+            number = _as_number(value)
+            if number is None:
+                problems.append(f"updates.{key}.{name} non è un numero")
+            else:
+                clean[name] = number
+        updates[key] = clean
+
+    if "npc_updates" in updates:
+        npcs = updates["npc_updates"]
+        if not isinstance(npcs, dict):
+            problems.append("updates.npc_updates non è un oggetto")
+            del updates["npc_updates"]
+        else:
+            clean = {name: info for name, info in npcs.items() if isinstance(info, dict)}
+            if len(clean) != len(npcs):
+                problems.append("updates.npc_updates con voci non valide")
+            updates["npc_updates"] = clean
+
+    if "flags" in updates and not isinstance(updates["flags"], dict):
+        problems.append("updates.flags non è un oggetto")
+        del updates["flags"]
+
+    return {"text": "", "visual_en": visual, "tags_en": tags, "updates": updates}, problems
@@ -1,24 +1,28 @@
-import json, os, time, uuid, requests, websocket, gc
+import json, os, time, uuid, websocket, gc
 from config.settings import Settings
-from media.llm_client import LLMClient
+from media.registry import ClientRegistry
 
 
 class VideoClient:
     def __init__(self):
         self.settings = Settings.get_instance()
-        self.llm = LLMClient()
+        registry = ClientRegistry.get_instance()
+        self.llm = registry.llm()  # LLMClient condiviso: niente nuova connessione a Gemini
         self.client_id = str(uuid.uuid4())
         sd_url = self.settings.get_sd_url().rstrip("/")
-        self.comfy_url = sd_url.replace("-7860", "-8188") if "runpod.net" in sd_url else "http://127.0.0.1:8188"
+        self.comfy_url = self.settings.config.get("comfy_url") or (
+            sd_url.replace("-7860", "-8188") if "runpod.net" in sd_url else "http://127.0.0.1:8188")
         self.sd_url = sd_url
+        self.sd_http = registry.http_session(self.sd_url)
+        self.comfy_http = registry.http_session(self.comfy_url)
         self.workflow_path = "wan_gguf_workflow_improved.json"
 
     def _manage_vram(self, action="unload"):
         try:
             endpoint = "unload-checkpoint" if action == "unload" else "reload-checkpoint"
-            requests.post(f"{self.sd_url}/sdapi/v1/{endpoint}", timeout=10)
+            self.sd_http.post(f"{self.sd_url}/sdapi/v1/{endpoint}", timeout=10)
             if action == "unload":
-                requests.post(f"{self.sd_url}/sdapi/v1/free-memory", timeout=10)
+                self.sd_http.post(f"{self.sd_url}/sdapi/v1/free-memory", timeout=10)
                 gc.collect()
                 time.sleep(5)
         except:
@@ -34,7 +38,7 @@ class VideoClient:
                 wf = json.load(f)
 
             with open(image_path, "rb") as f:
-                res = requests.post(f"{self.comfy_url}/upload/image", files={"image": f}).json()
+                res = self.comfy_http.post(f"{self.comfy_url}/upload/image", files={"image": f}).json()
 
             # Patch essenziale
             wf["6"]["inputs"]["image"] = res["name"]
@@ -42,17 +46,17 @@ class VideoClient:
 
             ws = websocket.WebSocket()
             ws.connect(f"{self.comfy_url.replace('http', 'ws')}/ws?clientId={self.client_id}")
-            p_res = requests.post(f"{self.comfy_url}/prompt", json={"prompt": wf, "client_id": self.client_id}).json()
+            p_res = self.comfy_http.post(f"{self.comfy_url}/prompt", json={"prompt": wf, "client_id": self.client_id}).json()
             pid = p_res['prompt_id']
 
             while True:
                 msg = json.loads(ws.recv())
                 if msg.get("type") == "executing" and msg["data"]["node"] is None: break
 
-            hist = requests.get(f"{self.comfy_url}/history/{pid}").json()[pid]
+            hist = self.comfy_http.get(f"{self.comfy_url}/history/{pid}").json()[pid]
             for nid in hist['outputs']:
                 for f in hist['outputs'][nid].get('images', []) + hist['outputs'][nid].get('gifs', []):
-                    raw = requests.get(f"{self.comfy_url}/view", params={"filename": f['filename']}).content
+                    raw = self.comfy_http.get(f"{self.comfy_url}/view", params={"filename": f['filename']}).content
                     path = os.path.join("storage/videos", f"Luna_Video_{int(time.time())}.mp4")
                     os.makedirs("storage/videos", exist_ok=True)
                     with open(path, "wb") as file: file.write(raw)
@@ -5,12 +5,15 @@ import sys
 # Aggiunge la root al path per trovare i moduli
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from core.engine import GameEngine
+# --offline: Gemini, SD, ComfyUI e TTS sono sostituiti dai server finti in fakes/
+OFFLINE = "--offline" in sys.argv
 
 
 def run_test():
     print("🔧 --- INIZIO TEST MOTORE LUNA-RPG v2 ---")
 
+    from core.engine import GameEngine
+
     # 1. Inizializzazione
     print("\n[1] Inizializzazione Engine...")
     try:
@@ -24,10 +27,9 @@ def run_test():
     print("\n[2] Avvio Nuova Partita (Fantasy Dark)...")
     try:
         # Carica il mondo 'fantasy_dark' con companion 'Luna'
-        initial_response = engine.start_new_game("fantasy_dark", "Luna")
-
-        print(f"📝 TESTO INTRO: {initial_response['text'][:100]}...")
-        # print(f"🎨 VISUAL DEBUG: {initial_response['visual_debug']}")
+        engine.start_new_game("fantasy_dark", "Luna")
+        intro = engine.process_turn_llm("", is_intro=True)
+        print(f"📝 TESTO INTRO: {intro['text'][:100]}...")
     except Exception as e:
         print(f"❌ CRITICAL: Errore avvio partita: {e}")
         return
@@ -37,17 +39,24 @@ def run_test():
     print(f"\n[3] Invio Input Utente: \"{user_input}\"")
 
     try:
-        response = engine.generate_turn_response(user_input)
+        response = engine.process_turn_llm(user_input)
 
         print("\n--- RISPOSTA DAL MOTORE ---")
         print(f"🗣️ TESTO: {response['text']}")
-        # print(f"👁️ SCENA (Prompt): {response['visual_debug']}")
+        print(f"👁️ SCENA: {response.get('visual_en', '')}")
 
-        if response['image']:
-            print(f"🖼️ IMMAGINE: Generata in {response['image']}")
+        image = engine.process_image_generation(response.get("visual_en", ""), response.get("tags_en", []))
+        if image:
+            print(f"🖼️ IMMAGINE: Generata in {image}")
         else:
             print("🖼️ IMMAGINE: Non generata (SD Offline o Errore)")
 
+        engine.process_audio(response.get("text", ""))
+
+        if OFFLINE and image:
+            video = engine.clients.video().generate_video(image, response.get("text", ""))
+            print(f"🎬 VIDEO: {video or 'Non generato'}")
+
     except Exception as e:
         print(f"❌ CRITICAL: Errore durante il turno: {e}")
 
@@ -55,4 +64,10 @@ def run_test():
 
 
 if __name__ == "__main__":
-    run_test()
\ No newline at end of file
+    if OFFLINE:
+        from fakes import FakeBackends
+
+        with FakeBackends():
+            run_test()
+    else:
+        run_test()
@@ -0,0 +1,26 @@
+# file: tests/conftest.py
+import os
+import sys
+
+import pytest
+
+# Aggiunge la root al path per trovare i moduli (come test_game.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def _fake_servers():
+    from fakes import FakeBackends
+
+    with FakeBackends() as backends:  # Avvio/arresto una volta sola: lo stop dei server costa ~2s
+        yield backends
+
+
+@pytest.fixture
+def fake_backends(_fake_servers, tmp_path, monkeypatch):
+    """Server finti (fakes/) per il test; la cache del modello LLM va in tmp_path."""
+    from media import llm_backends
+
+    monkeypatch.setattr(llm_backends, "MODEL_CACHE_FILE", str(tmp_path / "llm_model.json"))
+    _fake_servers.configure()
+    return _fake_servers
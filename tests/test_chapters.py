@@ -0,0 +1,55 @@
+# file: tests/test_chapters.py
+import math
+
+import pytest
+
+from core import chapters
+
+ROLLUP_SIZE = 4
+
+
+def simulate(count, size=ROLLUP_SIZE, rollups_per_summary=1):
+    """Come MemoryManager: dopo ogni nuovo riassunto al massimo `rollups_per_summary` roll-up."""
+    summaries, summary_turns, chapter_list = [], [], []
+    worst = 0
+    for i in range(count):
+        summaries.append(f"Riassunto {i}")
+        summary_turns.append([i * 10 + 1, i * 10 + 10])
+        for _ in range(rollups_per_summary):
+            children = chapters.next_rollup(summaries, summary_turns, chapter_list, size)
+            if not children:
+                break
+            chapter_list.append(chapters.make_chapter(children, f"Capitolo {len(chapter_list)}"))
+        worst = max(worst, len(chapters.frontier(summaries, summary_turns, chapter_list)))
+    return summaries, summary_turns, chapter_list, worst
+
+
+@pytest.mark.parametrize("count", [1, 3, 4, 17, 64, 750])
+def test_frontier_covers_every_summary_once(count):
+    summaries, summary_turns, chapter_list, _ = simulate(count)
+    front = chapters.frontier(summaries, summary_turns, chapter_list)
+    assert front[0]["start"] == 0 and front[-1]["end"] == count
+    assert all(a["end"] == b["start"] for a, b in zip(front, front[1:]))
+    assert front[0]["turns"][0] == 1 and front[-1]["turns"][1] == count * 10
+
+
+@pytest.mark.parametrize("count", [64, 750])
+def test_frontier_is_logarithmic(count):
+    *_, worst = simulate(count)
+    levels = math.ceil(math.log(count, ROLLUP_SIZE)) + 1
+    assert worst <= (ROLLUP_SIZE - 1) * levels + 1
+
+
+def test_rollup_takes_oldest_entries_of_lowest_level():
+    summaries = [f"R{i}" for i in range(ROLLUP_SIZE)]
+    children = chapters.next_rollup(summaries, [], [], ROLLUP_SIZE)
+    assert [c["text"] for c in children] == summaries
+    chapter = chapters.make_chapter(children, "Capitolo")
+    assert (chapter["level"], chapter["start"], chapter["end"], chapter["turns"]) == (1, 0, ROLLUP_SIZE, None)
+    assert chapters.next_rollup(summaries, [], [chapter], ROLLUP_SIZE) is None
+
+
+def test_format_entry_labels_chapters():
+    chapter = {"level": 2, "start": 0, "end": 16, "turns": [1, 160], "text": "Molte cose."}
+    assert chapters.format_entry(chapter) == "[Capitolo L2, turni 1-160] Molte cose."
+    assert chapters.format_entry(chapters.summary_entry(["Uno"], [], 0)) == "Uno"
@@ -0,0 +1,90 @@
+# file: tests/test_context_assembler.py
+from core.context_assembler import ContextAssembler, estimate_tokens
+
+SYSTEM = "S" * 400  # 101 token
+PLAYER = "Apro la porta."
+
+
+def make_history(turns, size=40):
+    """turns coppie giocatore/narratore; ogni messaggio costa size // 4 + 1 token."""
+    history = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"{turn:03d}".ljust(size, "u")})
+        history.append({"role": "model", "content": f"{turn:03d}".ljust(size, "m")})
+    return history
+
+
+class Memory:
+    """memory_builder finto: registra il budget ricevuto e restituisce un blocco di costo fisso."""
+
+    def __init__(self, tokens=0):
+        self.text = "M" * max(0, (tokens - 1) * 4)
+        self.budgets = []
+
+    def __call__(self, budget):
+        self.budgets.append(budget)
+        return self.text if estimate_tokens(self.text) <= budget else ""
+
+
+def test_everything_fits():
+    history = make_history(10)
+    memory = Memory(20)
+    selected, block, report = ContextAssembler(budget_tokens=4000).assemble(SYSTEM, history, PLAYER, memory)
+
+    assert selected == history and block == memory.text
+    tail = 6 * estimate_tokens(history[0]["content"])
+    assert memory.budgets == [int((4000 - estimate_tokens(SYSTEM) - estimate_tokens(PLAYER) - tail) * 0.3)]
+    assert report["total"] == report["system"] + report["memory"] + report["history"] + report["input"]
+    assert report["history_messages"] == 20 and report["history_dropped"] == 0
+
+
+def test_recent_tail_is_kept_even_over_budget():
+    history = make_history(10)
+    memory = Memory(20)
+    selected, block, report = ContextAssembler(budget_tokens=150, min_history=6).assemble(
+        SYSTEM, history, PLAYER, memory)
+
+    assert selected == history[-6:]
+    assert memory.budgets == [0] and block == ""
+    assert report["total"] > report["budget"]
+
+
+def test_memory_is_budgeted_before_older_history():
+    history = make_history(10)
+    assembler = ContextAssembler(budget_tokens=300, min_history=2)
+    without, _, _ = assembler.assemble(SYSTEM, history, PLAYER, Memory(0))
+    with_memory, _, report = assembler.assemble(SYSTEM, history, PLAYER, Memory(40))
+
+    assert report["memory"] == 40
+    assert len(with_memory) < len(without)  # Il blocco memoria toglie spazio alla history vecchia
+    assert with_memory == history[-len(with_memory):]  # Sempre una coda contigua
+
+
+def test_older_history_stops_at_first_message_that_does_not_fit():
+    history = make_history(6)
+    history[4]["content"] = "X" * 2000  # Messaggio enorme in mezzo
+    selected, _, _ = ContextAssembler(budget_tokens=400, min_history=2).assemble(SYSTEM, history, PLAYER, Memory())
+
+    assert selected == history[6:]  # Niente salti oltre il messaggio che non entra
+
+
+def test_history_starts_on_a_player_message():
+    history = make_history(10)
+    for min_history in (3, 5):  # Coda obbligatoria che inizia con una risposta del narratore
+        selected, _, report = ContextAssembler(budget_tokens=0, min_history=min_history).assemble(
+            SYSTEM, history, PLAYER, Memory())
+        assert selected == history[-(min_history - 1):]
+        assert report["history"] == sum(estimate_tokens(m["content"]) for m in selected)
+        assert report["history_dropped"] == len(history) - len(selected)
+
+    # Budget per 3 messaggi vecchi oltre la coda: il taglio cade su una risposta del narratore
+    cost = estimate_tokens(history[0]["content"])
+    budget = estimate_tokens(SYSTEM) + estimate_tokens(PLAYER) + 5 * cost
+    selected, _, _ = ContextAssembler(budget_tokens=budget, min_history=2).assemble(SYSTEM, history, PLAYER, Memory())
+    assert selected == history[-4:]
+
+
+def test_single_narrator_message_is_kept():
+    history = [{"role": "model", "content": "Intro del narratore."}]
+    selected, _, _ = ContextAssembler(budget_tokens=4000).assemble(SYSTEM, history, PLAYER, Memory())
+    assert selected == history  # Dopo l'intro la history ha solo la risposta del modello
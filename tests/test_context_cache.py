@@ -0,0 +1,143 @@
+# file: tests/test_context_cache.py
+import threading
+import time
+
+import pytest
+
+from media import context_cache
+from media.context_cache import ContextCacheManager, LocalCacheBackend
+
+PREFIX = "LORE + EVENTI + REGOLE"
+
+
+class SlowBackend(LocalCacheBackend):
+    """create() lenta: più thread arrivano sullo stesso miss mentre è in corso."""
+
+    def create(self, model, system_instruction, ttl_seconds):
+        time.sleep(0.05)
+        return super().create(model, system_instruction, ttl_seconds)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(context_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_miss_then_hit():
+    backend = LocalCacheBackend()
+    cache = ContextCacheManager(backend)
+    name = cache.get("model", PREFIX)
+    assert name in backend.created
+    assert cache.get("model", PREFIX) == name
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert len(backend.created) == 1
+
+
+def test_new_prefix_replaces_cache():
+    backend = LocalCacheBackend()
+    cache = ContextCacheManager(backend)
+    first = cache.get("model", PREFIX)
+    second = cache.get("model", PREFIX + " (mondo nuovo)")
+    assert second != first
+    assert backend.deleted == [first]
+    assert list(backend.created) == [second]
+
+
+def test_same_prefix_other_model_is_a_miss():
+    cache = ContextCacheManager(LocalCacheBackend())
+    cache.get("model-a", PREFIX)
+    cache.get("model-b", PREFIX)
+    assert cache.misses == 2
+
+
+def test_expiry_recreates_before_ttl(clock):
+    backend = LocalCacheBackend()
+    cache = ContextCacheManager(backend, ttl_seconds=600, refresh_margin=60)
+    first = cache.get("model", PREFIX)
+
+    clock[0] += 539
+    assert cache.get("model", PREFIX) == first
+
+    clock[0] += 2  # Dentro il margine di refresh
+    second = cache.get("model", PREFIX)
+    assert second != first
+    assert backend.deleted == [first]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_rejected_prefix_is_not_retried():
+    backend = LocalCacheBackend(fail=True)
+    cache = ContextCacheManager(backend)
+    assert cache.get("model", PREFIX) is None
+    backend.fail = False
+    assert cache.get("model", PREFIX) is None
+    assert not backend.created
+
+
+def test_transient_failure_is_retried_with_backoff(clock):
+    backend = LocalCacheBackend(fail=True, fail_code=503)
+    cache = ContextCacheManager(backend)
+    assert cache.get("model", PREFIX) is None
+    backend.fail = False
+    assert cache.get("model", PREFIX) is None  # Ancora dentro l'attesa
+    assert not backend.created
+
+    clock[0] += context_cache.RETRY_BACKOFF[0]
+    assert cache.get("model", PREFIX) in backend.created
+
+
+def test_transient_backoff_doubles_until_success(clock):
+    backend = LocalCacheBackend(fail=True, fail_code=429)
+    cache = ContextCacheManager(backend)
+    first, limit = context_cache.RETRY_BACKOFF
+    cache.get("model", PREFIX)
+    clock[0] += first
+    cache.get("model", PREFIX)  # Secondo fallimento: attesa raddoppiata
+
+    backend.fail = False
+    clock[0] += first
+    assert cache.get("model", PREFIX) is None
+    clock[0] += first
+    assert cache.get("model", PREFIX) in backend.created
+    assert cache._retry_backoff == first
+    assert limit >= 2 * first
+
+
+def test_uncoded_error_is_transient(clock):
+    class Offline(LocalCacheBackend):
+        def create(self, model, system_instruction, ttl_seconds):
+            if self.fail:
+                raise ConnectionError("connessione rifiutata")
+            return super().create(model, system_instruction, ttl_seconds)
+
+    backend = Offline(fail=True)
+    cache = ContextCacheManager(backend)
+    assert cache.get("model", PREFIX) is None
+    backend.fail = False
+    clock[0] += context_cache.RETRY_BACKOFF[0]
+    assert cache.get("model", PREFIX) in backend.created
+
+
+def test_invalidate_deletes_remote_cache():
+    backend = LocalCacheBackend()
+    cache = ContextCacheManager(backend)
+    name = cache.get("model", PREFIX)
+    cache.invalidate()
+    assert backend.deleted == [name]
+    assert cache.get("model", PREFIX) != name
+
+
+def test_concurrent_misses_create_once():
+    backend = SlowBackend()
+    cache = ContextCacheManager(backend)
+    names = []
+    threads = [threading.Thread(target=lambda: names.append(cache.get("model", PREFIX))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(backend.created) == 1
+    assert set(names) == set(backend.created)
+    assert not backend.deleted
@@ -0,0 +1,56 @@
+# file: tests/test_fact_store.py
+import pytest
+
+from core.fact_store import FactStore, normalize
+
+FACT = "Luna ha nascosto la chiave rossa nella biblioteca della scuola"
+
+
+@pytest.fixture
+def store():
+    return FactStore()
+
+
+def test_normalize():
+    assert normalize("È  arrivata!") == "e arrivata"
+
+
+def test_exact_duplicate_after_normalization(store):
+    store.add(FACT)
+    assert store.find(FACT.upper() + ".") == (0, True)
+
+
+def test_restatement_is_found(store):
+    store.add(FACT + " vecchia")
+    assert store.find("Ora " + FACT + " vecchia") == (0, False)
+
+
+def test_unrelated_fact_is_new(store):
+    store.add(FACT)
+    assert store.find("Il bibliotecario cerca un diario segreto nella torre") == (None, False)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Il giocatore vive nella stanza 12 del dormitorio", "Il giocatore vive nella stanza 14 del dormitorio"),
+    ("Il professore Rossi insegna storia al terzo piano", "La professoressa Rossi insegna storia al terzo piano"),
+    ("Luna custodisce la chiave numero 3 nel cassetto della scrivania in camera",
+     "Luna custodisce la chiave numero 4 nel cassetto della scrivania in camera"),
+])
+def test_similar_but_distinct_facts_stay_separate(store, first, second):
+    store.add(first)
+    assert store.find(second) == (None, False)
+
+
+def test_numbered_facts_are_all_kept(store):
+    for n in range(50):
+        fact = f"Luna custodisce la chiave numero {n} nel cassetto della scrivania"
+        if store.find(fact)[0] is None:
+            store.add(fact)
+    assert len(store) == 50
+
+
+def test_replace_updates_index(store):
+    store.add(FACT)
+    store.replace(0, "Il bibliotecario cerca un diario segreto nella torre")
+    assert store.find(FACT) == (None, False)
+    assert store.find("il bibliotecario cerca un diario segreto nella torre") == (0, True)
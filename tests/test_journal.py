@@ -0,0 +1,112 @@
+# file: tests/test_journal.py
+import copy
+from pathlib import Path
+
+import pytest
+import yaml
+
+from core.memory_manager import MemoryManager
+from core.state_manager import StateManager
+
+ROOT = Path(__file__).resolve().parent.parent
+SECTIONS = ("history", "summary_log", "summary_turns", "chapters", "knowledge_base", "fact_meta", "game")
+
+
+class FakeLLM:
+    """Riassunti deterministici (o vuoti, per simulare un LLM che fallisce)."""
+
+    def __init__(self, empty: bool = False):
+        self.empty = empty
+        self.calls = 0
+
+    def summarize_history(self, messages):
+        self.calls += 1
+        return "" if self.empty else f"Riassunto {self.calls}: {messages[0]['content']}"
+
+    def summarize_chapter(self, summaries):
+        return "" if self.empty else "Capitolo: " + " / ".join(s[:12] for s in summaries)
+
+
+@pytest.fixture
+def world():
+    with open(ROOT / "worlds" / "school_life.yaml", "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def new_game(tmp_path, world, llm=None):
+    state = StateManager(str(tmp_path))
+    state.create_new_session(world)
+    return state, MemoryManager(state, llm or FakeLLM())
+
+
+def play_turn(state, memory, turn, filename):
+    """Come GameEngine: updates + fatti, history, delta nel journal, autosave."""
+    updates = {"location": f"Aula {turn % 7}", "gold": turn % 5, "add_item": f"oggetto {turn % 3}"}
+    if turn % 4 == 0:
+        updates["new_fact"] = f"Luna ha nascosto la chiave numero {turn // 8} nella biblioteca della scuola"
+    knowledge_base = state.current_state["knowledge_base"]
+    before = len(knowledge_base)
+    state.update_state(updates)
+    if updates.get("new_fact"):
+        memory.add_fact(updates["new_fact"])
+
+    messages = [{"role": "user", "content": f"azione {turn}"}, {"role": "model", "content": f"risposta {turn}"}]
+    state.current_state["history"].extend(messages)
+    state.record({"op": "turn", "messages": messages, "updates": updates, "facts": knowledge_base[before:]})
+    state.save_journaled(filename)
+
+    memory.manage_memory_drift()
+    for job in (memory._job, memory._rollup_thread):
+        if job:
+            job.join()
+
+
+def snapshot(state):
+    """Copia confrontabile delle sezioni salvate (le sezioni lazy del formato .lrs diventano liste)."""
+    return copy.deepcopy({key: value if key == "game" else list(value)
+                          for key, value in state.current_state.items() if key in SECTIONS})
+
+
+def reload(tmp_path, filename):
+    state = StateManager(str(tmp_path))
+    assert state.load_game(filename)
+    return state
+
+
+@pytest.mark.parametrize("filename", ["autosave.json", "autosave.lrs"])
+def test_journal_replay_matches_live_state(tmp_path, world, filename):
+    state, memory = new_game(tmp_path, world)
+    for turn in range(1, 131):  # Più di una compattazione (JOURNAL_COMPACT_EVERY)
+        play_turn(state, memory, turn, filename)
+    state.flush()
+
+    assert state.current_state["summary_log"] and state.current_state["chapters"]
+    assert snapshot(reload(tmp_path, filename)) == snapshot(state)
+
+
+def test_truncated_journal_line_is_ignored(tmp_path, world):
+    state, memory = new_game(tmp_path, world)
+    for turn in range(1, 6):
+        play_turn(state, memory, turn, "autosave.json")
+    state.flush()
+    expected = snapshot(state)
+
+    with open(tmp_path / "autosave.json.journal", "a", encoding="utf-8") as f:
+        f.write('{"gen":1,"op":"turn","messages":[{"role"')  # Crash a metà riga
+    assert snapshot(reload(tmp_path, "autosave.json")) == expected
+
+
+def test_each_format_keeps_its_own_journal(tmp_path, world):
+    state, memory = new_game(tmp_path, world)
+    for turn in range(1, 6):
+        play_turn(state, memory, turn, "autosave.json")
+    state.flush()
+    json_state = snapshot(state)
+
+    # Cambio di save_format a metà partita: il journal del .json non va toccato
+    for turn in range(6, 11):
+        play_turn(state, memory, turn, "autosave.lrs")
+    state.flush()
+
+    assert snapshot(reload(tmp_path, "autosave.json")) == json_state
+    assert snapshot(reload(tmp_path, "autosave.lrs")) == snapshot(state)
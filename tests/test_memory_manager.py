@@ -0,0 +1,104 @@
+# file: tests/test_memory_manager.py
+import re
+import threading
+
+from core.memory_manager import MemoryManager
+
+
+class FakeState:
+    """StateManager minimo: stato in memoria, journal e versioni registrati per i controlli."""
+
+    def __init__(self):
+        self.current_state = {"meta": {"turn_count": 1}, "game": {}, "history": [], "summary_log": [],
+                              "summary_turns": [], "chapters": [], "knowledge_base": [], "fact_meta": []}
+        self.journal = []
+
+    def record(self, entry):
+        self.journal.append(entry)
+
+    def touch(self, section, keys=()):
+        pass
+
+
+class FakeLLM:
+    def __init__(self, summary="Riassunto", chapter="Capitolo", gate=None, chapter_gate=None):
+        self.summary = summary
+        self.chapter = chapter
+        self.gate = gate  # threading.Event: il riassunto arriva solo quando è settato
+        self.chapter_gate = chapter_gate
+
+    def summarize_history(self, messages):
+        if self.gate:
+            self.gate.wait(5)
+        return self.summary
+
+    def summarize_chapter(self, summaries):
+        if self.chapter_gate:
+            self.chapter_gate.wait(5)
+        return self.chapter
+
+
+def add_turn(memory, turn):
+    state = memory.state_manager.current_state
+    state["meta"]["turn_count"] = turn
+    state["history"] += [{"role": "user", "content": f"azione {turn}"},
+                         {"role": "model", "content": f"risposta {turn}\n```json\n{{}}\n```"}]
+    memory.manage_memory_drift()
+
+
+def join(memory):
+    for job in (memory._job, memory._rollup_thread):
+        if job:
+            job.join(5)
+
+
+def test_failed_summaries_archive_messages_instead_of_dropping_them():
+    memory = MemoryManager(FakeState(), FakeLLM(summary=""))
+    for turn in range(1, 101):
+        add_turn(memory, turn)
+        join(memory)
+        assert len(memory.state_manager.current_state["history"]) <= memory.HISTORY_LIMIT
+
+    state = memory.state_manager.current_state
+    archived = " ".join(state["summary_log"])
+    turns = [int(n) for n in re.findall(r"Player: azione (\d+)", archived)]
+    turns += [int(m["content"].split()[1]) for m in state["history"] if m["role"] == "user"]
+    assert turns == list(range(1, 101))
+    assert "```json" not in archived
+    assert {entry["op"] for entry in memory.state_manager.journal} <= {"compress", "rollup"}
+
+
+def test_hard_limit_waits_for_running_compression():
+    gate = threading.Event()
+    memory = MemoryManager(FakeState(), FakeLLM(summary="Riassunto pronto", gate=gate))
+    memory.COMPRESS_WAIT = 5.0
+    for turn in range(1, 26):
+        add_turn(memory, turn)  # 50 messaggi: compressione partita, non ancora finita
+    assert memory._job.is_alive()
+
+    threading.Timer(0.1, gate.set).start()
+    add_turn(memory, 26)
+    state = memory.state_manager.current_state
+    assert state["summary_log"] == ["Riassunto pronto"]
+    assert len(state["history"]) == 52 - memory.PRUNE_COUNT
+
+
+def test_slow_rollup_does_not_block_compression():
+    chapter_gate = threading.Event()
+    memory = MemoryManager(FakeState(), FakeLLM(chapter_gate=chapter_gate))
+    state = memory.state_manager.current_state
+    state["summary_log"] = [f"R{i}" for i in range(memory.ROLLUP_SIZE)]
+    state["summary_turns"] = [[i, i] for i in range(memory.ROLLUP_SIZE)]
+
+    memory.manage_memory_drift()
+    assert memory._rollup_thread.is_alive()
+    for turn in range(1, 22):
+        add_turn(memory, turn)
+    memory._job.join(5)
+    memory.manage_memory_drift()
+    assert len(state["summary_log"]) == memory.ROLLUP_SIZE + 1
+
+    chapter_gate.set()
+    join(memory)
+    memory.manage_memory_drift()
+    assert state["chapters"] and state["chapters"][0]["text"] == "Capitolo"
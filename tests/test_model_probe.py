@@ -0,0 +1,114 @@
+# file: tests/test_model_probe.py
+import json
+import os
+import time
+
+from media import llm_backends
+from media.llm_backends import MODEL_CANDIDATES, GeminiBackend
+
+
+def probe_calls(fake_backends) -> int:
+    return sum(n for call, n in fake_backends.gemini.calls.items() if call.endswith(":generateContent"))
+
+
+def test_probe_result_is_persisted_per_endpoint(fake_backends):
+    assert GeminiBackend().model_id == MODEL_CANDIDATES[0]
+    with open(llm_backends.MODEL_CACHE_FILE, "r", encoding="utf-8") as f:
+        cached = json.load(f)
+    assert cached["model"] == MODEL_CANDIDATES[0]
+    assert "fake-key" not in json.dumps(cached)  # Solo l'hash di endpoint + chiave
+
+    calls = probe_calls(fake_backends)
+    assert GeminiBackend().model_id == MODEL_CANDIDATES[0]
+    assert probe_calls(fake_backends) == calls  # Dalla cache, nessuna chiamata
+
+
+def test_cache_of_other_key_or_endpoint_is_ignored(fake_backends, monkeypatch):
+    GeminiBackend().model_id
+    calls = probe_calls(fake_backends)
+
+    monkeypatch.setenv("GEMINI_API_KEY", "altra-chiave")
+    assert GeminiBackend().model_id == MODEL_CANDIDATES[0]
+    assert probe_calls(fake_backends) > calls
+
+
+def test_expired_cache_is_ignored(fake_backends):
+    GeminiBackend().model_id
+    with open(llm_backends.MODEL_CACHE_FILE, "r", encoding="utf-8") as f:
+        cached = json.load(f)
+    cached["checked_at"] = time.time() - llm_backends.MODEL_CACHE_TTL - 1
+    with open(llm_backends.MODEL_CACHE_FILE, "w", encoding="utf-8") as f:
+        json.dump(cached, f)
+
+    calls = probe_calls(fake_backends)
+    GeminiBackend().model_id
+    assert probe_calls(fake_backends) > calls
+
+
+def test_failed_probe_retries_after_backoff(fake_backends, monkeypatch):
+    url = os.environ["GEMINI_BASE_URL"]
+    monkeypatch.setenv("GEMINI_BASE_URL", "http://127.0.0.1:1")  # Rete assente all'avvio
+    backend = GeminiBackend()
+    assert not backend.is_ready()
+    first_retry = backend._next_probe_at
+    assert first_retry > time.time()
+
+    probes = []
+    real_probe = backend._probe_models
+    monkeypatch.setattr(backend, "_probe_models", lambda: probes.append(1) or real_probe())
+    assert backend.model_id is None and not probes  # Dentro il backoff: nessun tentativo
+
+    backend._next_probe_at = 0
+    assert backend.model_id is None and len(probes) == 1
+    assert backend._next_probe_at - time.time() > first_retry - time.time()  # Backoff raddoppiato
+
+    # La rete torna: il tentativo successivo trova il modello
+    from google import genai
+    from google.genai import types
+    backend.client = genai.Client(api_key="fake-key", http_options=types.HttpOptions(base_url=url))
+    backend._next_probe_at = 0
+    assert backend.model_id == MODEL_CANDIDATES[0]
+    assert backend.is_ready()
+
+
+def test_probe_prefers_first_available_candidate(fake_backends, monkeypatch):
+    monkeypatch.setattr(fake_backends.gemini, "missing_models", {MODEL_CANDIDATES[0]})
+    assert GeminiBackend().model_id == MODEL_CANDIDATES[1]
+
+
+def test_candidates_are_probed_in_parallel(fake_backends, monkeypatch):
+    monkeypatch.setattr(fake_backends.gemini, "missing_models", set(MODEL_CANDIDATES[:-1]))
+    monkeypatch.setattr(fake_backends.gemini.faults, "latency", 0.4)
+    backend = GeminiBackend()
+    started = time.monotonic()
+    assert backend.model_id == MODEL_CANDIDATES[-1]  # L'ultimo in priorità: in serie costerebbe N * 0.4s
+    assert time.monotonic() - started < 0.4 * 2
+
+
+def test_backoff_is_capped_and_reset_on_success(fake_backends, monkeypatch):
+    monkeypatch.setattr(fake_backends.gemini, "missing_models", set(MODEL_CANDIDATES))
+    backend = GeminiBackend()
+    backend._probe_backoff = llm_backends.PROBE_BACKOFF[1] / 2
+    for _ in range(3):
+        backend._next_probe_at = 0
+        assert backend.model_id is None
+    assert backend._probe_backoff == llm_backends.PROBE_BACKOFF[1]
+    assert backend._next_probe_at - time.time() <= llm_backends.PROBE_BACKOFF[1]
+
+    fake_backends.gemini.missing_models = set()
+    backend._next_probe_at = 0
+    assert backend.model_id == MODEL_CANDIDATES[0]
+    assert backend._probe_backoff == llm_backends.PROBE_BACKOFF[0]
+
+
+def test_repeated_failures_switch_model_in_background(fake_backends, monkeypatch):
+    backend = GeminiBackend()
+    assert backend.model_id == MODEL_CANDIDATES[0]
+
+    monkeypatch.setattr(fake_backends.gemini, "missing_models", {MODEL_CANDIDATES[0]})
+    for _ in range(llm_backends.MAX_FAILURES - 1):
+        backend.report_failure()
+    assert backend._reprobe_thread is None
+    backend.report_failure()
+    backend._reprobe_thread.join(5)
+    assert backend.model_id == MODEL_CANDIDATES[1]
@@ -0,0 +1,110 @@
+# file: tests/test_openai_backend.py
+import asyncio
+import json
+import time
+
+import pytest
+import requests
+
+from media.llm_backends import LLMRequest, OpenAICompatBackend
+from media.request_policy import is_transient
+from media.response_parser import parse_response
+
+COMPLETIONS = "POST /v1/chat/completions"
+
+
+@pytest.fixture
+def backend(fake_backends):
+    return OpenAICompatBackend(base_url=f"{fake_backends.openai.url}/v1")
+
+
+def sse_writer(events):
+    """Sostituto di FakeOpenAICompat._stream_openai: scrive gli eventi SSE così come sono (bytes)."""
+
+    def write(req, model, text):
+        req.send_response(200)
+        req.send_header("Content-Type", "text/event-stream")
+        req.send_header("Connection", "close")
+        req.end_headers()
+        req.close_connection = True
+        for raw in events:
+            req.wfile.write(raw)
+            req.wfile.flush()
+            time.sleep(0.01)  # Scritture separate: il client le riceve in pezzi diversi
+
+    return write
+
+
+def delta(content=None, **extra):
+    chunk = {"choices": [{"index": 0, "delta": dict(extra, **({"content": content} if content else {}))}]}
+    return json.dumps(chunk, ensure_ascii=False)
+
+
+def test_stream_yields_the_reply_in_chunks(backend, fake_backends):
+    prepared = backend.prepare(LLMRequest("Mi guardo attorno.", system_instruction="Sei il narratore."))
+    calls = fake_backends.openai.calls[COMPLETIONS]
+
+    chunks = list(backend.stream(prepared))
+    assert len(chunks) > 1
+    turn = parse_response("".join(chunks))
+    assert turn["text"] and turn["visual_en"]
+    assert fake_backends.openai.calls[COMPLETIONS] == calls + 1
+
+
+def test_sse_comments_empty_deltas_and_done(backend, fake_backends, monkeypatch):
+    encoded = "è così".encode("utf-8")
+    events = [
+        b": keep-alive\n\n",
+        f"data: {delta(role='assistant')}\n\n".encode("utf-8"),  # Solo il ruolo, niente testo
+        f"data:{delta('Ciao ')}\n\n".encode("utf-8"),  # Senza spazio dopo "data:"
+        b'data: {"choices": []}\n\n',
+        # Carattere multibyte spezzato tra due scritture
+        b'data: {"choices": [{"delta": {"content": "' + encoded[:1],
+        encoded[1:] + b'"}}]}\n\n',
+        f"data: {delta(finish_reason='stop')}\n\n".encode("utf-8"),
+        b"data: [DONE]\n\n",
+        f"data: {delta('dopo la fine')}\n\n".encode("utf-8"),
+    ]
+    monkeypatch.setattr(fake_backends.openai, "_stream_openai", sse_writer(events))
+
+    assert list(backend.stream(backend.prepare(LLMRequest("x")))) == ["Ciao ", "è così"]
+
+
+def test_generate_and_astream(backend):
+    prepared = backend.prepare(LLMRequest("Le chiedo come sta."))
+    assert parse_response(backend.generate(prepared))["text"]
+
+    async def collect():
+        return [chunk async for chunk in backend.astream(prepared)]
+
+    chunks = asyncio.run(collect())
+    assert len(chunks) > 1 and parse_response("".join(chunks))["visual_en"]
+
+
+def test_prompt_parts_keep_the_system_prefix_stable(backend):
+    history = [{"role": "user", "content": "ciao"}, {"role": "model", "content": "ciao a te"}]
+    first = backend.prepare(LLMRequest("a", history=history, prompt_parts=("PREFISSO", "STATO 1")))
+    second = backend.prepare(LLMRequest("b", history=history, prompt_parts=("PREFISSO", "STATO 2")))
+
+    assert first["messages"][0] == second["messages"][0] == {"role": "system", "content": "PREFISSO"}
+    assert [m["role"] for m in first["messages"]] == ["system", "user", "assistant", "user", "user"]
+    assert first["messages"][-2]["content"] == "STATO 1"
+
+
+def test_error_status_is_classified(backend, fake_backends, monkeypatch):
+    monkeypatch.setattr(fake_backends.openai.faults, "failure_rate", 1.0)
+    monkeypatch.setattr(fake_backends.openai.faults, "failure_status", 503)
+    prepared = backend.prepare(LLMRequest("x"))
+
+    for call in (backend.generate, lambda p: list(backend.stream(p))):
+        with pytest.raises(RuntimeError) as error:
+            call(prepared)
+        assert error.value.code == 503 and is_transient(error.value)
+
+
+def test_timeout_bounds_a_slow_server(backend, fake_backends, monkeypatch):
+    monkeypatch.setattr(fake_backends.openai.faults, "latency", 2.0)
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout):
+        list(backend.stream(backend.prepare(LLMRequest("x")), timeout=0.3))
+    assert time.monotonic() - started < 1.5
@@ -0,0 +1,145 @@
+# file: tests/test_prompt_template.py
+import os
+from pathlib import Path
+
+import pytest
+
+from core.prompt_template import PromptTemplate, SectionCache
+
+ROOT = Path(__file__).resolve().parent.parent
+
+TEMPLATE = (
+    "Mondo: {world_name!r} {{letterale}}\n"
+    "Oro: {gold:>8.2f} | Stato: {state[mood]} | Nome: {who.name!s:<{width}}|\n"
+    "Luogo: {location}\n"
+)
+
+
+class Person:
+    def __init__(self, name):
+        self.name = name
+
+
+def make_values(**overrides):
+    values = {"world_name": "Scuola", "gold": 12.5, "state": {"mood": "felice"},
+              "who": Person("Luna"), "width": 6, "location": "Aula 3"}
+    values.update(overrides)
+    return values
+
+
+@pytest.fixture
+def template(tmp_path):
+    path = tmp_path / "system_prompt.txt"
+    path.write_text(TEMPLATE, encoding="utf-8")
+    return PromptTemplate(str(path))
+
+
+def old_build_system_prompt(engine) -> str:
+    """GameEngine._build_system_prompt prima di PromptTemplate/SectionCache (riferimento)."""
+    meta = engine.world_data.get("meta", {})
+    game = engine.state_manager.current_state.get("game", {})
+
+    char_name = game.get('companion_name')
+    current_aff = game.get("affinity", {}).get(char_name, 0)
+    partner_personality = engine._get_affinity_personality(char_name, current_aff)
+
+    all_companions = list(engine.world_data.get("companions", {}).keys())
+    other_chars = [c for c in all_companions if c != char_name]
+
+    npc_instructions = ""
+    for npc in other_chars:
+        npc_aff = game.get("affinity", {}).get(npc, 0)
+        npc_pers = engine._get_affinity_personality(npc, npc_aff)
+        npc_outfit = "Default"
+        if "npc_states" in game and npc in game["npc_states"]:
+            npc_outfit = game["npc_states"][npc].get("current_outfit", "Default")
+        npc_instructions += f"- {npc}: {npc_pers} [CURRENT OUTFIT: {npc_outfit}]\n"
+
+    key_events = meta.get("story_structure", {}).get("key_events", [])
+    events_str = "POSSIBLE PLOT POINTS:\n"
+    for e in key_events: events_str += f"- [KEY] {e}\n"
+
+    prompt_vars = {
+        "genre": meta.get('genre', 'RPG'),
+        "world_name": meta.get('name', 'Unknown World'),
+        "world_lore": meta.get('world_lore', 'No lore available.'),
+        "events_str": events_str,
+        "char_name": char_name,
+        "partner_personality": partner_personality,
+        "npc_instructions": npc_instructions,
+        "time_of_day": game.get('time_of_day', 'Morning'),
+        "location": game.get('location', 'Unknown'),
+        "current_outfit": game.get('current_outfit', 'default')
+    }
+    with open("prompts/system_prompt.txt", "r", encoding="utf-8") as f:
+        return f.read().format(**prompt_vars)
+
+
+def test_render_matches_str_format(template):
+    for values in (make_values(), make_values(gold=3, width=2), make_values(who=Person("Aiko"))):
+        assert template.render(values) == TEMPLATE.format(**values)
+
+
+def test_render_reuses_last_output_until_values_change(template):
+    values = make_values()
+    first = template.render(values)
+    assert template.render(dict(values)) is first
+    assert template.render(dict(values, location="Tetto")) != first
+
+
+def test_template_is_recompiled_when_file_changes(template):
+    template.render(make_values())
+    template.path.write_text("Solo {location:^10}", encoding="utf-8")
+    os.utime(template.path, (1, 1))  # mtime diverso anche su filesystem a bassa risoluzione
+    assert template.render(make_values()) == "Solo {:^10}".format("Aula 3")
+    assert template.fields == ["location"]
+
+
+def test_render_split_keeps_prefix_stable(template):
+    static, state = template.render_split(make_values(), ["gold", "location"])
+    other_static, other_state = template.render_split(make_values(gold=99, location="Tetto"), ["gold", "location"])
+
+    assert static == other_static
+    assert "[gold: see CURRENT STATE]" in static and "Nome: Luna  |" in static
+    assert "### gold\n   12.50\n" in state  # La spec del template vale anche nel blocco di stato
+    assert "### location\nTetto\n" in other_state
+
+
+def test_bad_spec_raises_like_str_format(template):
+    with pytest.raises(ValueError):
+        template.render(make_values(gold="molto"))
+
+
+def test_section_cache_rebuilds_only_on_key_change():
+    cache = SectionCache()
+    builds = []
+
+    def build():
+        builds.append(1)
+        return len(builds)
+
+    assert cache.get("npc", ("Aiko", 10), build) == 1
+    assert cache.get("npc", ("Aiko", 10), build) == 1
+    assert cache.get("npc", ("Aiko", 20), build) == 2
+    cache.clear()
+    assert cache.get("npc", ("Aiko", 20), build) == 3
+
+
+def test_engine_prompt_matches_old_builder(fake_backends, monkeypatch, tmp_path):
+    from core.engine import GameEngine
+
+    monkeypatch.chdir(ROOT)  # Template e mondi sono risolti relativi alla root
+    engine = GameEngine()
+    engine.state_manager.saves_path = tmp_path
+    engine.start_new_game("school_life")
+    companions = [name for name in engine.world_data.get("companions", {})]
+    npc = next(name for name in companions if name != engine.state_manager.current_state["game"]["companion_name"])
+
+    assert engine._build_system_prompt() == old_build_system_prompt(engine)
+    for updates in ({"location": "Biblioteca", "time_of_day": "Evening"},
+                    {"affinity_change": {npc: 40}},
+                    {"npc_updates": {npc: {"outfit": "Divisa sportiva"}}},
+                    {"current_outfit": "Pigiama"}):
+        before = engine._build_system_prompt()
+        engine.state_manager.update_state(updates)
+        assert engine._build_system_prompt() == old_build_system_prompt(engine) != before
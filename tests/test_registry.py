@@ -0,0 +1,100 @@
+# file: tests/test_registry.py
+import threading
+import time
+
+import pytest
+
+from media.registry import ClientRegistry
+
+
+class FakeLLM:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_client_is_built_once_and_shared():
+    registry = ClientRegistry()
+    built = []
+
+    def factory():
+        time.sleep(0.05)  # Costruzione lenta: gli altri thread arrivano mentre è in corso
+        built.append(object())
+        return built[-1]
+
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(registry.get("image", factory))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(built) == 1
+    assert clients == built * 8
+
+
+def test_factory_runs_outside_the_lock():
+    registry = ClientRegistry()
+
+    def factory():
+        # Un altro thread deve poter usare il registro mentre questo client si costruisce
+        other = threading.Thread(target=lambda: registry.http_session("http://localhost:7860"))
+        other.start()
+        other.join(timeout=2)
+        assert not other.is_alive()
+        return "audio"
+
+    assert registry.get("audio", factory) == "audio"
+
+
+def test_failed_factory_can_be_retried():
+    registry = ClientRegistry()
+
+    def broken():
+        raise ValueError("config mancante")
+
+    with pytest.raises(ValueError):
+        registry.get("video", broken)
+    assert registry.get("video", lambda: "video") == "video"
+
+
+def test_get_after_shutdown_raises():
+    registry = ClientRegistry()
+    llm = registry.get("llm", FakeLLM)
+    registry.shutdown()
+
+    assert llm.closed
+    with pytest.raises(RuntimeError):
+        registry.get("llm", FakeLLM)
+    with pytest.raises(RuntimeError):
+        registry.http_session("http://localhost:7860")
+
+
+def test_client_built_during_shutdown_is_closed():
+    registry = ClientRegistry()
+    started, release = threading.Event(), threading.Event()
+    built = []
+
+    def factory():
+        started.set()
+        release.wait(2)
+        built.append(FakeLLM())
+        return built[-1]
+
+    errors = []
+
+    def build():
+        try:
+            registry.get("llm", factory)
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=build)
+    thread.start()
+    started.wait(2)
+    registry.shutdown()
+    release.set()
+    thread.join(2)
+
+    assert errors and built[0].closed
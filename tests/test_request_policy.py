@@ -0,0 +1,182 @@
+# file: tests/test_request_policy.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from media.request_policy import Attempt, AttemptCancelled, DeadlineExceeded, RequestPolicy, is_transient
+
+
+class HttpError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class ReadTimeout(Exception):
+    """Come httpx.ReadTimeout: riconosciuta per nome."""
+
+
+def policy(**kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    kwargs.setdefault("seed", 1)
+    return RequestPolicy(**kwargs)
+
+
+@pytest.mark.parametrize("error, transient", [
+    (HttpError(429), True), (HttpError(503), True), (HttpError(408), True),
+    (HttpError(400), False), (HttpError(404), False),
+    (TimeoutError(), True), (ConnectionResetError(), True), (ReadTimeout(), True),
+    (ValueError("JSON"), False),
+])
+def test_retry_classification(error, transient):
+    assert is_transient(error) is transient
+
+
+def test_hedging_is_off_by_default():
+    assert RequestPolicy().hedge_delay("stream") is None
+
+
+def test_transient_errors_are_retried():
+    calls = []
+
+    def fn(attempt):
+        calls.append(attempt)
+        if len(calls) < 3:
+            raise HttpError(503)
+        return "ok"
+
+    p = policy(max_retries=2)
+    assert p.call(fn) == "ok"
+    assert p.stats["retries"] == 2
+
+
+def test_permanent_errors_are_not_retried():
+    calls = []
+
+    def fn(attempt):
+        calls.append(attempt)
+        raise HttpError(400)
+
+    with pytest.raises(HttpError):
+        policy(max_retries=2).call(fn)
+    assert len(calls) == 1
+
+
+def test_no_retry_after_output_was_shown():
+    calls = []
+
+    def fn(attempt):
+        calls.append(attempt)
+        assert attempt.claim()
+        raise HttpError(503)
+
+    with pytest.raises(HttpError):
+        policy(max_retries=2).call(fn)
+    assert len(calls) == 1
+
+
+def test_deadline_is_enforced_and_passed_as_timeout():
+    timeouts = []
+
+    def fn(attempt):
+        timeouts.append(attempt.remaining())
+        time.sleep(1.0)
+        return "tardi"
+
+    p = policy(deadline=0.2)
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        p.call(fn)
+    assert time.monotonic() - started < 0.9
+    assert timeouts[0] == 1.0  # Minimo del timeout HTTP; mai oltre la deadline residua
+    assert p.stats["deadlines"] == 1
+
+
+def test_hedge_wins_when_primary_is_slow():
+    release = threading.Event()
+
+    def fn(attempt: Attempt):
+        if not attempt.hedge:
+            release.wait(2)
+            attempt.check()
+            return "primario"
+        attempt.token()
+        return "riserva"
+
+    p = policy(hedge=True, hedge_default_delay=0.05)
+    assert p.call(fn) == "riserva"
+    release.set()
+    assert (p.stats["hedges"], p.stats["hedge_wins"]) == (1, 1)
+
+
+def test_stream_claim_lets_only_one_attempt_emit():
+    emitted = []
+    both_started = threading.Barrier(2, timeout=2)
+
+    def fn(attempt: Attempt):
+        attempt.token() if attempt.hedge else None
+        both_started.wait()
+        for i in range(3):
+            if attempt.claim():
+                emitted.append((attempt.index, i))
+            else:
+                attempt.check()
+            time.sleep(0.01)
+        return attempt.index
+
+    p = policy(hedge=True, hedge_default_delay=0.05)
+    winner = p.call(fn)
+    assert {index for index, _ in emitted} == {winner}
+    assert [i for _, i in emitted] == [0, 1, 2]
+
+
+def test_cancelled_attempt_raises_on_check():
+    p = policy(hedge=True, hedge_default_delay=0.05)
+
+    def fn(attempt: Attempt):
+        if attempt.hedge:
+            attempt.claim()
+            return "riserva"
+        time.sleep(0.3)
+        with pytest.raises(AttemptCancelled):
+            attempt.check()
+        return "primario"
+
+    assert p.call(fn) == "riserva"
+
+
+def test_async_hedge_cancels_the_loser():
+    cancelled = []
+
+    async def fn(attempt: Attempt):
+        if attempt.hedge:
+            return "riserva"
+        try:
+            await asyncio.sleep(2)
+        except asyncio.CancelledError:
+            cancelled.append(attempt.index)
+            raise
+        return "primario"
+
+    p = policy(hedge=True, hedge_default_delay=0.05)
+    assert asyncio.run(p.acall(fn)) == "riserva"
+    assert cancelled == [0]
+
+
+def test_abandoned_sync_attempt_is_bounded_by_http_timeout(fake_backends):
+    """Contro il Gemini finto lento: il tentativo abbandonato chiude la richiesta alla deadline."""
+    from media.llm_backends import GeminiBackend, LLMRequest
+
+    backend = GeminiBackend()
+    assert backend.is_ready()  # Verifica modelli prima di rallentare il server
+    prepared = backend.prepare(LLMRequest("ciao"))
+    fake_backends.gemini.faults.latency = 3.0
+    try:
+        started = time.monotonic()
+        with pytest.raises(Exception):
+            backend.generate(prepared, timeout=1.0)
+        assert time.monotonic() - started < 2.5
+    finally:
+        fake_backends.gemini.faults.latency = 0.0
@@ -0,0 +1,90 @@
+# file: tests/test_response_parser.py
+import json
+import random
+
+import pytest
+
+from media.response_parser import ResponseParser, StructuredResponseParser, parse_response, parse_structured
+
+
+def feed_chunks(text, size):
+    parser = ResponseParser()
+    for i in range(0, len(text), size):
+        parser.feed(text[i:i + size])
+    return parser.finish()
+
+
+def test_code_fence_closing_keeps_rest_of_line():
+    raw = 'Testo ```python\nprint(1)\n``` fine'
+    assert parse_response(raw)["text"] == "Testo print(1)\n fine"
+    assert feed_chunks(raw, 1)["text"] == "Testo print(1)\n fine"
+
+
+def test_inline_code_fence_stays_narration():
+    assert parse_response("A ```x``` b")["text"] == "A x b"
+
+
+def test_code_fence_before_json_block():
+    raw = ('Inizio ```python\nx = 1\n``` mezzo\n'
+           '```json\n{"visual_en": "v", "tags_en": [], "updates": {}}\n``` fine')
+    turn = parse_response(raw)
+    assert turn["text"] == "Inizio x = 1\n mezzo\n fine"
+    assert turn["visual_en"] == "v"
+
+
+TURN_JSON = ('{"visual_en": "girl in {library}", "tags_en": ["indoor", "book"], '
+             '"updates": {"location": "Biblioteca", "affinity_change": {"Luna": 2}, "new_fact": "Luna ama i libri"}}')
+
+RESPONSES = [
+    "Luna sorride e ti prende la mano.\n```json\n" + TURN_JSON + "\n```",
+    'Luna scrive {"nota"} sul quaderno e dice {ciao}.\n' + TURN_JSON + "\nE poi se ne va.",
+    "Nessun blocco tecnico, solo narrazione con ` e `` e { graffe }.",
+    "Risposta troncata.\n```json\n" + TURN_JSON[:70],
+    'Testo ```python\nprint({"a": 1})\n``` fine\n```json\n' + TURN_JSON + "\n``` coda",
+]
+
+
+def split_points(text, seed):
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, 12)))
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize("raw", RESPONSES)
+def test_chunk_split_equivalence(raw):
+    expected = parse_response(raw)
+    splits = [[raw[i:i + size] for i in range(0, len(raw), size)] for size in (1, 2, 3, 5, 24)]
+    splits += [split_points(raw, seed) for seed in range(20)]
+    for chunks in splits:
+        streamed = []
+        parser = ResponseParser(streamed.append)
+        for chunk in chunks:
+            parser.feed(chunk)
+        assert parser.finish() == expected
+        assert "".join(streamed).strip() == expected["text"]
+
+
+def test_turn_block_is_parsed():
+    turn = parse_response(RESPONSES[0])
+    assert turn["text"] == "Luna sorride e ti prende la mano."
+    assert turn["visual_en"] == "girl in {library}"
+    assert turn["updates"]["location"] == "Biblioteca"
+
+
+def test_truncated_block_is_repaired():
+    turn = parse_response(RESPONSES[3])
+    assert turn["text"] == "Risposta troncata."
+    assert turn["visual_en"] == "girl in {library}"
+
+
+@pytest.mark.parametrize("size", [1, 4, 32])
+def test_structured_chunk_split_equivalence(size):
+    raw = json.dumps({"narration": "Luna dice: \"ciao\" 😊\ne se ne va.", "visual_en": "v",
+                      "tags_en": ["a"], "updates": {"location": "Parco"}})
+    expected = parse_structured(raw)
+    streamed = []
+    parser = StructuredResponseParser(streamed.append)
+    for i in range(0, len(raw), size):
+        parser.feed(raw[i:i + size])
+    assert parser.finish() == expected
+    assert "".join(streamed) == "Luna dice: \"ciao\" 😊\ne se ne va."
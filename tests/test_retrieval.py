@@ -0,0 +1,53 @@
+# file: tests/test_retrieval.py
+from core.retrieval import BM25Index, tokenize
+
+DOCS = [
+    "Luna ha trovato la chiave rossa in biblioteca",
+    "Il professore Rossi insegna storia al terzo piano",
+    "Maria nasconde un diario segreto nella palestra",
+    "La chiave del laboratorio è nel cassetto del professore",
+]
+
+
+def build():
+    index = BM25Index()
+    for doc in DOCS:
+        index.add(doc)
+    return index
+
+
+def test_tokenize_drops_stopwords_and_stems():
+    assert tokenize("Le ragazze della biblioteca e il giocatore") == ["ragazz", "biblio"]
+
+
+def test_search_ranks_relevant_documents():
+    results = build().search(tokenize("dove è la chiave della biblioteca?"), k=2)
+    assert [doc for doc, _ in results] == [0, 3]
+    assert results[0][1] > results[1][1] > 0
+
+
+def test_search_respects_k_and_exclude():
+    index = build()
+    assert index.search(tokenize("chiave professore"), k=1) == index.search(tokenize("chiave professore"), k=4)[:1]
+    excluded = index.search(tokenize("chiave"), k=4, exclude={0, 3})
+    assert excluded == []
+
+
+def test_ties_prefer_recent_documents():
+    index = BM25Index()
+    index.add("Luna in giardino")
+    index.add("Luna in giardino")
+    assert [doc for doc, _ in index.search(tokenize("giardino"), k=2)] == [1, 0]
+
+
+def test_replace_reindexes_document():
+    index = build()
+    index.replace(0, "Luna ha perso il medaglione al molo")
+    assert 0 not in [doc for doc, _ in index.search(tokenize("biblioteca"), k=4)]
+    assert index.search(tokenize("medaglione"), k=4)[0][0] == 0
+    assert len(index) == len(DOCS)
+
+
+def test_unknown_terms_and_empty_index():
+    assert build().search(tokenize("astronave"), k=3) == []
+    assert BM25Index().search(["chiave"], k=3) == []
@@ -0,0 +1,86 @@
+# file: tests/test_save_format.py
+from pathlib import Path
+
+import pytest
+import yaml
+
+from core.save_format import LazySection, encode_compact, read_compact
+from core.state_manager import StateManager
+
+ROOT = Path(__file__).resolve().parent.parent
+GROWING = ("summary_log", "knowledge_base", "fact_meta")
+
+
+@pytest.fixture
+def world():
+    with open(ROOT / "worlds" / "school_life.yaml", "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+@pytest.fixture
+def saved(tmp_path, world):
+    """Partita lunga salvata in .lrs, con turni e una compressione ancora nel journal."""
+    state = StateManager(str(tmp_path))
+    state.create_new_session(world)
+    current = state.current_state
+    current["knowledge_base"] = [f"fatto {i}" for i in range(500)]
+    current["fact_meta"] = [[i, i, 1] for i in range(500)]
+    current["summary_log"] = [f"riassunto {i}" for i in range(100)]
+    current["summary_turns"] = [None] * 100
+    state.save_journaled("autosave.lrs")
+
+    messages = [{"role": "user", "content": "apro la porta"}, {"role": "model", "content": "La porta cigola."}]
+    state.update_state({"location": "Biblioteca"})
+    current["knowledge_base"].append("fatto nuovo")
+    turn = current["meta"]["turn_count"]
+    current["fact_meta"].append([turn, turn, 1])
+    current["history"].extend(messages)
+    state.record({"op": "turn", "messages": messages, "updates": {"location": "Biblioteca"},
+                  "facts": ["fatto nuovo"]})
+    current["summary_log"].append("riassunto nuovo")
+    current["summary_turns"].append(None)
+    state.record({"op": "compress", "summary": "riassunto nuovo", "turns": None, "pruned": 0})
+    state.save_journaled("autosave.lrs")
+    state.flush()
+    return state
+
+
+def test_load_keeps_growing_sections_compressed(tmp_path, saved):
+    state = StateManager(str(tmp_path))
+    assert state.load_game("autosave.lrs")
+    current = state.current_state
+
+    # Replay del journal e letture del pannello di stato: niente decodifica
+    for name in GROWING:
+        assert isinstance(current[name], LazySection) and not current[name].loaded
+        assert len(current[name]) == len(saved.current_state[name])
+    assert current["summary_log"][-1] == "riassunto nuovo"
+    assert current["knowledge_base"][-1] == "fatto nuovo"
+    assert current["game"]["location"] == "Biblioteca"
+
+    for name in GROWING:
+        assert list(current[name]) == list(saved.current_state[name])
+        assert current[name].loaded
+
+
+def test_last_element_is_read_from_the_section_table(tmp_path):
+    path = tmp_path / "save.lrs"
+    path.write_bytes(encode_compact({"meta": {}, "summary_log": ["a", "b", "c"], "history": []}))
+    state = read_compact(path)
+    assert state["summary_log"][-1] == "c"
+    assert not state["summary_log"].loaded
+    assert state["history"][-1:] == [] and len(state["knowledge_base"]) == 0
+
+
+def test_untouched_section_reuses_its_blob(tmp_path):
+    path = tmp_path / "save.lrs"
+    path.write_bytes(encode_compact({"meta": {}, "knowledge_base": [f"fatto {i}" for i in range(50)]}))
+    state = read_compact(path)
+    blob = state["knowledge_base"].raw_blob()
+    assert blob is not None
+
+    state["knowledge_base"].append("fatto 50")
+    assert state["knowledge_base"].raw_blob() is None  # Il blob non contiene più tutta la sezione
+    path.write_bytes(encode_compact(state))
+    reloaded = read_compact(path)
+    assert list(reloaded["knowledge_base"]) == [f"fatto {i}" for i in range(51)]
@@ -0,0 +1,61 @@
+# file: tests/test_save_writer.py
+import json
+import os
+
+import pytest
+
+from core import save_writer
+from core.save_writer import SaveWriter, atomic_write
+
+
+@pytest.fixture
+def writer():
+    writer = SaveWriter()
+    yield writer
+    writer.close()
+
+
+def test_atomic_write_failure_keeps_previous_file(tmp_path, monkeypatch):
+    path = tmp_path / "save.json"
+    atomic_write(path, b"vecchio")
+
+    def crash(fd):
+        raise OSError("disco pieno")
+
+    monkeypatch.setattr(save_writer.os, "fsync", crash)
+    with pytest.raises(OSError):
+        atomic_write(path, b"nuovo e troncat")
+    assert path.read_bytes() == b"vecchio"
+    assert os.listdir(tmp_path) == ["save.json"]  # Nessun file temporaneo rimasto
+
+
+def test_failed_snapshot_keeps_previous_save(tmp_path, writer):
+    path = tmp_path / "save.json"
+    writer.write_snapshot(path, {"turn": 1})
+    assert writer.flush(5)
+
+    def broken(state):
+        raise ValueError("stato non serializzabile")
+
+    writer.write_snapshot(path, {"turn": 2}, encoder=broken)
+    assert writer.flush(5)
+    assert json.loads(path.read_text(encoding="utf-8")) == {"turn": 1}
+
+
+def test_queued_snapshots_are_coalesced(tmp_path, writer):
+    path = tmp_path / "save.json"
+    for turn in range(50):
+        writer.write_snapshot(path, {"turn": turn})
+    assert writer.flush(5)
+    assert json.loads(path.read_text(encoding="utf-8")) == {"turn": 49}
+    assert sorted(os.listdir(tmp_path)) == ["save.json"]
+
+
+def test_snapshot_resets_journal_after_queued_lines(tmp_path, writer):
+    path, journal = tmp_path / "save.json", tmp_path / "save.json.journal"
+    writer.append_lines(journal, ["riga 1\n", "riga 2\n"])
+    writer.write_snapshot(path, {"turn": 3}, reset_journal=journal)
+    writer.append_lines(journal, ["riga 3\n"])
+    assert writer.flush(5)
+    assert journal.read_text(encoding="utf-8") == "riga 3\n"
+    assert json.loads(path.read_text(encoding="utf-8")) == {"turn": 3}
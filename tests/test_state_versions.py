@@ -0,0 +1,111 @@
+# file: tests/test_state_versions.py
+from pathlib import Path
+
+import pytest
+import yaml
+
+from core.memory_manager import MemoryManager
+from core.state_manager import STATE_SECTIONS, StateManager
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def world():
+    with open(ROOT / "worlds" / "school_life.yaml", "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+@pytest.fixture
+def state(tmp_path, world):
+    state = StateManager(str(tmp_path))
+    state.create_new_session(world)
+    return state
+
+
+def changed_sections(state, updates):
+    before = dict(zip(STATE_SECTIONS, state.versions(*STATE_SECTIONS)))
+    state.update_state(updates)
+    after = dict(zip(STATE_SECTIONS, state.versions(*STATE_SECTIONS)))
+    return {section for section in STATE_SECTIONS if after[section] != before[section]}
+
+
+def test_only_changed_sections_get_a_new_version(state):
+    game = state.current_state["game"]
+    companion = game["companion_name"]
+
+    assert changed_sections(state, {"location": "Biblioteca"}) == {"game", "turn"}
+    assert changed_sections(state, {"location": "Biblioteca"}) == {"turn"}  # Stesso valore
+    assert changed_sections(state, {"add_item": "Chiave"}) == {"inventory", "turn"}
+    assert changed_sections(state, {"add_item": "Chiave"}) == {"turn"}  # Già nell'inventario
+    assert changed_sections(state, {"flags": {"porta_aperta": True}}) == {"flags", "turn"}
+    assert changed_sections(state, {"flags": {"porta_aperta": True}}) == {"turn"}
+    assert changed_sections(state, {"affinity_change": {companion: 5}}) == {"affinity", "turn"}
+    assert changed_sections(state, {"affinity_change": {companion: 0}}) == {"turn"}
+
+
+def test_clamped_affinity_is_not_a_change(state):
+    companion = state.current_state["game"]["companion_name"]
+    state.update_state({"affinity_change": {companion: 500}})
+    assert state.current_state["game"]["affinity"][companion] == 100
+    assert changed_sections(state, {"affinity_change": {companion: 10}}) == {"turn"}
+
+
+def test_npc_outfit_change_touches_npc_states(state):
+    npc = next(name for name in state.current_state["game"]["npc_states"]
+               if name != state.current_state["game"]["companion_name"])
+    assert changed_sections(state, {"npc_updates": {npc: {"outfit": "Divisa"}}}) == {"npc_states", "turn"}
+    assert changed_sections(state, {"npc_updates": {npc: {"outfit": "Divisa"}}}) == {"turn"}
+
+
+def test_subscribe_filters_sections_and_reports_keys(state):
+    events, everything = [], []
+    unsubscribe = state.subscribe(events.append, ["game", "inventory"])
+    state.subscribe(everything.append)
+
+    state.update_state({"location": "Tetto", "gold": 7, "add_item": "Mappa"})
+    assert [(e.section, set(e.keys)) for e in events] == [("game", {"location", "gold"}), ("inventory", {"Mappa"})]
+    assert [e.section for e in everything] == ["game", "inventory", "turn"]
+    assert events[1].version == state.versions("inventory")[0]
+
+    unsubscribe()
+    state.update_state({"location": "Cortile"})
+    assert len(events) == 2 and len(everything) == 5
+
+
+def test_listener_errors_do_not_stop_the_update(state):
+    def broken(change):
+        raise ValueError("listener rotto")
+
+    seen = []
+    state.subscribe(broken)
+    state.subscribe(seen.append)
+    state.update_state({"location": "Palestra"})
+    assert state.current_state["game"]["location"] == "Palestra"
+    assert [e.section for e in seen] == ["game", "turn"]
+
+
+def test_versions_never_go_back_on_new_game_or_load(tmp_path, state, world):
+    state.update_state({"location": "Biblioteca"})
+    state.save_game("manual_save.json")
+    state.flush()
+    before = state.versions(*STATE_SECTIONS)
+
+    state.create_new_session(world)
+    after_new = state.versions(*STATE_SECTIONS)
+    assert all(new > old for new, old in zip(after_new, before))
+
+    assert state.load_game("manual_save.json")
+    after_load = state.versions(*STATE_SECTIONS)
+    assert all(new > old for new, old in zip(after_load, after_new))
+
+
+def test_memory_manager_touches_facts(state):
+    memory = MemoryManager(state, llm_client=None)
+    events = []
+    state.subscribe(events.append, ["facts"])
+
+    memory.add_fact("Luna ha perso la chiave della biblioteca")
+    memory.add_fact("Luna ha perso la chiave della biblioteca")  # Ripetuto: aggiorna solo i contatori
+    assert [e.keys for e in events] == [(0,), (0,)]
+    assert state.versions("facts")[0] == events[-1].version
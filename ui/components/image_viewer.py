@@ -1,8 +1,11 @@
 # file: ui/components/image_viewer.py
+from collections import OrderedDict
+from typing import Iterable, Optional, Set, Tuple
+
 from PySide6.QtWidgets import (QWidget, QLabel, QVBoxLayout, QGraphicsView,
                                QGraphicsScene, QDialog, QPushButton, QHBoxLayout)
-from PySide6.QtGui import QPixmap, QPainter
-from PySide6.QtCore import Qt, Signal
+from PySide6.QtGui import QPixmap, QPainter, QImage
+from PySide6.QtCore import Qt, Signal, QObject, QRunnable, QThreadPool, QSize
 
 
 class ZoomableGraphicsView(QGraphicsView):
@@ -35,8 +38,87 @@ class ImagePreviewDialog(QDialog):
         layout.addWidget(view)
 
 
+class _DecodeSignals(QObject):
+    # (path, dimensione richiesta, immagine intera, immagine scalata): consegnato in coda al thread della UI
+    decoded = Signal(str, QSize, QImage, QImage)
+
+
+class _DecodeTask(QRunnable):
+    """Decodifica del PNG (e scalatura per la label) fuori dal thread della UI: solo QImage, mai QPixmap."""
+
+    def __init__(self, signals: _DecodeSignals, path: str, size: QSize, full: Optional[QImage] = None):
+        super().__init__()
+        self.signals = signals
+        self.path = path
+        self.size = size
+        self.full = full  # Già in cache: basta riscalarla
+
+    def run(self):
+        full = self.full if self.full is not None else QImage(self.path)
+        scaled = QImage() if full.isNull() else full.scaled(self.size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.signals.decoded.emit(self.path, self.size, full, scaled)
+
+
+class ImageCache(QObject):
+    """
+    Immagini decodificate da un pool di worker, in una LRU limitata in byte
+    (immagine intera + versione scalata per la label).
+    loaded(path) viene emesso nel thread della UI quando un'immagine è pronta.
+    """
+
+    loaded = Signal(str)
+
+    def __init__(self, max_bytes: int = 192 * 1024 * 1024, workers: int = 2, parent=None):
+        super().__init__(parent)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[QImage, QImage, QSize]]" = OrderedDict()
+        self._bytes = 0
+        self._in_flight: Set[Tuple[str, int, int]] = set()
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(workers)
+        self._signals = _DecodeSignals(self)
+        self._signals.decoded.connect(self._on_decoded)
+
+    def get(self, path: str, size: QSize) -> Optional[Tuple[QImage, QImage]]:
+        """(intera, scalata) se in cache alla dimensione richiesta; segna l'immagine come usata di recente."""
+        entry = self._entries.get(path)
+        if entry is None or entry[2] != size:
+            return None
+        self._entries.move_to_end(path)
+        return entry[0], entry[1]
+
+    def request(self, path: str, size: QSize):
+        """Decodifica/scala in background, se non è già in cache o in corso."""
+        key = (path, size.width(), size.height())
+        if not path or key in self._in_flight or self.get(path, size) is not None:
+            return
+        self._in_flight.add(key)
+        cached = self._entries.get(path)
+        self._pool.start(_DecodeTask(self._signals, path, size, cached[0] if cached else None))
+
+    def _on_decoded(self, path: str, size: QSize, full: QImage, scaled: QImage):
+        self._in_flight.discard((path, size.width(), size.height()))
+        if full.isNull():
+            print(f"⚠️ [IMAGE] Decode failed: {path}")
+            return
+        self._drop(path)
+        self._entries[path] = (full, scaled, size)
+        self._bytes += full.sizeInBytes() + scaled.sizeInBytes()
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+        self.loaded.emit(path)
+
+    def _drop(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry:
+            self._bytes -= entry[0].sizeInBytes() + entry[1].sizeInBytes()
+
+
 class InteractiveImageViewer(QWidget):
-    """Widget principale per la UI."""
+    """
+    Widget principale per la UI. Le immagini vengono decodificate fuori dal thread
+    della UI (ImageCache): finché la nuova non è pronta resta visibile la precedente.
+    """
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -52,18 +134,38 @@ class InteractiveImageViewer(QWidget):
         self.image_lbl.mousePressEvent = self._on_click
 
         self.layout.addWidget(self.image_lbl)
-        self.current_pixmap = None
+        self.current_image: Optional[QImage] = None
+        self.current_path: Optional[str] = None
+
+        self.cache = ImageCache(parent=self)
+        self.cache.loaded.connect(self._on_loaded)
 
     def update_image(self, path):
         if not path: return
-        self.current_pixmap = QPixmap(path)
-        if not self.current_pixmap.isNull():
-            self.image_lbl.setPixmap(self.current_pixmap.scaled(
-                self.image_lbl.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation
-            ))
-            self.image_lbl.setText("")
+        self.current_path = path
+        if not self._show_cached(path):
+            self.cache.request(path, self.image_lbl.size())
+
+    def prefetch(self, paths: Iterable[str]):
+        """Decodifica in anticipo (es. immagine precedente e successiva della galleria)."""
+        for path in paths:
+            if path:
+                self.cache.request(path, self.image_lbl.size())
+
+    def _show_cached(self, path: str) -> bool:
+        cached = self.cache.get(path, self.image_lbl.size())
+        if cached is None:
+            return False
+        self.current_image = cached[0]
+        self.image_lbl.setPixmap(QPixmap.fromImage(cached[1]))
+        self.image_lbl.setText("")
+        return True
+
+    def _on_loaded(self, path: str):
+        if path == self.current_path:
+            self._show_cached(path)
 
     def _on_click(self, event):
-        if self.current_pixmap:
-            dlg = ImagePreviewDialog(self.current_pixmap, self)
+        if self.current_image is not None:
+            dlg = ImagePreviewDialog(QPixmap.fromImage(self.current_image), self)
             dlg.exec()
\ No newline at end of file
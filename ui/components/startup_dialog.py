@@ -135,7 +135,7 @@ class StartupDialog(QDialog):
 
     def _on_load_click(self):
         from PySide6.QtWidgets import QFileDialog
-        path, _ = QFileDialog.getOpenFileName(self, "Load Game", "storage/saves", "JSON (*.json)")
+        path, _ = QFileDialog.getOpenFileName(self, "Load Game", "storage/saves", "Saves (*.json *.lrs)")
         if path:
             self.mode = "load"
             self.save_path = path
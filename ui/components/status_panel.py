@@ -1,13 +1,37 @@
 # file: ui/components/status_panel.py
+import time
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+
 from PySide6.QtWidgets import QWidget, QGridLayout, QVBoxLayout, QLabel, QGroupBox, QListWidget, QTextBrowser, \
     QSizePolicy
 from PySide6.QtCore import Qt
 
+from core.metrics import StageMetrics
+
 
 class StatusPanel(QWidget):
+    """
+    Pannello di stato. update_status applica solo le differenze rispetto all'ultimo
+    render: testi cambiati, inserimenti/rimozioni nell'inventario, memoria solo
+    quando summary_log cresce. Niente restyle globale (vedi _set_style_property).
+    """
+
+    # Sezioni dello stato mostrate dal pannello (vedi StateManager.versions)
+    SECTIONS = ("game", "inventory", "affinity", "turn", "summaries")
+    EMPTY_INVENTORY = "Empty"
+
     def __init__(self, parent=None):
         super().__init__(parent)
 
+        # Ultimo render: testi delle etichette, inventario mostrato, versioni delle sezioni
+        self._texts: Dict[QWidget, str] = {}
+        self._inventory: List[str] = []
+        self._summary_count = -1
+        self._summary_last: Optional[str] = None
+        self._versions: Dict[str, int] = {}
+        self.metrics = StageMetrics.get_instance()
+
         # BLOCCO VERTICALE: Diciamo al layout "La mia altezza è fissa, non schiacciarmi"
         self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
 
@@ -29,7 +53,7 @@ class StatusPanel(QWidget):
         self.lbl_turn = QLabel("⏳ Turn: --")
 
         for lbl in [self.lbl_time, self.lbl_location, self.lbl_outfit, self.lbl_turn]:
-            lbl.setProperty("class", "StatusText")
+            self._set_style_property(lbl, "class", "StatusText")
             lbl.setWordWrap(True)
             info_layout.addWidget(lbl)
 
@@ -76,6 +100,7 @@ class StatusPanel(QWidget):
         inv_layout.setContentsMargins(5, 25, 5, 5)
 
         self.inv_list = QListWidget()
+        self.inv_list.addItem(self.EMPTY_INVENTORY)
 
         inv_layout.addWidget(self.inv_list)
         self.inv_group.setLayout(inv_layout)
@@ -85,34 +110,85 @@ class StatusPanel(QWidget):
         # 160 + 130 + spazi = circa 330/350
         self.setMinimumHeight(340)
 
-    def update_status(self, state: dict):
+    def update_status(self, state: dict, versions: Optional[Dict[str, int]] = None):
+        """
+        Aggiorna il pannello. Con versions ({sezione: versione}, vedi StateManager.versions)
+        le sezioni non cambiate dall'ultimo render vengono saltate senza nemmeno leggerle.
+        """
+        started = time.perf_counter()
         game = state.get("game", {})
         meta = state.get("meta", {})
 
-        self.lbl_time.setText(f"⌚ Time: {game.get('time_of_day', 'Morning')}")
-        self.lbl_location.setText(f"📍 {game.get('location', 'Unknown')}")
-        self.lbl_outfit.setText(f"👗 {game.get('current_outfit', '-')}")
-        self.lbl_turn.setText(f"⏳ Turn: {meta.get('turn_count', 0)}")
-
-        summaries = state.get("summary_log", [])
-        if summaries:
-            self.txt_memory.setText(summaries[-1])
-        else:
-            self.txt_memory.setText("No history yet.")
-
-        aff_text = ""
-        sorted_aff = sorted(game.get("affinity", {}).items())
-        for name, val in sorted_aff:
-            aff_text += f"❤️ {name}: {val}\n"
-        self.lbl_affinity.setText(aff_text.strip() if aff_text else "None")
-
-        self.inv_list.clear()
-        inventory = game.get("inventory", [])
-        if not inventory:
-            self.inv_list.addItem("Empty")
-        else:
-            for item in inventory:
-                self.inv_list.addItem(f"📦 {item}")
-
-        self.style().unpolish(self)
-        self.style().polish(self)
\ No newline at end of file
+        if self._changed(versions, "game"):
+            self._set_text(self.lbl_time, f"⌚ Time: {game.get('time_of_day', 'Morning')}")
+            self._set_text(self.lbl_location, f"📍 {game.get('location', 'Unknown')}")
+            self._set_text(self.lbl_outfit, f"👗 {game.get('current_outfit', '-')}")
+        if self._changed(versions, "turn"):
+            self._set_text(self.lbl_turn, f"⏳ Turn: {meta.get('turn_count', 0)}")
+
+        if self._changed(versions, "summaries"):
+            self._update_memory(state.get("summary_log", []))
+
+        if self._changed(versions, "affinity"):
+            aff_text = ""
+            sorted_aff = sorted(game.get("affinity", {}).items())
+            for name, val in sorted_aff:
+                aff_text += f"❤️ {name}: {val}\n"
+            self._set_text(self.lbl_affinity, aff_text.strip() if aff_text else "None")
+
+        if self._changed(versions, "inventory"):
+            self._update_inventory(game.get("inventory", []))
+
+        if versions is not None:
+            self._versions = dict(versions)
+        self.metrics.record("ui_status", time.perf_counter() - started)
+
+    def _changed(self, versions: Optional[Dict[str, int]], section: str) -> bool:
+        return versions is None or section not in versions or self._versions.get(section) != versions[section]
+
+    def _set_text(self, widget, text: str):
+        if self._texts.get(widget) != text:
+            self._texts[widget] = text
+            widget.setText(text)
+
+    def _update_memory(self, summaries: List[str]):
+        """Il riquadro mostra l'ultimo riassunto: si riscrive solo se summary_log è cambiato in coda."""
+        last = summaries[-1] if summaries else None
+        if len(summaries) == self._summary_count and last == self._summary_last:
+            return
+        self._summary_count = len(summaries)
+        self._summary_last = last
+        self.txt_memory.setText(last if last is not None else "No history yet.")
+
+    def _update_inventory(self, inventory: List[str]):
+        """Solo inserimenti e rimozioni rispetto agli oggetti già in lista (niente clear + rebuild)."""
+        if inventory == self._inventory:
+            return
+        was_empty = not self._inventory
+
+        self.inv_list.setUpdatesEnabled(False)
+        try:
+            if was_empty:
+                self.inv_list.takeItem(0)  # Segnaposto "Empty"
+            # Dal fondo: le modifiche non spostano gli indici dei blocchi ancora da applicare
+            opcodes = SequenceMatcher(None, self._inventory, inventory, autojunk=False).get_opcodes()
+            for tag, i1, i2, j1, j2 in reversed(opcodes):
+                if tag in ("replace", "delete"):
+                    for row in range(i2 - 1, i1 - 1, -1):
+                        self.inv_list.takeItem(row)
+                if tag in ("replace", "insert"):
+                    for offset, item in enumerate(inventory[j1:j2]):
+                        self.inv_list.insertItem(i1 + offset, f"📦 {item}")
+            if not inventory:
+                self.inv_list.addItem(self.EMPTY_INVENTORY)
+        finally:
+            self.inv_list.setUpdatesEnabled(True)
+        self._inventory = list(inventory)
+
+    def _set_style_property(self, widget: QWidget, name: str, value):
+        """Cambia una proprietà usata dal foglio di stile: il restyle avviene solo se il valore cambia davvero."""
+        if widget.property(name) == value:
+            return
+        widget.setProperty(name, value)
+        widget.style().unpolish(widget)
+        widget.style().polish(widget)
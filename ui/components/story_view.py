@@ -0,0 +1,188 @@
+# file: ui/components/story_view.py
+from typing import Dict, List
+
+from PySide6.QtWidgets import QListView, QAbstractItemView
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex, QTimer
+from PySide6.QtGui import QFont
+
+
+class StoryRecord:
+    """Un blocco del log: input del giocatore, narrazione di un turno o messaggio di sistema."""
+
+    __slots__ = ("kind", "text")
+
+    def __init__(self, text: str, kind: str = "text"):
+        self.kind = kind
+        self.text = text
+
+
+def records_from_history(history: List[Dict], companion_name: str) -> List[StoryRecord]:
+    """Ricostruisce il log dai messaggi della history salvata (stesso formato di MainWindow)."""
+    records = []
+    for msg in history:
+        if msg.get("role") == "user":
+            records.append(StoryRecord(f"> **YOU**: {msg.get('content', '')}", "player"))
+        else:
+            records.append(StoryRecord(f"**{companion_name.upper()}**: {msg.get('content', '')}", "narration"))
+    return records
+
+
+class StoryModel(QAbstractListModel):
+    """
+    Modello del log: gli ultimi `limit` record della sessione restano in una lista
+    Python (solo testo), ma la vista ne vede solo una finestra [start, fine). I record
+    più vecchi tornano nella finestra a pagine, quando si scorre fino in cima.
+    Oltre `limit` i record più vecchi vengono scartati: non si possono ricaricare,
+    perché la history salvata tiene solo gli ultimi messaggi (il resto è nei riassunti).
+    """
+
+    def __init__(self, parent=None, limit: int = 2000):
+        super().__init__(parent)
+        self._records: List[StoryRecord] = []
+        self._limit = limit
+        self._start = 0  # Primo record dentro la finestra
+        self._player_font = QFont()
+        self._player_font.setItalic(True)
+
+    @property
+    def start(self) -> int:
+        return self._start
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._records) - self._start
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self._records[self._start + index.row()]
+        if role == Qt.DisplayRole:
+            return record.text.strip()
+        if role == Qt.FontRole and record.kind == "player":
+            return self._player_font
+        return None
+
+    def append(self, record: StoryRecord):
+        row = self.rowCount()
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._records.append(record)
+        self.endInsertRows()
+        self._drop_oldest()
+
+    def extend_last(self, text: str):
+        """Testo in coda all'ultimo record (streaming): la vista va avvisata con notify_last."""
+        self._records[-1].text += text
+
+    def notify_last(self):
+        if self.rowCount():
+            index = self.index(self.rowCount() - 1, 0)
+            self.dataChanged.emit(index, index, [Qt.DisplayRole])
+
+    def trim_top(self, keep: int):
+        """Toglie dalla finestra (non dal log) i record più vecchi oltre `keep`."""
+        drop = self.rowCount() - keep
+        if drop > 0:
+            self.beginRemoveRows(QModelIndex(), 0, drop - 1)
+            self._start += drop
+            self.endRemoveRows()
+
+    def load_older(self, count: int) -> int:
+        """Riporta nella finestra fino a `count` record precedenti. Ritorna quanti."""
+        count = min(count, self._start)
+        if count:
+            self.beginInsertRows(QModelIndex(), 0, count - 1)
+            self._start -= count
+            self.endInsertRows()
+        return count
+
+    def _drop_oldest(self):
+        """Scarta i record oltre `limit` (e le righe della finestra che li mostravano)."""
+        excess = len(self._records) - self._limit
+        if excess <= 0:
+            return
+        visible = max(0, excess - self._start)
+        if visible:
+            self.beginRemoveRows(QModelIndex(), 0, visible - 1)
+        del self._records[:excess]
+        self._start = max(0, self._start - excess)
+        if visible:
+            self.endRemoveRows()
+
+    def reset(self, records: List[StoryRecord], window: int):
+        self.beginResetModel()
+        self._records = list(records[-self._limit:])
+        self._start = max(0, len(self._records) - window)
+        self.endResetModel()
+
+    def is_empty(self) -> bool:
+        return not self._records
+
+
+class StoryView(QListView):
+    """
+    Story Log virtualizzato: Qt impagina e disegna solo le righe visibili e la
+    finestra caricata è limitata a WINDOW record, quindi aggiungere testo costa
+    uguale al turno 10 e al turno 1000. In memoria restano al massimo LIMIT record
+    (circa mille turni): i più vecchi si perdono. Lo scroll automatico segue il fondo
+    solo se l'utente è già in fondo.
+    """
+
+    WINDOW = 200  # Record tenuti nella vista mentre si segue il fondo
+    PAGE = 50  # Record riportati nella finestra a ogni arrivo in cima
+    LIMIT = 2000  # Record tenuti in memoria (scorrendo in su non si va oltre)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.story = StoryModel(self, self.LIMIT)
+        self.setModel(self.story)
+        self.setWordWrap(True)
+        self.setUniformItemSizes(False)
+        self.setResizeMode(QListView.Adjust)  # Ricalcola l'a capo quando cambia la larghezza
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setSpacing(4)
+
+        self._follow = True  # Segue il fondo durante lo streaming
+        self._flush_pending = False
+        self.verticalScrollBar().valueChanged.connect(self._on_scroll)
+
+    def append_text(self, text: str, kind: str = "text"):
+        """Nuovo record in fondo al log."""
+        follow = self._at_bottom()
+        self.story.append(StoryRecord(text, kind))
+        if follow:
+            self.story.trim_top(self.WINDOW)
+            self.scrollToBottom()
+
+    def stream_text(self, text: str):
+        """Continua l'ultimo record (chunk in streaming); i chunk dello stesso giro di eventi diventano un solo aggiornamento."""
+        if self.story.is_empty():
+            self.append_text(text)
+            return
+        if not self._flush_pending:
+            self._follow = self._at_bottom()
+            self._flush_pending = True
+            QTimer.singleShot(0, self._flush)
+        self.story.extend_last(text)
+
+    def load_records(self, records: List[StoryRecord]):
+        """Sostituisce il log (es. partita caricata): in vista solo gli ultimi WINDOW record."""
+        self.story.reset(records, self.WINDOW)
+        self.scrollToBottom()
+
+    def _flush(self):
+        self._flush_pending = False
+        self.story.notify_last()
+        if self._follow:
+            self.scrollToBottom()
+
+    def _at_bottom(self) -> bool:
+        bar = self.verticalScrollBar()
+        return bar.value() >= bar.maximum() - 4
+
+    def _on_scroll(self, value: int):
+        if value != self.verticalScrollBar().minimum() or not self.story.start:
+            return
+        loaded = self.story.load_older(self.PAGE)
+        if loaded:
+            # Il record che era in cima resta in cima: niente salto della vista
+            self.scrollTo(self.story.index(loaded, 0), QAbstractItemView.PositionAtTop)
@@ -5,75 +5,78 @@ import platform
 import subprocess
 from typing import List
 from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-                               QTextEdit, QLineEdit, QPushButton, QLabel, QFrame,
+                               QLineEdit, QPushButton, QLabel, QFrame,
                                QCheckBox, QFileDialog)
-from PySide6.QtCore import Qt, QThread, Signal, Slot, QTimer
+from PySide6.QtCore import Qt, QObject, Signal, Slot, QTimer
 
 from core.engine import GameEngine
-from media.video_client import VideoClient
+from core.async_runtime import AsyncRuntime
 from ui.components.startup_dialog import StartupDialog
 from ui.components.image_viewer import InteractiveImageViewer
 from ui.components.status_panel import StatusPanel
+from ui.components.story_view import StoryView, records_from_history
 
 
-# --- WORKERS ---
+# --- BRIDGE ASYNCIO <-> QT ---
 
-class LLMWorker(QThread):
-    finished = Signal(dict)
+class EngineBridge(QObject):
+    """
+    Ponte tra AsyncRuntime e la UI: i task asyncio (turno, immagine, audio, video)
+    emettono questi Signal e Qt li consegna in coda al thread della finestra.
+    """
+    chunk = Signal(str)  # Narrazione in streaming
+    image_prompt = Signal(str, str)  # Prompt SD pronto prima della fine del turno
+    turn_finished = Signal(dict)
+    image_finished = Signal(str)
+    video_finished = Signal(str)
     error = Signal(str)
 
-    def __init__(self, engine, text, is_intro):
-        super().__init__()
-        self.engine, self.text, self.is_intro = engine, text, is_intro
+    def __init__(self, engine, runtime, parent=None):
+        super().__init__(parent)
+        self.engine, self.runtime = engine, runtime
 
-    def run(self):
-        try:
-            data = self.engine.process_turn_llm(self.text, self.is_intro)
-            self.finished.emit(data)
-        except Exception as e:
-            self.error.emit(str(e))
+    def run_turn(self, text, is_intro):
+        return self.runtime.submit(self._turn(text, is_intro))
 
+    def run_image(self, pos, neg):
+        return self.runtime.submit(self._image(pos, neg))
 
-class ImageWorker(QThread):
-    finished = Signal(str)
+    def run_audio(self, text):
+        return self.runtime.submit(self._audio(text))
 
-    def __init__(self, engine, visual_en, tags_en):
-        super().__init__()
-        self.engine, self.visual_en, self.tags_en = engine, visual_en, tags_en
+    def run_video(self, img_path, context):
+        return self.runtime.submit(self._video(img_path, context))
 
-    def run(self):
+    async def _turn(self, text, is_intro):
         try:
-            path = self.engine.process_image_generation(self.visual_en, self.tags_en)
-            self.finished.emit(path)
-        except:
-            self.finished.emit("")
-
+            data = await self.engine.process_turn(text, is_intro,
+                                                  on_chunk=self.chunk.emit,
+                                                  on_image_prompt=self.image_prompt.emit)
+            self.turn_finished.emit(data)
+        except Exception as e:
+            self.error.emit(str(e))
 
-class AudioWorker(QThread):
-    def __init__(self, engine, text):
-        super().__init__()
-        self.engine, self.text = engine, text
+    async def _image(self, pos, neg):
+        try:
+            path = await self.engine.process_image(pos, neg)
+        except Exception:
+            path = ""
+        self.image_finished.emit(path)
 
-    def run(self):
+    async def _audio(self, text):
         try:
-            self.engine.process_audio(self.text)
-        except:
+            await self.engine.process_audio_async(text)
+        except Exception:
             pass
 
-
-class VideoWorker(QThread):
-    finished = Signal(str)
-
-    def __init__(self, img_path, context):
-        super().__init__()
-        self.client = VideoClient()
-        self.img_path = img_path
-        self.context = context
-
-    def run(self):
-        # Il client ora restituisce il percorso del file .mp4
-        path = self.client.generate_video(self.img_path, self.context)
-        self.finished.emit(path)
+    async def _video(self, img_path, context):
+        try:
+            # Il client ora restituisce il percorso del file .mp4
+            path = await self.engine.process_video(img_path, context)
+        except Exception as e:
+            print(f"❌ Errore Video: {e}")
+            path = ""
+        self.video_finished.emit(path or "")
 
 
 # --- MAIN WINDOW ---
@@ -90,9 +93,19 @@ class MainWindow(QMainWindow):
             pass
 
         self.engine = GameEngine()
+        self.runtime = AsyncRuntime()
+        self.bridge = EngineBridge(self.engine, self.runtime, self)
+        self.bridge.chunk.connect(self._on_llm_chunk)
+        self.bridge.image_prompt.connect(self._on_image_prompt)
+        self.bridge.turn_finished.connect(self._on_llm_finished)
+        self.bridge.image_finished.connect(self._on_image_finished)
+        self.bridge.video_finished.connect(self._on_video_finished)
+        self.bridge.error.connect(lambda e: self.status_lbl.setText(f"Err: {e}"))
         self.image_history: List[str] = []
         self.image_index = -1
         self.last_narrative_context = ""
+        self._stream_open = False  # True se la narrazione del turno è già arrivata in streaming
+        self._image_pending = False  # True se il render SD del turno è già partito
 
         self._setup_ui()
         QTimer.singleShot(100, self._start_game_sequence)
@@ -104,7 +117,7 @@ class MainWindow(QMainWindow):
             if choice["mode"] == "load":
                 if self.engine.load_game(choice["path"]):
                     self._update_stats()
-                    self._append_story("\n--- SESSION LOADED ---\n")
+                    self._load_story()
                     self.status_lbl.setText("Game Loaded.")
             else:
                 self.engine.start_new_game(choice.get("world_id", "school_life"), choice.get("companion", "Luna"))
@@ -178,10 +191,9 @@ class MainWindow(QMainWindow):
         lbl_story.setStyleSheet("font-size: 16pt; font-weight: bold;")
         right_layout.addWidget(lbl_story)
 
-        self.story_edit = QTextEdit()
-        self.story_edit.setReadOnly(True)
-        self.story_edit.setObjectName("StoryArea")
-        right_layout.addWidget(self.story_edit, 1)
+        self.story_view = StoryView()
+        self.story_view.setObjectName("StoryArea")
+        right_layout.addWidget(self.story_view, 1)
 
         input_layout = QHBoxLayout()
         self.input_field = QLineEdit()
@@ -202,16 +214,30 @@ class MainWindow(QMainWindow):
 
     def _handle_player_input(self, text, is_intro=False):
         if not is_intro:
-            self._append_story(f"> **YOU**: {text}\n")
+            self._append_story(f"> **YOU**: {text}\n", kind="player")
             self.input_field.clear()
 
         self.input_field.setDisabled(True)
         self.status_lbl.setText("Thinking...")
+        self._stream_open = False
+        self._image_pending = False
 
-        self.llm_worker = LLMWorker(self.engine, text, is_intro)
-        self.llm_worker.finished.connect(self._on_llm_finished)
-        self.llm_worker.error.connect(lambda e: self.status_lbl.setText(f"Err: {e}"))
-        self.llm_worker.start()
+        self.bridge.run_turn(text, is_intro)
+
+    @Slot(str)
+    def _on_llm_chunk(self, chunk):
+        if not self._stream_open:
+            name = self.engine.state_manager.current_state["game"]["companion_name"]
+            self._append_story(f"\n**{name.upper()}**: ")
+            self._stream_open = True
+            self.status_lbl.setText("Narrating...")
+        self._append_story(chunk, stream=True)
+
+    @Slot(str, str)
+    def _on_image_prompt(self, pos, neg):
+        """Il JSON è arrivato: il render SD parte subito, in parallelo ad autosave/TTS/status."""
+        self._image_pending = True
+        self.bridge.run_image(pos, neg)
 
     @Slot(dict)
     def _on_llm_finished(self, data):
@@ -223,23 +249,25 @@ class MainWindow(QMainWindow):
             self.input_field.setDisabled(False)
             return
 
-        name = self.engine.state_manager.current_state["game"]["companion_name"]
-        self._append_story(f"\n**{name.upper()}**: {text}\n")
+        if self._stream_open:
+            # La narrazione è già a schermo: chiudiamo solo il paragrafo
+            self._append_story("\n", stream=True)
+        else:
+            name = self.engine.state_manager.current_state["game"]["companion_name"]
+            self._append_story(f"\n**{name.upper()}**: {text}\n")
         self._update_stats()
 
         self.input_field.setDisabled(False)
         self.input_field.setFocus()
-        self.status_lbl.setText("Generating Image...")
+        if self._image_pending:
+            self.status_lbl.setText("Generating Image...")
 
         if self.chk_voice.isChecked():
-            AudioWorker(self.engine, text).start()
-
-        self.img_worker = ImageWorker(self.engine, data.get("visual_en", ""), data.get("tags_en", []))
-        self.img_worker.finished.connect(self._on_image_finished)
-        self.img_worker.start()
+            self.bridge.run_audio(text)
 
     @Slot(str)
     def _on_image_finished(self, path):
+        self._image_pending = False
         if path:
             self._register_image(path)
             self.status_lbl.setText("Ready.")
@@ -254,9 +282,7 @@ class MainWindow(QMainWindow):
         self.status_lbl.setText("🎬 Rendering Video (Optimized 480x704)...")
         self.btn_animate.setDisabled(True)
 
-        self.vid_worker = VideoWorker(current_img, self.last_narrative_context)
-        self.vid_worker.finished.connect(self._on_video_finished)
-        self.vid_worker.start()
+        self.bridge.run_video(current_img, self.last_narrative_context)
 
     @Slot(str)
     def _on_video_finished(self, path):
@@ -293,6 +319,9 @@ class MainWindow(QMainWindow):
     def _update_nav_buttons(self):
         self.btn_prev.setEnabled(self.image_index > 0)
         self.btn_next.setEnabled(self.image_index < len(self.image_history) - 1)
+        # Precedente e successiva già decodificate: la navigazione ◀/▶ è immediata
+        neighbors = [self.image_index - 1, self.image_index + 1]
+        self.img_viewer.prefetch(self.image_history[i] for i in neighbors if 0 <= i < len(self.image_history))
 
     def _prev_image(self):
         if self.image_index > 0:
@@ -307,19 +336,38 @@ class MainWindow(QMainWindow):
             self._update_nav_buttons()
 
     def _update_stats(self):
-        self.status_panel.update_status(self.engine.state_manager.current_state)
+        state_manager = self.engine.state_manager
+        versions = dict(zip(StatusPanel.SECTIONS, state_manager.versions(*StatusPanel.SECTIONS)))
+        self.status_panel.update_status(state_manager.current_state, versions)
+
+    def _append_story(self, text, stream=False, kind="text"):
+        if stream:
+            # Continua il paragrafo corrente senza andare a capo (chunk in streaming)
+            self.story_view.stream_text(text)
+        else:
+            self.story_view.append_text(text, kind)
 
-    def _append_story(self, text):
-        self.story_edit.append(text)
-        sb = self.story_edit.verticalScrollBar()
-        sb.setValue(sb.maximum())
+    def _load_story(self):
+        """Log della partita caricata, ricostruito dalla history del save."""
+        state = self.engine.state_manager.current_state
+        name = state.get("game", {}).get("companion_name", "Narrator")
+        self.story_view.load_records(records_from_history(state.get("history", []), name))
+        self._append_story("\n--- SESSION LOADED ---\n")
 
     def _on_save(self):
-        if self.engine.state_manager.save_game("manual_save.json"):
+        if self.engine.state_manager.save_game(self.engine.state_manager.save_name("manual_save")):
             self.status_lbl.setText("Game Saved.")
 
     def _on_load(self):
-        path, _ = QFileDialog.getOpenFileName(self, "Load Game", "storage/saves", "JSON (*.json)")
+        path, _ = QFileDialog.getOpenFileName(self, "Load Game", "storage/saves", "Saves (*.json *.lrs)")
         if path and self.engine.load_game(path):
             self._update_stats()
-            self.status_lbl.setText("Game Loaded.")
\ No newline at end of file
+            self._load_story()
+            self.status_lbl.setText("Game Loaded.")
+
+    def closeEvent(self, event):
+        # Annulla i task in volo, ferma il loop asyncio e scrive i salvataggi in coda
+        self.runtime.shutdown()
+        self.engine.state_manager.flush(timeout=10)
+        self.engine.clients.shutdown()
+        super().closeEvent(event)